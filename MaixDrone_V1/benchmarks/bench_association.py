@@ -0,0 +1,54 @@
+# benchmarks/bench_association.py
+# So sánh ghép cặp Greedy vs Hungarian (tốc độ + độ chính xác) cho 1, 10, 50 người.
+# Chạy trên PC (chỉ cần NumPy): python benchmarks/bench_association.py
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from source.association import build_cost_matrix, box_centers, greedy_assign, hungarian_assign
+
+def make_scene(rng, n, width=640, height=480, noise=25.0):
+    """Sinh n track + n detection (detection = track dịch chuyển ngẫu nhiên, xáo trộn thứ tự)"""
+    w = rng.uniform(40, 90, n)
+    h = w * rng.uniform(1.8, 2.4, n)
+    x = rng.uniform(0, width - w)
+    y = rng.uniform(0, height - h)
+    tracks = np.stack([x, y, w, h], axis=1)
+    dets = tracks.copy()
+    dets[:, 0:2] += rng.normal(0, noise, (n, 2))
+    perm = rng.permutation(n)
+    return tracks, dets[perm], np.argsort(perm) # truth[i] = index detection của track i
+
+def bench(n, repeats, rng):
+    res = {}
+    for name in ("greedy", "hungarian"):
+        res[name] = {'ms': 0.0, 'correct': 0, 'total': 0}
+    for _ in range(repeats):
+        tracks, dets, truth = make_scene(rng, n)
+        for name in ("greedy", "hungarian"):
+            t0 = time.perf_counter()
+            cost, dist, gate = build_cost_matrix(box_centers(tracks), tracks, dets, w_iou=0.5)
+            if name == "greedy":
+                pairs = greedy_assign(dist, gate)
+            else:
+                pairs = hungarian_assign(cost, gate)
+            res[name]['ms'] += (time.perf_counter() - t0) * 1000.0
+            res[name]['correct'] += sum(1 for i, j in pairs if truth[i] == j)
+            res[name]['total'] += n
+    for name in res:
+        res[name]['ms'] /= repeats
+    return res
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'people':>6} | {'greedy ms':>9} {'acc':>6} | {'hungarian ms':>12} {'acc':>6}")
+    for n, repeats in ((1, 500), (10, 200), (50, 50)):
+        r = bench(n, repeats, rng)
+        g, hu = r['greedy'], r['hungarian']
+        print(f"{n:>6} | {g['ms']:>9.3f} {g['correct'] / g['total']:>6.1%} | "
+              f"{hu['ms']:>12.3f} {hu['correct'] / hu['total']:>6.1%}")
+
+if __name__ == "__main__":
+    main()
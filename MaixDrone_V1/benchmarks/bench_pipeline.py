@@ -0,0 +1,194 @@
+# benchmarks/bench_pipeline.py
+# Đo thời gian / thông lượng / cấp phát bộ nhớ của các hàm chạy mỗi frame, trên PC chỉ có CPU:
+#   ObjectTracker.update, PoseFilter.filter_kpts, PoseEstimator.update, HUD.draw_ai_result (ảnh giả)
+# Dữ liệu: luồng Pose giả lập (benchmarks/synthetic.py). Kết quả lưu JSON để so giữa các commit:
+#   python benchmarks/bench_pipeline.py --out before.json
+#   python benchmarks/bench_pipeline.py --out after.json --compare before.json
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+try:
+    import maix # noqa: F401
+except ImportError:
+    sys.path.insert(0, os.path.join(ROOT, "stubs")) # PC: module maix giả
+
+from maix import image
+from source.ai import PoseBatch
+from source.tracker import ObjectTracker
+from source.postprocess import PoseFilter
+from source.gesture import PoseEstimator
+from source.ui import HUD
+from synthetic import SyntheticScene
+
+FPS = 30.0 # Nhịp thời gian giả lập của luồng
+
+def make_batch(frame):
+    boxes, scores, kpts = frame
+    return PoseBatch(boxes.copy(), scores.copy(), kpts.copy(), np.ones(len(boxes), bool))
+
+# --- Các hàm được đo: setup(frames, tracked, width, height) -> run(i) xử lý frame i ---
+def setup_tracker(frames, tracked, width, height):
+    tracker = ObjectTracker()
+    clock = {'t': 0.0}
+    tracker.clock = lambda: clock['t']
+    batches = [make_batch(f) for f in frames] # Tạo trước, không tính vào thời gian đo
+    def run(i):
+        clock['t'] = i / FPS
+        tracker.update(batches[i])
+    return run
+
+def setup_filter(frames, tracked, width, height):
+    pose_filter = PoseFilter()
+    def run(i):
+        t = i / FPS
+        for obj in tracked[i]:
+            pose_filter.filter_kpts(obj['id'], t, obj['points'], bbox=obj['box'])
+    return run
+
+def setup_estimator(frames, tracked, width, height):
+    estimators = {}
+    def run(i):
+        for obj in tracked[i]:
+            est = estimators.get(obj['id'])
+            if est is None: est = estimators[obj['id']] = PoseEstimator()
+            est.update(obj['points'])
+    return run
+
+def setup_hud(frames, tracked, width, height):
+    hud = HUD(width, height)
+    hud.last_print_time = float("inf") # Tắt dòng in định kỳ
+    img = image.Image(width, height)
+    def run(i):
+        hud.draw_ai_result(img, tracked[i])
+    return run
+
+TARGETS = {
+    'tracker_update': setup_tracker,
+    'filter_kpts': setup_filter,
+    'estimator_update': setup_estimator,
+    'hud_draw': setup_hud,
+}
+
+def track_all(frames):
+    """Kết quả Tracker của từng frame (đầu vào cho filter/estimator/HUD)"""
+    run_tracker = ObjectTracker()
+    clock = {'t': 0.0}
+    run_tracker.clock = lambda: clock['t']
+    out = []
+    for i, f in enumerate(frames):
+        clock['t'] = i / FPS
+        out.append(run_tracker.update(make_batch(f)))
+    return out
+
+def measure(setup, frames, tracked, width, height, warmup):
+    n = len(frames)
+    # 1. Thời gian: trạng thái mới, bỏ qua warmup frame đầu (khởi tạo bộ lọc, cấp phát lần đầu)
+    run = setup(frames, tracked, width, height)
+    lat = np.zeros(n)
+    gc.collect()
+    for i in range(n):
+        t0 = time.perf_counter_ns()
+        run(i)
+        lat[i] = time.perf_counter_ns() - t0
+    lat = lat[warmup:] / 1000.0 # us
+
+    # 2. Bộ nhớ (tracemalloc làm chậm -> chạy lượt riêng): đỉnh cấp phát mỗi frame + phần giữ lại sau cả lượt
+    run = setup(frames, tracked, width, height)
+    for i in range(warmup): run(i)
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    peaks = []
+    for i in range(warmup, n):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        run(i)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    mean = float(lat.mean()) if len(lat) else 0.0
+    return {
+        'mean_us': round(mean, 2),
+        'p50_us': round(float(np.percentile(lat, 50)), 2),
+        'p95_us': round(float(np.percentile(lat, 95)), 2),
+        'p99_us': round(float(np.percentile(lat, 99)), 2),
+        'max_us': round(float(lat.max()), 2),
+        'fps': round(1e6 / mean, 1) if mean > 0 else None,
+        'alloc_peak_kb': round(float(np.mean(peaks)) / 1024, 2) if peaks else 0.0,
+        'retained_kb': round(retained / 1024, 2),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def compare(results, old_path):
+    with open(old_path) as f:
+        old = json.load(f)['results']
+    print(f"\nSo với {old_path} (mean_us, âm = nhanh hơn):")
+    for scenario, targets in results.items():
+        for name, r in targets.items():
+            prev = old.get(scenario, {}).get(name)
+            if not prev or not prev['mean_us']: continue
+            delta = (r['mean_us'] - prev['mean_us']) / prev['mean_us']
+            print(f"  {scenario:>12} {name:<17} {prev['mean_us']:>9.1f} -> {r['mean_us']:>9.1f} us ({delta:+.1%})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các hàm xử lý mỗi frame (CPU)")
+    parser.add_argument("--people", default="1,5,10", help="Danh sách số người, cách nhau dấu phẩy")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--motion", type=float, default=4.0, help="Tốc độ di chuyển (px/frame)")
+    parser.add_argument("--occlusion", type=float, default=0.1, help="Xác suất khớp bị che")
+    parser.add_argument("--noise", type=float, default=2.0, help="Nhiễu toạ độ (px)")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--targets", default=",".join(TARGETS), help="Các hàm cần đo")
+    parser.add_argument("--out", help="Lưu kết quả JSON")
+    parser.add_argument("--compare", help="File JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    targets = [t for t in args.targets.split(",") if t in TARGETS]
+    results = {}
+    print(f"{'people':>6} {'target':<17} {'mean us':>9} {'p95 us':>9} {'p99 us':>9} {'fps':>8} {'alloc KB':>9}")
+    for people in [int(p) for p in args.people.split(",")]:
+        scene = SyntheticScene(people, args.motion, args.occlusion, args.noise, args.width, args.height, args.seed)
+        frames = scene.frames(args.frames)
+        tracked = track_all(frames)
+        scenario = f"people_{people}"
+        results[scenario] = {}
+        for name in targets:
+            r = measure(TARGETS[name], frames, tracked, args.width, args.height, min(args.warmup, args.frames - 1))
+            results[scenario][name] = r
+            print(f"{people:>6} {name:<17} {r['mean_us']:>9.1f} {r['p95_us']:>9.1f} {r['p99_us']:>9.1f} "
+                  f"{r['fps'] or 0:>8.0f} {r['alloc_peak_kb']:>9.1f}")
+
+    if args.out:
+        meta = {
+            'commit': git_commit(), 'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'args': vars(args),
+        }
+        with open(args.out, "w") as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=1)
+        print(f"💾 Đã lưu {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
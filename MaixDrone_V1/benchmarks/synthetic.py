@@ -0,0 +1,77 @@
+# benchmarks/synthetic.py
+# Sinh luồng Pose COCO-17 giả lập (không cần Camera/NPU) cho các benchmark.
+# Tham số: số người, tốc độ di chuyển, tỷ lệ che khuất, nhiễu toạ độ.
+import numpy as np
+
+NUM_KPTS = 17
+
+# Dáng đứng chuẩn (toạ độ theo chiều cao người = 1, gốc = tâm hông), thứ tự COCO-17
+STAND = np.array([
+    (0.00, -0.88), (0.03, -0.91), (-0.03, -0.91), (0.07, -0.89), (-0.07, -0.89), # Mũi, Mắt, Tai
+    (0.13, -0.72), (-0.13, -0.72), (0.17, -0.48), (-0.17, -0.48),               # Vai, Khuỷu
+    (0.18, -0.26), (-0.18, -0.26), (0.09, 0.00), (-0.09, 0.00),                 # Cổ tay, Hông
+    (0.10, 0.27), (-0.10, 0.27), (0.10, 0.52), (-0.10, 0.52),                   # Gối, Cổ chân
+], dtype=np.float64)
+
+# Các dáng tay (ghi đè Khuỷu 7/8 + Cổ tay 9/10) -> kích hoạt bảng luật cử chỉ
+ARM_POSES = {
+    'down': None,
+    'both_up': {7: (0.20, -0.95), 8: (-0.20, -0.95), 9: (0.22, -1.18), 10: (-0.22, -1.18)},
+    'right_up': {8: (-0.20, -0.95), 10: (-0.22, -1.18)},
+    't_pose': {7: (0.40, -0.72), 8: (-0.40, -0.72), 9: (0.65, -0.72), 10: (-0.65, -0.72)},
+}
+
+class SyntheticScene:
+    """
+    N người đi lại trong khung hình (dội lại ở biên), thỉnh thoảng đổi dáng tay.
+    - motion: tốc độ trung bình (px/frame)
+    - occlusion: xác suất 1 khớp bị che (conf = 0) + 1/4 xác suất đó để cả người mất khỏi 1 frame
+    - noise: độ lệch chuẩn nhiễu toạ độ khớp (px)
+    """
+    def __init__(self, people=5, motion=4.0, occlusion=0.1, noise=2.0, width=640, height=480, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.width, self.height = width, height
+        self.occlusion = occlusion
+        self.noise = noise
+        rng = self.rng
+        self.height_px = rng.uniform(80, 300, people)             # Chiều cao người (xa/gần)
+        self.pos = np.stack([rng.uniform(50, width - 50, people),
+                             rng.uniform(self.height_px * 0.9, height - self.height_px * 0.55)], axis=1)
+        angle = rng.uniform(0, 2 * np.pi, people)
+        speed = rng.uniform(0.5, 1.5, people) * motion
+        self.vel = np.stack([np.cos(angle), np.sin(angle) * 0.3], axis=1) * speed[:, None]
+        self.arm = rng.choice(list(ARM_POSES), people)
+
+    def step(self):
+        """1 frame: (boxes (N, 4), scores (N,), kpts (N, 17, 3)) kiểu AIEngine.process_batch, thứ tự người bị xáo"""
+        rng = self.rng
+        self.pos += self.vel
+        # Dội lại khi chạm biên
+        for axis, lim in ((0, self.width), (1, self.height)):
+            out = (self.pos[:, axis] < 20) | (self.pos[:, axis] > lim - 20)
+            self.vel[out, axis] *= -1
+            self.pos[:, axis] = np.clip(self.pos[:, axis], 20, lim - 20)
+        change = rng.random(len(self.arm)) < 0.01
+        self.arm[change] = rng.choice(list(ARM_POSES), int(change.sum()))
+
+        n = len(self.pos)
+        kpts = np.zeros((n, NUM_KPTS, 3), dtype=np.float32)
+        for i in range(n):
+            shape = STAND.copy()
+            for j, xy in (ARM_POSES[self.arm[i]] or {}).items():
+                shape[j] = xy
+            kpts[i, :, :2] = self.pos[i] + shape * self.height_px[i] + rng.normal(0, self.noise, (NUM_KPTS, 2))
+            kpts[i, :, 2] = rng.uniform(0.6, 0.95, NUM_KPTS)
+        kpts[:, :, 2][rng.random((n, NUM_KPTS)) < self.occlusion] = 0.0
+
+        x0, y0 = kpts[:, :, 0].min(axis=1), kpts[:, :, 1].min(axis=1)
+        x1, y1 = kpts[:, :, 0].max(axis=1), kpts[:, :, 1].max(axis=1)
+        boxes = np.stack([x0 - 8, y0 - 8, x1 - x0 + 16, y1 - y0 + 16], axis=1).astype(np.float32)
+        scores = rng.uniform(0.5, 0.95, n).astype(np.float32)
+
+        keep = rng.random(n) >= self.occlusion / 4 # Cả người bị che trong frame này
+        order = rng.permutation(np.flatnonzero(keep))
+        return boxes[order], scores[order], kpts[order]
+
+    def frames(self, count):
+        return [self.step() for _ in range(count)]
@@ -4,6 +4,9 @@
 HOST = "0.0.0.0"
 PORT = 80
 TIMEOUT = 3.0
+STREAM_MAX_CLIENTS = 4     # Số người xem MJPEG cùng lúc (nén 1 lần, mỗi người 1 bộ đệm gửi riêng)
+MESSAGE_MAX_BUFFER = 512 * 1024 # Bộ đệm gửi tối đa của cổng tin nhắn 8888 (PC đọc chậm -> bỏ tin mới)
+MESSAGE_PROTOCOL = "binary"  # "binary" (frame có độ dài, JPEG nguyên bản) | "text" (dòng + base64, pc_serial_monitor cũ)
 
 # --- CẤU HÌNH WIFI (Sửa Wifi tại đây) ---
 WIFI_SSID = "HUTECH STAFF"
@@ -12,6 +15,9 @@ WIFI_PASS = "staff@@hutech"
 # --- CẤU HÌNH TINKERBOARD ---
 TINKER_IP = "10.60.4.175" # [SỬA LẠI] IP của Tinkerboard trong mạng Wifi Lab
 TINKER_PORT = 9999          # Port mà Tinkerboard đang lắng nghe
+TINKER_CONNECT_TIMEOUT = 3.0   # Kết nối (nền) quá thời gian này -> thử lại
+TINKER_RECONNECT_MIN = 1.0     # Backoff kết nối lại: 1s, 2s, 4s... tối đa TINKER_RECONNECT_MAX
+TINKER_RECONNECT_MAX = 30.0
 
 # --- CẤU HÌNH CAMERA (CHẾ ĐỘ HD) ---
 CAM_WIDTH = 320     # Chiều rộng (Width)
@@ -19,10 +25,48 @@ CAM_HEIGHT = 240    # Chiều cao (Height)
 JPEG_QUALITY = 25   
 FPS_LIMIT = 30      
 
+# --- CẤU HÌNH STREAM THÍCH ỨNG (ABR, mỗi người xem 1 bộ điều khiển) ---
+STREAM_ADAPTIVE = True          # False -> luôn dùng JPEG_QUALITY, ảnh gốc, mọi frame
+STREAM_TARGET_LATENCY = 0.3     # Độ trễ hàng chờ gửi mục tiêu (giây)
+JPEG_QUALITY_MIN = 10           # Mạng nghẽn: giảm quality tới đây trước...
+JPEG_QUALITY_MAX = 60           # Mạng tốt: tăng dần tới đây
+STREAM_SCALES = (1.0, 0.75, 0.5) # ...rồi thu nhỏ ảnh...
+STREAM_MAX_DECIMATE = 4         # ...rồi chỉ gửi 1 trên N frame
+STREAM_ABR_COOLDOWN = 5         # Số frame chờ giữa 2 lần điều chỉnh
+JPEG_CACHE_FRAMES = 2           # Số frame gần nhất giữ bản JPEG đã nén (Stream, Tin nhắn, Ghi clip dùng chung)
+EVIDENCE_JPEG_QUALITY = 80      # Quality ảnh bằng chứng gửi qua cổng tin nhắn
+
+# --- CẤU HÌNH GHI CLIP SỰ KIỆN (source/clip.py) ---
+CLIP_ENABLE = True
+CLIP_TRIGGERS = ("EMERGENCY_STOP", "URGENT_ATTENTION") # Mã cảnh báo (GESTURE_ALERTS) sẽ ghi clip
+CLIP_PRE_SECONDS = 3.0          # Giữ bao nhiêu giây trước sự kiện
+CLIP_POST_SECONDS = 2.0         # Ghi thêm bao nhiêu giây sau sự kiện
+CLIP_FPS = 10                   # Số frame/giây lưu vào bộ đệm vòng
+CLIP_BUFFER_BYTES = 4 * 1024 * 1024 # Giới hạn RAM của bộ đệm vòng (và của 1 clip)
+CLIP_JPEG_QUALITY = 25          # Chỉ dùng khi không có ai xem Stream (có thì lấy lại bản Stream đã nén)
+CLIP_OUTPUT = ("disk", "message") # "disk": ghi CLIP_DIR | "message": gửi qua cổng tin nhắn 8888 (binary)
+CLIP_DIR = "/root/clips"
+
 # --- CẤU HÌNH AI ---
 ENABLE_AI = True   
 MODEL_PATH = "/root/models/yolo11n_pose.mud"        # Hỗ trợ đuôi .mud (ưu tiên) hoặc .cvimodel
 
+# [ROI] Giai đoạn 2: cắt người nhỏ/xa từ ảnh gốc, chạy lại Model để lấy điểm xương chính xác hơn
+ROI_REFINE_ENABLE = False       # Mỗi vùng = thêm 1 lần chạy NPU
+ROI_MAX_HEIGHT = 100            # Chỉ làm với box cao < 100px (cùng ngưỡng "người xa" của PoseFilter)
+ROI_MAX_CROPS = 2               # Tối đa số vùng mỗi frame (người nhỏ nhất trước)
+ROI_TIME_BUDGET_MS = 40         # Hết ngân sách thời gian -> bỏ các vùng còn lại
+ROI_PAD = 0.25                  # Nới vùng cắt 25% quanh box
+ROI_MIN_IOU = 0.3               # Kết quả chạy lại phải trùng box gốc tối thiểu ngần này
+
+# [TILE] Chế độ độ phân giải cao: tăng CAM_WIDTH/CAM_HEIGHT (VD: 640x480) rồi bật TILE_ENABLE.
+# Ảnh được chia thành các ô đúng kích thước Model (không thu nhỏ -> không mất người ở xa)
+TILE_ENABLE = False
+TILE_OVERLAP = 0.2              # Chồng lấn giữa 2 ô (tỷ lệ cạnh ô), người đứng ở mép ô vẫn nằm trọn trong 1 ô
+TILES_PER_FRAME = 0             # Số ô chạy mỗi frame (0 = tất cả); nhỏ hơn -> xoay vòng qua các frame để giữ FPS
+TILE_GLOBAL = True              # Thêm 1 lượt toàn cảnh thu nhỏ mỗi vòng (bắt người ở gần, to hơn 1 ô)
+TILE_NMS_IOU = 0.5              # Ngưỡng IoU gộp trùng giữa các ô
+
 # Ngưỡng tin cậy cho Detect (thường Detect nhạy hơn nên để cao chút cho chắc)
 CONF_THRESHOLD = 0.20 # [UPDATE] Giảm sâu hơn để bắt vật thể xa/bị che khuất
 KEYPOINT_THRESHOLD = 0.0 # [RAW] Lấy tất cả điểm AI trả về (Trust AI)
@@ -31,3 +75,135 @@ KEYPOINT_THRESHOLD = 0.0 # [RAW] Lấy tất cả điểm AI trả về (Trust A
 POSE_CONF_THRESHOLD = 0.0       # [RAW] Không lọc điểm yếu
 STICKY_DEADZONE = 0.0           # [RAW] Tắt chống rung
 BBOX_TL_IGNORE_PX = 6           # [FILTER] Bỏ điểm quá gần góc trên-trái của bbox
+
+# --- CẤU HÌNH PIPELINE (main.py) ---
+PIPELINE_QUEUE_SIZE = 2         # Số frame tối đa chờ giữa 2 stage (đầy thì bỏ frame cũ nhất)
+PIPELINE_STATS_INTERVAL = 5.0   # Chu kỳ in thống kê thời gian từng stage (giây), 0 = tắt
+PROFILE_ENABLE = True           # Đo thời gian từng stage (histogram, < 1% CPU): GET /metrics + tóm tắt cùng thống kê Pipeline
+NPU_ASYNC = True                # Thread NPU riêng (submit/poll): CPU xử lý frame N trong lúc NPU chạy frame N+1
+NPU_MAX_PENDING = 1             # Số frame chờ NPU (ngoài frame đang chạy), đầy thì bỏ frame chờ cũ nhất
+NPU_MAX_WAITING = 4             # Số frame stage AI giữ lại để đúng thứ tự, vượt quá thì chờ NPU trả kết quả
+
+# --- GHI PHIÊN CHẠY (source/recording.py, chạy lại trên PC bằng replay.py) ---
+RECORD_ENABLE = False           # True -> ghi kết quả AI thô từng frame (~225 byte/người/frame, không ghi ảnh)
+RECORD_PATH = "/root/records/session.mdr" # Ghi nối đuôi (append-only)
+
+# --- RÀNG BUỘC GIẢI PHẪU (ANATOMY CONSTRAINTS) ---
+ANATOMY_ENABLE = True
+ANATOMY_REF_SCALE = 2.0     # Thước đo thân người ~ 2 lần khoảng cách 2 vai (5-6)
+ANATOMY_MIN_REF = 10        # Thước đo < 10px -> không đủ dữ liệu, bỏ qua
+# Thân/Chân (khớp con là Hông/Gối/Cổ chân): vai co lại khi người xoay nghiêng nhưng thân và chân thì không
+# -> thước đo = max(thước đo vai, ANATOMY_BOX_REF * cạnh lớn của box) (thân ~ 30% chiều cao người)
+ANATOMY_BODY_JOINTS = (11, 12, 13, 14, 15, 16)
+ANATOMY_BOX_REF = 0.3
+# (Khớp Cha, Khớp Con, Tỷ lệ tối đa so với thước đo). Xương quá dài -> kéo khớp con về phía khớp cha.
+# Khớp cha được sửa trước khớp con (Vai -> Khuỷu -> Cổ tay, Vai -> Hông -> Gối -> Cổ chân)
+ANATOMY_BONES = [
+    (5, 7, 1.2), (7, 9, 1.0),       # Tay Trái (Vai->Khuỷu, Khuỷu->Cổ tay)
+    (6, 8, 1.2), (8, 10, 1.0),      # Tay Phải
+    (5, 11, 1.5), (6, 12, 1.5),     # Thân (Vai->Hông)
+    (11, 13, 1.4), (13, 15, 1.4),   # Chân Trái (Hông->Gối, Gối->Cổ chân)
+    (12, 14, 1.4), (14, 16, 1.4),   # Chân Phải
+    (0, 1, 0.3), (0, 2, 0.3),       # Đầu (Mũi->Mắt)
+    (1, 3, 0.4), (2, 4, 0.4),       # Đầu (Mắt->Tai)
+]
+
+# --- CẤU HÌNH TRACKER (GHÉP CẶP ID) ---
+TRACKER_ASSOCIATION = "greedy"  # "greedy" (nhanh, cách cũ) | "hungarian" (tối ưu toàn cục, ít đổi ID khi 2 người đi qua nhau)
+TRACKER_W_DIST = 1.0            # Trọng số khoảng cách tâm (chuẩn hoá theo ngưỡng động)
+TRACKER_W_IOU = 0.0             # Trọng số (1 - IoU), chỉ dùng cho hungarian
+TRACKER_W_POSE = 0.0            # Trọng số độ khác dáng người (OKS), chỉ dùng cho hungarian
+
+# --- CẤU HÌNH KALMAN (MÔ HÌNH CHUYỂN ĐỘNG CỦA TRACKER) ---
+# Độ lệch chuẩn tính theo tỷ lệ chiều cao box (người xa -> nhiễu px nhỏ hơn)
+KALMAN_STD_POS = 1.0 / 20       # Nhiễu quá trình của vị trí/kích thước
+KALMAN_STD_VEL = 1.0 / 160      # Nhiễu quá trình của vận tốc (nhỏ -> chuyển động đầm hơn)
+KALMAN_STD_MEAS = 1.0 / 20      # Nhiễu đo của AI (lớn -> box mượt hơn nhưng trễ hơn)
+
+# --- CẤU HÌNH LẬP LỊCH AI (main.py + main_web.py) ---
+INFER_SCHEDULER = "adaptive"    # "adaptive" (theo chuyển động/độ tin cậy/ngân sách) | "fixed" (dùng SKIP_FRAMES)
+SKIP_FRAMES = 1                 # Chế độ INFER_SCHEDULER = "fixed": chạy AI 1 frame, bỏ N frame (Kalman dự đoán box/xương)
+SCHED_MIN_SKIP = 0              # Người di chuyển nhanh: chạy AI mọi frame
+SCHED_MAX_SKIP = 4              # Cảnh tĩnh: tối đa 4 frame dự đoán giữa 2 lần chạy AI
+SCHED_FAST_MOTION = 1.0         # Tốc độ (chiều cao người / giây) coi là "nhanh"
+SCHED_FAST_LIMB = 0.5           # Tốc độ cổ tay/khuỷu (chiều cao người / giây) coi là "nhanh" (vẫy tay ~2-3Hz vượt xa)
+SCHED_MIN_POSE_SCORE = 0.3      # Pose Score thấp hơn -> chạy AI ngay frame sau
+SCHED_TARGET_FPS = 30           # FPS hiển thị mong muốn
+SCHED_NPU_BUDGET = 0.6          # Thời gian AI tối đa = 60% thời gian mỗi frame (giới hạn tải NPU/CPU)
+
+# --- MOTION GATE: BỎ QUA NPU KHI CẢNH ĐỨNG YÊN (source/motion.py) ---
+MOTION_GATE_ENABLE = True
+MOTION_THUMB_SIZE = (64, 48)    # Ảnh xám thu nhỏ dùng để so sánh
+MOTION_BLOCKS = (8, 6)          # Lưới khối (ngang, dọc)
+MOTION_PIXEL_THRESHOLD = 12     # Độ lệch sáng trung bình của 1 khối (0-255) để coi là khối "động"
+MOTION_ON_RATIO = 0.03          # Tỷ lệ khối động >= ngưỡng này -> có chuyển động (chạy AI theo Scheduler)
+MOTION_OFF_RATIO = 0.01         # ...và phải < ngưỡng này liên tục MOTION_HOLD_FRAMES frame mới coi là đứng yên
+MOTION_HOLD_FRAMES = 15
+MOTION_MAX_IDLE = 2.0           # Đứng yên quá lâu (giây) -> vẫn chạy AI 1 lần để làm mới
+
+# --- CẤU HÌNH CỬ CHỈ (GESTURE) ---
+GESTURE_BUFFER_SIZE = 8         # Số frame bỏ phiếu (cử chỉ phải xuất hiện > 60% mới chốt)
+GESTURE_WAVE_LEN = 20           # Cửa sổ xét vẫy tay (frame). Chi phí mỗi frame không phụ thuộc độ dài cửa sổ
+
+# --- BẢNG LUẬT CỬ CHỈ (biên dịch 1 lần lúc khởi động thành bộ đánh giá vector hoá) ---
+GESTURE_MIN_CONF = 0.35         # Ngưỡng tin cậy mặc định của các khớp trong "joints"
+
+# Góc (độ, giá trị tuyệt đối). Vector: (i, j) = Khớp i -> Khớp j, hoặc "UP" / "SPINE" (Hông -> Vai) / "SPINE_DOWN"
+# Bộ 3 khớp (a, b, c): góc tại khớp giữa b. Chỉ những góc được luật đang bật dùng mới được tính.
+GESTURE_ANGLES = {
+    "spine":   ("UP", "SPINE"),         # Độ nghiêng cột sống so với phương thẳng đứng
+    "leg_l":   ("SPINE", (11, 13)),     # Cột sống vs Đùi trái: đứng ~180, ngồi ~90
+    "leg_r":   ("SPINE", (12, 14)),
+    "arm_l_A": ("SPINE_DOWN", (5, 7)),  # Góc A: Thân dưới vs Vai->Khuỷu
+    "arm_l_B": (5, 7, 9),               # Góc B: trong khuỷu tay
+    "arm_l_C": (11, 5, 9),              # Góc C: Hông-Vai-Cổ tay (giơ tay cao)
+    "arm_r_A": ("SPINE_DOWN", (6, 8)),
+    "arm_r_B": (6, 8, 10),
+    "arm_r_C": (12, 6, 10),
+}
+
+# Mỗi luật: group (trong 1 nhóm luật đứng trước thắng), name, điều kiện (tất cả phải đúng):
+#   joints: khớp cần conf > GESTURE_MIN_CONF | conf: {khớp: ngưỡng riêng}
+#   angles: {góc: (min, max)} khoảng mở, None = không giới hạn | any_angles: ít nhất 1 góc thoả
+#   above: [(khớp, mốc, k)] y[khớp] < y[mốc] - k * thân người (mốc = khớp hoặc "HEAD": Mũi / Trung điểm vai)
+#   near: [(i, j, k)] khoảng cách i-j < k * max(Vai-Vai, Vai-Hông) | waving: True = đang vẫy tay phải
+#   keep: luật ưu tiên tuyệt đối, khớp -> chỉ giữ các nhóm trong keep | enabled: False để tắt
+_BODY = (5, 6, 11, 12)
+GESTURE_RULES = [
+    # 1. Tư thế thân người
+    {"group": "body", "name": "Dung", "joints": _BODY, "angles": {"spine": (None, 30)},
+     "any_angles": {"leg_l": (150, None), "leg_r": (150, None)}},
+    {"group": "body", "name": "Ngoi", "joints": _BODY, "angles": {"spine": (None, 30)},
+     "any_angles": {"leg_l": (None, 120), "leg_r": (None, 120)}},
+    {"group": "body", "name": "Dung", "joints": _BODY, "angles": {"spine": (None, 30)}},
+    {"group": "body", "name": "Nghieng", "joints": _BODY, "angles": {"spine": (None, 70)}},
+    {"group": "body", "name": "Nam", "joints": _BODY},
+    # 2. Tay trái
+    {"group": "arm_l", "name": "Trai Cao Vuong", "joints": (5, 7, 9), "angles": {"arm_l_A": (140, 180), "arm_l_B": (75, 90)}},
+    {"group": "arm_l", "name": "Trai Vuong", "joints": (5, 7, 9), "angles": {"arm_l_A": (70, 100), "arm_l_B": (60, 100)}},
+    {"group": "arm_l", "name": "Trai Ngang", "joints": (5, 7, 9), "angles": {"arm_l_A": (70, 100), "arm_l_B": (140, 180)}},
+    {"group": "arm_l", "name": "Trai Cao", "joints": (5, 7, 9, 11), "angles": {"arm_l_C": (150, 180)}, "above": [(9, 5, 0.2)]},
+    # 3. Tay phải (Vẫy tay ghi đè tư thế tĩnh khi Cổ tay cao hơn Khuỷu tay)
+    {"group": "arm_r", "name": "Vay Tay Phai", "waving": True, "above": [(10, 8, 0.0)]},
+    {"group": "arm_r", "name": "Phai Cao Vuong", "joints": (6, 8, 10), "angles": {"arm_r_A": (140, 180), "arm_r_B": (75, 90)}},
+    {"group": "arm_r", "name": "Phai Vuong", "joints": (6, 8, 10), "angles": {"arm_r_A": (70, 100), "arm_r_B": (60, 100)}},
+    {"group": "arm_r", "name": "Phai Ngang", "joints": (6, 8, 10), "angles": {"arm_r_A": (70, 100), "arm_r_B": (140, 180)}},
+    {"group": "arm_r", "name": "Phai Cao", "joints": (6, 8, 10, 12), "angles": {"arm_r_C": (150, 180)}, "above": [(10, 6, 0.2)]},
+    # 4. Chéo tay trên đầu (Emergency Stop): 2 cổ tay cao hơn đầu và gần nhau
+    {"group": "cross", "name": "Cheo Tay Tren Dau", "joints": (5, 6), "conf": {9: 0.4, 10: 0.4},
+     "above": [(9, "HEAD", 0.0), (10, "HEAD", 0.0)], "near": [(9, 10, 0.8)], "keep": ("body",)},
+]
+
+# Ghép cử chỉ: đủ các thành phần -> thay bằng 1 tên
+GESTURE_COMBOS = [
+    {"name": "Hai Tay Ngang", "all": ("Trai Ngang", "Phai Ngang")},
+    {"name": "Tay Chu V", "all": ("Trai Cao", "Phai Cao")},
+]
+
+# Cử chỉ -> Thông báo (HUD, TinkerClient, MessageServer). Nhiều cảnh báo -> priority cao nhất thắng
+GESTURE_ALERTS = [
+    {"gesture": "Cheo Tay Tren Dau", "code": "EMERGENCY_STOP", "text": "EMERGENCY STOP", "priority": 4},
+    {"gesture": "Vay Tay Phai", "code": "URGENT_ATTENTION", "text": "URGENT ATTENTION", "priority": 3},
+    {"gesture": "Trai Cao", "code": "SHORTAGE_OF_MATERIAL", "text": "SHORTAGE OF MATERIAL", "priority": 2},
+    {"gesture": "Phai Cao", "code": "TECHNICAL_ISSUE", "text": "TECHNICAL OR QUALITY ISSUE", "priority": 1},
+]
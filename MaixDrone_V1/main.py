@@ -4,14 +4,24 @@ import gc
 import os       # [NEW] Để chạy lệnh hệ thống (Wifi)
 import sys      # [NEW] Để đọc dữ liệu từ Serial (stdin)
 import select   # [NEW] Để kiểm tra dữ liệu không chặn (Non-blocking)
+from collections import deque
 import config
 from maix import display, image # [UPDATE] Import thêm image để load font
 from source.camera import CameraManager
 from source.ai import AIEngine
 from source.stream import StreamServer, MessageServer # [UPDATE] Import thêm MessageServer
+from source.posestream import PoseStream # [NEW] Luồng chỉ có dữ liệu Pose (nhị phân / JSON)
+from source.jpegcache import JpegCache # [NEW] Nén JPEG 1 lần / biến thể, dùng chung cho mọi đầu ra
+from source.clip import ClipRecorder # [NEW] Ghi clip trước/sau cảnh báo
+from source.recording import DetectionRecorder # [NEW] Ghi kết quả AI để replay.py chạy lại trên PC
 from source.ui import HUD
 from source.tracker import ObjectTracker
 from source.tinker_client import TinkerClient # [NEW] Import Client gửi tin
+from source.pipeline import Pipeline # [NEW] Chạy các stage song song
+from source.scheduler import InferenceScheduler # [NEW] Lập lịch chạy AI thích ứng
+from source.motion import MotionGate # [NEW] Bỏ qua NPU khi cảnh đứng yên
+from source.npu import AsyncInference # [NEW] Chạy NPU bất đồng bộ (submit / poll theo frame id)
+from source.profiler import PROFILER # [NEW] Đo thời gian từng stage + /metrics
 
 def connect_wifi_linux(ssid, password):
     """Hàm tự động kết nối Wifi cho Linux nhúng (MaixCam)"""
@@ -41,7 +51,8 @@ def connect_wifi_linux(ssid, password):
 
 def main():
     print("--- 🚁 MAIX DRONE V12: NETWORK MODE (LCD + SOCKET) ---")
-    print("⚡ MODE: REAL-TIME FULL PROCESSING (EVERY FRAME)")
+    print("⚡ MODE: PIPELINED (CAPTURE | AI | TRACK | OUTPUT)")
+    print(f"⚡ AI Scheduler: {config.INFER_SCHEDULER} (Kalman dự đoán các frame không chạy AI)")
     
     # [AUTO WIFI] Tự động kết nối mạng Lab khi chạy chương trình
     connect_wifi_linux(config.WIFI_SSID, config.WIFI_PASS)
@@ -63,85 +74,228 @@ def main():
     ai_engine = AIEngine(config.MODEL_PATH, config.CONF_THRESHOLD)
     hud = HUD(config.CAM_WIDTH, config.CAM_HEIGHT)
     tracker = ObjectTracker()
+    motion_gate = MotionGate() if getattr(config, "MOTION_GATE_ENABLE", True) else None
+    scheduler = InferenceScheduler(gate=motion_gate) # [NEW] Lập lịch chạy AI thích ứng (+ Motion Gate)
+    jpeg_cache = JpegCache()
+    clip_recorder = ClipRecorder(msg_server)
+    recorder = DetectionRecorder() if getattr(config, "RECORD_ENABLE", False) else None
     
     cam_mgr.start()
     streamer.start() # [UPDATE] Bắt đầu lắng nghe kết nối Web
+    pose_stream = PoseStream(streamer) # [NEW] /pose, /pose.json trên cùng cổng Web
     msg_server.start() # [NEW] Bắt đầu lắng nghe máy tính
+    tinker_client.connect() # [NEW] Kết nối Tinkerboard chạy nền (tự thử lại khi mất kết nối)
     
-    # [TEST PERFORMANCE] Chuyển sang chế độ xử lý toàn vẹn (Full AI)
-    # SKIP_FRAMES = 0 nghĩa là không bỏ frame nào, chạy AI liên tục
-    SKIP_FRAMES = 0
-    
+    # [ASYNC NPU] Thread NPU riêng: CPU map toạ độ / track / vẽ / stream frame N trong lúc NPU chạy frame N+1.
+    # Job nào cũng phải nhận đúng kết quả của ảnh của nó -> Model tạo với dual_buff=False
+    use_async = getattr(config, "NPU_ASYNC", True)
     if config.ENABLE_AI:
-        if not ai_engine.load():
+        if not ai_engine.load(dual_buff=not use_async):
             config.ENABLE_AI = False
 
-    frame_cnt = 0
-    t_last = time.time()
-    fps_show = 0
-    last_sent_msg = None # [NEW] Lưu tin nhắn cuối cùng đã gửi
-    
-    while True:
+    npu = None
+    if config.ENABLE_AI and use_async:
+        npu = AsyncInference(ai_engine, getattr(config, "NPU_MAX_PENDING", 1))
+        npu.start()
+    waiting = deque() # Packet chờ kết quả NPU (theo thứ tự frame)
+
+    # [PIPELINE] Chia vòng lặp thành 4 stage chạy song song (mỗi stage 1 thread):
+    # Capture -> Inference (NPU) -> Tracking/Gesture -> Output (HUD, Stream, Tin nhắn, LCD)
+    # Các stage nối bằng hàng đợi giới hạn (bỏ frame cũ nhất) -> Wifi chậm hay nén JPEG lâu
+    # không còn làm NPU phải chờ, FPS tiệm cận stage chậm nhất thay vì tổng các stage.
+    state = {
+        'frame_id': 0,
+        't_last': time.time(),
+        'fps_show': 0,
+        'last_sent_msg': None, # [NEW] Lưu tin nhắn cuối cùng đã gửi
+        'out_cnt': 0,
+    }
+
+    def stage_capture():
+        t0 = time.perf_counter()
         img = cam_mgr.get_frame()
-        if img is None:
-            time.sleep(0.001)
-            continue
-        
+        if img is None: return None
+        PROFILER.lap("capture", t0)
+        state['frame_id'] += 1
+        return {'id': state['frame_id'], 't': time.time(), 'img': img, 'ai_results': [], 'results': []}
+
+    def record(packet):
+        # [RECORD] Ghi kết quả AI thô theo đúng thứ tự frame (trước Tracker)
+        if not recorder or not config.ENABLE_AI: return
+        if packet.get('predicted'):
+            recorder.record_predict(packet['t'], packet['id'], packet.get('static', False))
+        else:
+            recorder.record(packet['t'], packet['id'], packet['ai_results'], packet.get('transform'))
+
+    def finish_inference(packet, batch, infer_ms, transform):
+        packet['ai_results'] = batch
+        packet['transform'] = transform
+        scheduler.report_inference(infer_ms)
+        # [CACHE] Transform chỉ tạo lại khi đổi độ phân giải -> chia sẻ cho Tracker
+        if transform is not None and transform is not tracker.transform:
+            tracker.set_transform(transform)
+
+    def stage_inference(packet):
+        # [SCHEDULER] Quyết định chạy NPU hay để Tracker dự đoán (theo chuyển động, độ tin cậy, ngân sách)
+        if config.ENABLE_AI and not scheduler.should_infer(tracker, packet['img']):
+            packet['predicted'] = True
+            packet['static'] = scheduler.static # [MOTION GATE] Cảnh đứng yên -> giữ nguyên kết quả cũ
+        elif config.ENABLE_AI:
+            if npu is not None:
+                packet['job'] = npu.submit(packet['id'], packet['img']) # [ASYNC] Không chờ NPU
+            else:
+                t0 = time.time()
+                _, batch = ai_engine.process_batch(packet['img'])
+                finish_inference(packet, batch, (time.time() - t0) * 1000.0, ai_engine.transform)
+        if npu is None:
+            record(packet)
+            return packet
+
+        # [ASYNC] Giữ thứ tự frame: frame dự đoán không được vượt frame đang chờ NPU
+        waiting.append(packet)
+        if len(waiting) > getattr(config, "NPU_MAX_WAITING", 4) and 'job' in waiting[0]:
+            waiting[0]['job'].result(timeout=1.0) # Quá nhiều frame chờ -> đợi frame cũ nhất
+        npu.poll() # Lấy các job đã xong khỏi hàng của NPU (thứ tự frame do `waiting` giữ)
+        ready = []
+        while waiting:
+            job = waiting[0].get('job')
+            if job is not None and not job.done(): break
+            packet = waiting.popleft()
+            if job is not None:
+                del packet['job']
+                batch = job.result() # Map toạ độ ở đây, trong lúc NPU chạy frame sau
+                if batch is None:
+                    packet['predicted'] = True # NPU không kịp, frame bị bỏ -> Tracker dự đoán
+                else:
+                    finish_inference(packet, batch, job.infer_ms, job.transform)
+            record(packet)
+            ready.append(packet)
+        return ready or None
+
+    def stage_tracking(packet):
+        t0 = time.perf_counter()
+        if config.ENABLE_AI:
+            if packet.get('static'):
+                packet['results'] = tracker.get_display_objects() # [MOTION GATE] Không ai di chuyển
+            elif packet.get('predicted'):
+                packet['results'] = tracker.predict() # [KALMAN] Ngoại suy box + xương
+            else:
+                packet['results'] = tracker.update(packet['ai_results'])
+            PROFILER.lap("track", t0) # Gồm cả filter + gesture (đo riêng trong Tracker)
+        # [META] Phát dữ liệu Pose mỗi frame (không phụ thuộc tốc độ nén/gửi video)
+        pose_stream.publish(packet['results'], packet['t'])
+        return packet
+
+    def stage_output(packet):
+        img = packet['img']
+        current_results = packet['results']
+
         t_now = time.time()
-        dt = t_now - t_last
+        dt = t_now - state['t_last']
         if dt > 0:
-            fps_show = (fps_show * 0.9) + ((1.0/dt) * 0.1)
-        t_last = t_now
+            state['fps_show'] = (state['fps_show'] * 0.9) + ((1.0/dt) * 0.1)
+        state['t_last'] = t_now
 
         if config.ENABLE_AI:
-            # [FULL PROCESSING] Chạy AI trên mọi khung hình
-            # Loại bỏ hoàn toàn logic dự đoán (Hybrid) để đảm bảo dữ liệu thực tế nhất
-            _, ai_results = ai_engine.process(img)
-            current_results = tracker.update(ai_results)
-            
             # [NEW] Gửi dữ liệu Pose sang Tinkerboard
             tinker_client.send_pose(current_results)
 
-        hud.draw_fps(img, fps_show)
+        t0 = time.perf_counter()
+        hud.draw_fps(img, state['fps_show'])
         if config.ENABLE_AI:
             hud.draw_ai_result(img, current_results)
+        PROFILER.lap("hud", t0)
 
         # [UPDATE] Xử lý Web Stream (Non-blocking)
-        streamer.check_new_client()      # Kiểm tra xem có ai vào Web không
-        streamer.send_frame(img, config.JPEG_QUALITY) # Gửi ảnh (nếu có người xem)
+        # Kết nối mới / gửi dở do thread mạng (NetCore) xử lý, ở đây chỉ nén + đẩy vào hàng đợi
+        # [CACHE] Mọi đầu ra lấy JPEG qua cùng 1 EncodedFrame (nén lazy, không trùng)
+        frame = jpeg_cache.frame(packet['id'], img)
+        streamer.send_frame(img, config.JPEG_QUALITY, frame) # Gửi ảnh (nếu có người xem)
+        # [CLIP] Giữ vài giây gần nhất (dùng lại JPEG vừa nén cho Stream), ghi đĩa/gửi ở thread nền
+        clip_recorder.push(packet['t'], frame, current_results)
 
         # [NEW] Xử lý gửi tin nhắn qua mạng
-        msg_server.check_client() # Chấp nhận kết nối từ PC
         # Kiểm tra nếu HUD có thông báo mới thì gửi đi
-        if hud.last_action_msg != last_sent_msg:
-            msg_server.send(hud.last_action_msg)
+        if hud.last_action_msg != state['last_sent_msg']:
+            msg_server.send(hud.last_action_msg, hud.last_action_id)
             
             # [CAPTURE] Nếu là cảnh báo thật (không phải None), chụp và gửi ảnh ngay
             if hud.last_action_msg is not None:
-                msg_server.send_image(img)
-                
-            last_sent_msg = hud.last_action_msg
-
-        # [NEW] Xử lý Lệnh từ Serial (PC gửi xuống)
-        # Kiểm tra xem có dữ liệu ở cổng stdin không (timeout=0 để không chặn)
-        if select.select([sys.stdin], [], [], 0)[0]:
-            cmd = sys.stdin.readline().strip()
-            if cmd:
-                print(f"💻 PC Command: {cmd}") # Phản hồi lại để PC biết đã nhận
+                msg_server.send_image(img, hud.last_action_id, frame)
+                clip_recorder.trigger(hud.last_action_code, hud.last_action_id, packet['t'])
                 
-                # Xử lý lệnh
-                if cmd == 'q':
-                    print("🛑 Received Quit Command.")
-                    break
-                elif cmd == 'd': # Debug toggle
-                    config.ENABLE_AI = not config.ENABLE_AI
-                    print(f"🔧 AI Enabled: {config.ENABLE_AI}")
+            state['last_sent_msg'] = hud.last_action_msg
 
         # [MAIXVISION] Hiển thị trực tiếp
+        t0 = time.perf_counter()
         disp.show(img) # [FIX] Dùng đối tượng disp để hiển thị
+        PROFILER.lap("display", t0)
+        PROFILER.add("e2e", (time.time() - packet['t']) * 1000.0) # Từ lúc chụp đến lúc lên màn hình
         
-        frame_cnt += 1
-        if frame_cnt % 30 == 0: gc.collect()
+        state['out_cnt'] += 1
+        if state['out_cnt'] % 30 == 0: gc.collect()
+        return None
+
+    pipeline = Pipeline(config.PIPELINE_QUEUE_SIZE)
+    pipeline.add_source("capture", stage_capture)
+    pipeline.add_stage("infer", stage_inference)
+    # [ASYNC] Frame có kết quả AI không bao giờ bị bỏ trước Tracker (1 lần trả về nhiều frame có thể vượt
+    # PIPELINE_QUEUE_SIZE); Tracker không kịp thì chỉ bỏ frame dự đoán, hoặc stage AI chờ
+    pipeline.add_stage("track", stage_tracking, keep=lambda p: config.ENABLE_AI and not p.get('predicted'))
+    pipeline.add_stage("output", stage_output)
+    pipeline.start()
+
+    # [PROFILE] Histogram từng stage + số liệu đọc lúc xuất (không tốn gì mỗi frame) -> GET /metrics
+    for stage in pipeline.stages:
+        if stage.in_q is None: continue
+        PROFILER.add_gauge("maixdrone_queue_depth", stage.in_q.__len__, {'queue': stage.name})
+        PROFILER.add_gauge("maixdrone_dropped_frames_total", lambda q=stage.in_q: q.dropped, {'where': stage.name}, "counter")
+    if npu:
+        PROFILER.add_gauge("maixdrone_queue_depth", npu.pending, {'queue': "npu"})
+        PROFILER.add_gauge("maixdrone_dropped_frames_total", lambda: npu.dropped, {'where': "npu"}, "counter")
+    PROFILER.add_gauge("maixdrone_queue_depth", waiting.__len__, {'queue': "npu_order"})
+    PROFILER.add_gauge("maixdrone_stream_dropped_frames", lambda: sum(c.dropped for c in streamer.clients)) # Người xem hiện tại
+    PROFILER.add_gauge("maixdrone_stream_backlog_bytes", lambda: sum(c.backlog() for c in streamer.clients))
+    PROFILER.add_gauge("maixdrone_fps", lambda: state['fps_show'])
+    PROFILER.add_gauge("maixdrone_infer_ratio", scheduler.infer_ratio)
+    PROFILER.start(streamer)
+
+    t_stats = time.time()
+    try:
+        while True:
+            # [NEW] Xử lý Lệnh từ Serial (PC gửi xuống)
+            # Thread chính chỉ còn đọc lệnh, các stage xử lý ảnh chạy ở thread riêng
+            if select.select([sys.stdin], [], [], 0.1)[0]:
+                cmd = sys.stdin.readline().strip()
+                if cmd:
+                    print(f"💻 PC Command: {cmd}") # Phản hồi lại để PC biết đã nhận
+                    
+                    # Xử lý lệnh
+                    if cmd == 'q':
+                        print("🛑 Received Quit Command.")
+                        break
+                    elif cmd == 'd': # Debug toggle
+                        config.ENABLE_AI = not config.ENABLE_AI
+                        scheduler.force()
+                        print(f"🔧 AI Enabled: {config.ENABLE_AI}")
+
+            if config.PIPELINE_STATS_INTERVAL > 0 and time.time() - t_stats > config.PIPELINE_STATS_INTERVAL:
+                pipeline.print_stats()
+                print(f"🧠 AI: {scheduler.infer_ratio():.0%} frame | skip hiện tại: {scheduler.current_skip} | {scheduler.infer_ms:.0f}ms/lần"
+                      f" | cảnh tĩnh: {scheduler.static_ratio():.0%} frame")
+                if ai_engine.roi_enable:
+                    print(f"🔍 ROI: {ai_engine.roi_crops} vùng chạy lại | {ai_engine.roi_refined} người được cập nhật điểm")
+                if npu:
+                    print(f"⚡ NPU: {npu.submitted} frame gửi | {npu.dropped} frame bỏ (NPU không kịp) | {npu.pending()} đang chờ")
+                print(f"🖼️ JPEG: {jpeg_cache.encodes} lần nén | {jpeg_cache.hits} lần dùng lại")
+                PROFILER.print_summary()
+                t_stats = time.time()
+    finally:
+        pipeline.stop()
+        if npu: npu.stop()
+        PROFILER.stop()
+        clip_recorder.close()
+        if recorder: recorder.close()
 
 if __name__ == "__main__":
     try: main()
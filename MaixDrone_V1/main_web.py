@@ -7,6 +7,8 @@ from source.stream import StreamServer
 from source.ai import AIEngine
 from source.ui import HUD
 from source.tracker import ObjectTracker
+from source.scheduler import InferenceScheduler
+from source.motion import MotionGate
 
 def main():
     print("--- 🚁 MAIX DRONE V12: WEB STREAMING MODE ---")
@@ -20,7 +22,8 @@ def main():
     cam_mgr.start()
     streamer.start()
     
-    SKIP_FRAMES = 3
+    motion_gate = MotionGate() if getattr(config, "MOTION_GATE_ENABLE", True) else None
+    scheduler = InferenceScheduler(gate=motion_gate) # [NEW] Lập lịch chạy AI thích ứng (dùng chung với main.py)
     
     if config.ENABLE_AI:
         if not ai_engine.load():
@@ -30,6 +33,7 @@ def main():
         if streamer.wait_for_client():
             frame_cnt = 0
             current_results = []
+            scheduler.force() # Client mới -> chạy AI ngay frame đầu
             t_last = time.time()
             fps_show = 0
             
@@ -46,9 +50,15 @@ def main():
                 t_last = t_now
 
                 if config.ENABLE_AI:
-                    if frame_cnt % (SKIP_FRAMES + 1) == 0:
-                        _, ai_results = ai_engine.process(img)
+                    if scheduler.should_infer(tracker, img):
+                        t0 = time.time()
+                        _, ai_results = ai_engine.process_batch(img)
+                        if ai_engine.transform is not tracker.transform:
+                            tracker.set_transform(ai_engine.transform)
                         current_results = tracker.update(ai_results)
+                        scheduler.report_inference((time.time() - t0) * 1000.0)
+                    elif scheduler.static:
+                        current_results = tracker.get_display_objects() # Cảnh đứng yên -> giữ kết quả cũ
                     else:
                         current_results = tracker.predict()
 
@@ -4,6 +4,7 @@ import sys
 import os
 import base64
 from datetime import datetime
+from source.msgproto import FrameReader, MSG_ALERT, MSG_CLEAR, MSG_IMAGE, MSG_TEXT, MSG_CLIP, MSG_CLIP_END, MAGIC # [NEW] Giao thức nhị phân
 
 try:
     import pyttsx3 # [UPDATE] Thư viện chuyển văn bản thành giọng nói
@@ -24,6 +25,45 @@ SAVE_DIR = "captured_images"
 if not os.path.exists(SAVE_DIR):
     os.makedirs(SAVE_DIR)
 
+def save_image(img_data, track_id=-1):
+    """Lưu ảnh bằng chứng (bytes hoặc memoryview, ghi thẳng không copy)"""
+    try:
+        # Tạo tên file theo thời gian
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = f"_id{track_id}" if track_id >= 0 else ""
+        filename = f"{SAVE_DIR}/alert_{timestamp}{suffix}.jpg"
+        
+        with open(filename, "wb") as f:
+            f.write(img_data)
+        print(f"📸 Đã lưu ảnh bằng chứng: {filename}")
+    except Exception as e:
+        print(f"❌ Lỗi lưu ảnh: {e}")
+
+def save_clip_frame(clip, img_data):
+    """[CLIP] Nối frame JPEG vào file .mjpeg của clip đang nhận (mở file mới ở frame đầu tiên)"""
+    try:
+        if clip.get('file') is None:
+            clip['name'] = f"{SAVE_DIR}/clip_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            clip['file'] = open(clip['name'] + ".mjpeg", "wb")
+            clip['frames'] = 0
+            print("🎬 Đang nhận clip sự kiện...")
+        clip['file'].write(img_data)
+        clip['frames'] += 1
+    except Exception as e:
+        print(f"❌ Lỗi lưu clip: {e}")
+
+def finish_clip(clip, meta):
+    """[CLIP] Đóng file .mjpeg và lưu metadata (JSON) của clip"""
+    try:
+        if clip.get('file') is None: return
+        clip['file'].close()
+        clip['file'] = None
+        with open(clip['name'] + ".json", "wb") as f:
+            f.write(meta)
+        print(f"🎬 Đã lưu clip: {clip['name']}.mjpeg ({clip['frames']} frame)")
+    except Exception as e:
+        print(f"❌ Lỗi lưu clip: {e}")
+
 def main():
     print(f"🔌 Đang kết nối tới Server (Local) tại {DRONE_IP}:{MSG_PORT}...")
     
@@ -39,46 +79,57 @@ def main():
         client.settimeout(0.1) # [IMPORTANT] Timeout ngắn để vòng lặp chạy liên tục (check timer)
         current_msg = None
         last_speak_time = 0
-        buffer = "" # [NEW] Bộ đệm để ghép nối dữ liệu bị cắt
+        buffer = "" # [NEW] Bộ đệm để ghép nối dữ liệu bị cắt (giao thức text cũ)
+        reader = FrameReader() # [NEW] Bộ tách frame nhị phân (payload là memoryview, không copy)
+        binary = None # Tự nhận dạng giao thức theo 2 byte đầu tiên (MESSAGE_PROTOCOL trên Drone)
+        clip = {} # [CLIP] Clip sự kiện đang nhận
         
         while True:
             try:
-                # Nhận dữ liệu (tối đa 1024 bytes)
-                # [FIX] Tăng buffer lên 4096 để đọc sạch dữ liệu tồn đọng
-                data = client.recv(4096)
+                # [FIX] Tăng buffer lên 64KB để ảnh lớn về nhanh hơn
+                data = client.recv(65536)
                 if not data:
                     print("⚠️ Server đã đóng kết nối.")
                     break
-                
-                # [BUFFER LOGIC] Ghép dữ liệu mới vào bộ đệm
-                raw_chunk = data.decode('utf-8', errors='ignore')
-                buffer += raw_chunk
-                
-                # Xử lý từng dòng lệnh (phân tách bởi \n)
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    msg = line.strip()
-                    if not msg: continue
+                if binary is None:
+                    binary = data[:len(MAGIC)] == MAGIC
+                    print(f"ℹ️  Giao thức: {'binary' if binary else 'text'}")
 
-                    # [IMAGE HANDLER] Nếu là dữ liệu ảnh
-                    if msg.startswith("IMG:"):
-                        try:
-                            b64_data = msg[4:] # Cắt bỏ tiền tố "IMG:"
-                            img_data = base64.b64decode(b64_data)
-                            
-                            # Tạo tên file theo thời gian
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            filename = f"{SAVE_DIR}/alert_{timestamp}.jpg"
-                            
-                            with open(filename, "wb") as f:
-                                f.write(img_data)
-                            print(f"📸 Đã lưu ảnh bằng chứng: {filename}")
-                        except Exception as e:
-                            print(f"❌ Lỗi lưu ảnh: {e}")
-                        continue # Xử lý xong ảnh thì bỏ qua logic đọc loa bên dưới
+                messages = [] # (loại, nội dung text)
+                if binary:
+                    reader.feed(data)
+                    for msg_type, ts, track_id, payload in reader.frames():
+                        if msg_type == MSG_IMAGE:
+                            save_image(payload, track_id)
+                        elif msg_type == MSG_CLIP:
+                            save_clip_frame(clip, payload)
+                        elif msg_type == MSG_CLIP_END:
+                            finish_clip(clip, payload)
+                        elif msg_type == MSG_CLEAR:
+                            messages.append("None")
+                        elif msg_type in (MSG_ALERT, MSG_TEXT):
+                            messages.append(str(payload, 'utf-8', 'ignore').strip())
+                else:
+                    # [BUFFER LOGIC] Ghép dữ liệu mới vào bộ đệm
+                    buffer += data.decode('utf-8', errors='ignore')
                     
-                    # [LOGIC] Cập nhật trạng thái hiện tại (Di chuyển vào trong vòng lặp)
-                    # Để đảm bảo chỉ xử lý khi không phải là ảnh
+                    # Xử lý từng dòng lệnh (phân tách bởi \n)
+                    while '\n' in buffer:
+                        line, buffer = buffer.split('\n', 1)
+                        msg = line.strip()
+                        if not msg: continue
+
+                        # [IMAGE HANDLER] Nếu là dữ liệu ảnh
+                        if msg.startswith("IMG:"):
+                            try:
+                                save_image(base64.b64decode(msg[4:])) # Cắt bỏ tiền tố "IMG:"
+                            except Exception as e:
+                                print(f"❌ Lỗi lưu ảnh: {e}")
+                            continue # Xử lý xong ảnh thì bỏ qua logic đọc loa bên dưới
+                        messages.append(msg)
+
+                for msg in messages:
+                    # [LOGIC] Cập nhật trạng thái hiện tại
                     if msg == "None":
                         if current_msg is not None:
                             print("🛑 Đã dừng hành động.")
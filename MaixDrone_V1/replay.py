@@ -0,0 +1,123 @@
+# replay.py
+# Chạy lại 1 phiên đã ghi (RECORD_ENABLE trong config.py) qua Tracker -> Bộ lọc -> Cử chỉ -> Cảnh báo (HUD)
+# trên PC, không cần Camera/NPU. Dùng để tái hiện lỗi, kiểm tra hồi quy và đo thời gian xử lý.
+#   python replay.py session.mdr                      # Chạy nhanh nhất có thể, in thống kê + các cảnh báo
+#   python replay.py session.mdr --speed 10           # Giữ nhịp 10 lần thời gian thực
+#   python replay.py session.mdr --out golden.jsonl   # Lưu kết quả từng frame
+#   python replay.py session.mdr --check golden.jsonl # So với kết quả đã lưu (exit code 1 nếu khác)
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+try:
+    import maix # noqa: F401 (MaixPy thật, chạy trên MaixCam)
+except ImportError:
+    sys.path.insert(0, os.path.join(ROOT, "stubs")) # PC: dùng module maix giả
+
+from maix import image
+from source.recording import read_records, REC_DETECT, REC_PREDICT, REC_TRANSFORM, REC_STATIC
+from source.tracker import ObjectTracker
+from source.ui import HUD
+
+class Replay:
+    """Đưa từng bản ghi qua ObjectTracker + HUD với đồng hồ = thời điểm đã ghi -> kết quả giống hệt mỗi lần chạy"""
+    def __init__(self, width=640, height=480):
+        self.now = 0.0
+        self.tracker = ObjectTracker()
+        self.tracker.clock = lambda: self.now
+        self.hud = HUD(width, height)
+        self.hud.clock = lambda: self.now
+        self.hud.last_print_time = float("inf") # Tắt dòng in định kỳ của HUD
+        self.img = image.Image(width, height)
+        self.events = []   # Các lần đổi thông báo (giống main.py gửi qua MessageServer)
+        self.timing = {'track': 0.0, 'hud': 0.0}
+        self.frames = 0
+
+    def step(self, kind, t, frame_id, data):
+        """Xử lý 1 bản ghi. Trả về dict kết quả của frame (None với bản ghi Transform)"""
+        self.now = t
+        if kind == REC_TRANSFORM:
+            self.tracker.set_transform(data)
+            self.hud.width, self.hud.height = data.src_w, data.src_h
+            return None
+
+        t0 = time.perf_counter()
+        if kind == REC_STATIC:
+            results = self.tracker.get_display_objects()
+        elif kind == REC_PREDICT:
+            results = self.tracker.predict()
+        else:
+            results = self.tracker.update(data)
+        t1 = time.perf_counter()
+        self.hud.draw_ai_result(self.img, results)
+        t2 = time.perf_counter()
+        self.timing['track'] += t1 - t0
+        self.timing['hud'] += t2 - t1
+        self.frames += 1
+
+        alert = self.hud.last_action_code if self.hud.last_action_msg else None
+        if not self.events or self.events[-1]['alert'] != alert:
+            if self.events or alert is not None:
+                self.events.append({'frame': frame_id, 't': t, 'alert': alert, 'id': self.hud.last_action_id})
+        return {
+            'frame': frame_id,
+            'predicted': kind != REC_DETECT,
+            'alert': alert,
+            'people': [{'id': obj['id'], 'box': [round(v, 1) for v in obj['box']],
+                        'pose_score': round(obj.get('pose_score', 0.0), 4), 'gestures': obj.get('gestures', [])}
+                       for obj in results],
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy lại phiên đã ghi qua Tracker/Cử chỉ/Cảnh báo")
+    parser.add_argument("path", help="File ghi (.mdr)")
+    parser.add_argument("--speed", type=float, default=0.0, help="Bội số thời gian thực (0 = nhanh nhất có thể)")
+    parser.add_argument("--out", help="Lưu kết quả từng frame (JSON Lines)")
+    parser.add_argument("--check", help="So với file kết quả đã lưu bằng --out")
+    args = parser.parse_args()
+
+    replay = Replay()
+    out = open(args.out, "w") if args.out else None
+    golden = open(args.check) if args.check else None
+    mismatch = None
+    t_first = wall_first = None
+    wall_start = time.perf_counter()
+
+    for kind, t, frame_id, data in read_records(args.path):
+        if args.speed > 0:
+            # Giữ nhịp theo thời điểm đã ghi / speed
+            if t_first is None: t_first, wall_first = t, time.perf_counter()
+            delay = (t - t_first) / args.speed - (time.perf_counter() - wall_first)
+            if delay > 0: time.sleep(delay)
+        res = replay.step(kind, t, frame_id, data)
+        if res is None: continue
+        line = json.dumps(res, separators=(',', ':'))
+        if out: out.write(line + "\n")
+        if golden and mismatch is None:
+            expected = golden.readline().strip()
+            if expected != line: mismatch = (frame_id, expected, line)
+
+    if golden and mismatch is None and golden.readline().strip():
+        mismatch = ("EOF", "(còn frame)", "(hết frame)")
+    wall = time.perf_counter() - wall_start
+    if out: out.close()
+    if golden: golden.close()
+
+    n = max(replay.frames, 1)
+    print(f"🎞️ {replay.frames} frame trong {wall:.2f}s ({replay.frames / max(wall, 1e-9):.0f} FPS) | "
+          f"Tracker {replay.timing['track'] * 1000 / n:.2f}ms/frame | HUD {replay.timing['hud'] * 1000 / n:.2f}ms/frame")
+    for ev in replay.events:
+        print(f"🔔 frame {ev['frame']}: {ev['alert'] or 'hết cảnh báo'}" + (f" (ID {ev['id']})" if ev['alert'] else ""))
+    if args.check:
+        if mismatch is None:
+            print("✅ Khớp hoàn toàn với kết quả đã lưu")
+        else:
+            print(f"❌ Khác tại frame {mismatch[0]}:\n  mong đợi: {mismatch[1]}\n  thực tế:  {mismatch[2]}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
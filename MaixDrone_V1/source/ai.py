@@ -1,5 +1,176 @@
 from maix import nn, image
+import numpy as np
+import time
 import config # Import config để lấy KEYPOINT_THRESHOLD
+from source.association import iou_matrix
+from source.profiler import PROFILER # [PROFILE] Đo preprocess / npu / remap
+
+NUM_KPTS = 17       # COCO-17
+BOX_PAD_RATIO = 0.10 # [PADDING] Mở rộng Box 10% để bao quát toàn bộ vật thể
+
+class PoseBatch:
+    """
+    Kết quả AI dạng mảng gọn (đã map về toạ độ ảnh gốc):
+    - boxes:  (N, 4) float32 [x, y, w, h] (đã padding 10% và kẹp biên, giá trị nguyên)
+    - scores: (N,)   float32
+    - kpts:   (N, 17, 3) float32 [x, y, conf]
+    - has_points: (N,) bool - False nếu AI không trả về điểm xương cho object đó
+    """
+    def __init__(self, boxes, scores, kpts, has_points):
+        self.boxes = boxes
+        self.scores = scores
+        self.kpts = kpts
+        self.has_points = has_points
+
+    @staticmethod
+    def empty():
+        return PoseBatch(np.zeros((0, 4), np.float32), np.zeros((0,), np.float32),
+                         np.zeros((0, NUM_KPTS, 3), np.float32), np.zeros((0,), bool))
+
+    def __len__(self):
+        return self.boxes.shape[0]
+
+    def to_dicts(self):
+        """[COMPAT] Định dạng cũ: list các dict {x, y, w, h, score, class_id, points}"""
+        results = []
+        boxes = self.boxes.astype(int).tolist()
+        scores = self.scores.tolist()
+        kpts = self.kpts.reshape(len(self), NUM_KPTS * 3).tolist()
+        for i in range(len(self)):
+            bx, by, bw, bh = boxes[i]
+            results.append({
+                "x": bx, "y": by, "w": bw, "h": bh,
+                "score": scores[i],
+                "class_id": 0,
+                "points": kpts[i] if self.has_points[i] else []
+            })
+        return results
+
+class LetterboxTransform:
+    """
+    Phép biến đổi Letterbox giữa ảnh gốc (src) và đầu vào Model (dst), tính 1 lần cho mỗi độ phân giải.
+    - forward: toạ độ ảnh gốc -> toạ độ Model
+    - inverse: toạ độ Model -> toạ độ ảnh gốc
+    Dùng chung cho AIEngine (map kết quả) và ObjectTracker (kẹp biên).
+    """
+    def __init__(self, src_w, src_h, dst_w, dst_h):
+        self.src_w = src_w
+        self.src_h = src_h
+        self.dst_w = dst_w
+        self.dst_h = dst_h
+        # [OPTIMIZATION] Ảnh đầu vào đã đúng kích thước Model -> không cần Resize/Padding
+        self.identity = (src_w == dst_w and src_h == dst_h)
+        if self.identity:
+            self.ratio = 1.0
+        else:
+            # Tính tỷ lệ scale để ảnh vừa khít khung Model mà không bị méo
+            self.ratio = min(dst_w / src_w, dst_h / src_h)
+        self.new_w = int(src_w * self.ratio)
+        self.new_h = int(src_h * self.ratio)
+        self.pad_w = (dst_w - self.new_w) // 2
+        self.pad_h = (dst_h - self.new_h) // 2
+
+    def pad_strips(self):
+        """Các dải padding (x, y, w, h) trong ảnh Model (vùng ngoài ảnh thật)"""
+        strips = []
+        if self.pad_h > 0:
+            strips.append((0, 0, self.dst_w, self.pad_h))
+            strips.append((0, self.pad_h + self.new_h, self.dst_w, self.dst_h - self.pad_h - self.new_h))
+        if self.pad_w > 0:
+            strips.append((0, 0, self.pad_w, self.dst_h))
+            strips.append((self.pad_w + self.new_w, 0, self.dst_w - self.pad_w - self.new_w, self.dst_h))
+        return [s for s in strips if s[2] > 0 and s[3] > 0]
+
+    def forward(self, xy):
+        """xy: mảng (..., 2+) toạ độ ảnh gốc -> toạ độ Model (trả về mảng mới)"""
+        out = np.array(xy, dtype=np.float32, copy=True)
+        out[..., 0] = out[..., 0] * self.ratio + self.pad_w
+        out[..., 1] = out[..., 1] * self.ratio + self.pad_h
+        return out
+
+    def inverse(self, xy):
+        """xy: mảng (..., 2+) toạ độ Model -> toạ độ ảnh gốc (trả về mảng mới)"""
+        out = np.array(xy, dtype=np.float32, copy=True)
+        out[..., 0] = (out[..., 0] - self.pad_w) / self.ratio
+        out[..., 1] = (out[..., 1] - self.pad_h) / self.ratio
+        return out
+
+    def inverse_boxes(self, boxes):
+        """boxes: (N, 4) [x, y, w, h] toạ độ Model -> ảnh gốc"""
+        out = self.inverse(boxes)
+        out[:, 2:4] /= self.ratio
+        return out
+
+    def clamp_boxes(self, boxes):
+        """Kẹp Box (N, 4) [x, y, w, h] vào trong ảnh gốc (sửa trực tiếp) và làm tròn về số nguyên"""
+        boxes[:, 0] = np.trunc(np.maximum(0, boxes[:, 0]))
+        boxes[:, 1] = np.trunc(np.maximum(0, boxes[:, 1]))
+        boxes[:, 2] = np.trunc(np.minimum(self.src_w - boxes[:, 0], boxes[:, 2]))
+        boxes[:, 3] = np.trunc(np.minimum(self.src_h - boxes[:, 1], boxes[:, 3]))
+        return boxes
+
+class TileTransform(LetterboxTransform):
+    """[TILE] Ô cắt kích thước Model tại (x, y) của ảnh gốc: Model -> ảnh gốc chỉ là phép dời (không scale)"""
+    def __init__(self, src_w, src_h, x, y, w, h):
+        super().__init__(src_w, src_h, src_w, src_h)
+        self.x, self.y, self.w, self.h = x, y, w, h
+
+    def inverse(self, xy):
+        out = np.array(xy, dtype=np.float32, copy=True)
+        out[..., 0] += self.x
+        out[..., 1] += self.y
+        return out
+
+def tile_grid(src_w, src_h, tile_w, tile_h, overlap=0.2):
+    """Các ô (x, y, w, h) kích thước Model phủ kín ảnh gốc, chồng lấn tối thiểu overlap (tỷ lệ cạnh ô)"""
+    def starts(size, tile):
+        if size <= tile: return [0]
+        n = int(np.ceil((size - tile) / max(1.0, tile * (1.0 - overlap)))) + 1
+        return [int(round(v)) for v in np.linspace(0, size - tile, n)]
+    tw, th = min(tile_w, src_w), min(tile_h, src_h)
+    return [(x, y, tw, th) for y in starts(src_h, th) for x in starts(src_w, tw)]
+
+def merge_nms(boxes, scores, rank, cut=None, iou_th=0.5, contain_th=0.7):
+    """
+    [TILE] NMS giữa các ô: giữ box theo thứ tự rank (nhỏ = ưu tiên) rồi score, bỏ box trùng IoU > iou_th.
+    Box bị mép ô cắt (cut) còn bị bỏ nếu nằm gần trọn trong 1 box đã giữ (giao / diện tích box nhỏ hơn > contain_th).
+    Trả về index các box được giữ.
+    """
+    if cut is None: cut = np.zeros(len(boxes), bool)
+    order = np.lexsort((-scores, cut, rank)) # Box nguyên vẹn đứng trước mảnh bị cắt cùng lượt
+    area = boxes[:, 2] * boxes[:, 3]
+    keep = []
+    for i in order:
+        if keep:
+            k = np.asarray(keep)
+            iw = np.minimum(boxes[k, 0] + boxes[k, 2], boxes[i, 0] + boxes[i, 2]) - np.maximum(boxes[k, 0], boxes[i, 0])
+            ih = np.minimum(boxes[k, 1] + boxes[k, 3], boxes[i, 1] + boxes[i, 3]) - np.maximum(boxes[k, 1], boxes[i, 1])
+            inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+            iou = inter / np.maximum(area[k] + area[i] - inter, 1e-6)
+            if (iou > iou_th).any(): continue
+            if cut[i] and (inter / np.maximum(np.minimum(area[k], area[i]), 1e-6) > contain_th).any(): continue
+        keep.append(i)
+    return np.asarray(keep, dtype=np.intp)
+
+def remap_batch(raw_boxes, raw_kpts, transform):
+    """
+    [VECTORIZED] Map toàn bộ Box + Keypoints từ toạ độ Model (letterbox) về ảnh gốc trong 1 bước.
+    raw_boxes: (N, 4) [x, y, w, h] - raw_kpts: (N, 17, 3) [x, y, conf]
+    """
+    t0 = time.perf_counter()
+    boxes = transform.inverse_boxes(raw_boxes)
+
+    # [PADDING] Mở rộng 10% (giữ nguyên tâm)
+    pad = boxes[:, 2:4] * BOX_PAD_RATIO
+    boxes[:, 0:2] -= pad / 2
+    boxes[:, 2:4] += pad
+
+    # Kẹp biên + làm tròn về số nguyên (giống int() của bản cũ)
+    transform.clamp_boxes(boxes)
+
+    kpts = transform.inverse(raw_kpts)
+    PROFILER.lap("remap", t0)
+    return boxes, kpts
 
 class AIEngine:
     def __init__(self, model_path, conf_threshold):
@@ -8,24 +179,50 @@ class AIEngine:
         self.model = None
         self.input_w = 0 # [AUTO] Sẽ tự cập nhật theo Model
         self.input_h = 0 # [AUTO] Sẽ tự cập nhật theo Model
+        self.transform = None # [CACHE] LetterboxTransform của độ phân giải hiện tại
+        self.canvas = None    # [CACHE] Ảnh đầu vào Model cấp phát sẵn (tái sử dụng mọi frame)
+        # [ROI] Giai đoạn 2: chạy lại Model trên vùng cắt của người nhỏ/xa (ảnh gốc độ phân giải đầy đủ)
+        self.roi_enable = getattr(config, "ROI_REFINE_ENABLE", False)
+        self.roi_max_height = getattr(config, "ROI_MAX_HEIGHT", 100)
+        self.roi_max_crops = getattr(config, "ROI_MAX_CROPS", 2)
+        self.roi_budget_ms = getattr(config, "ROI_TIME_BUDGET_MS", 40)
+        self.roi_pad = getattr(config, "ROI_PAD", 0.25)
+        self.roi_min_iou = getattr(config, "ROI_MIN_IOU", 0.3)
+        self.roi_crops = 0    # Thống kê: số vùng đã chạy lại / số người được cập nhật điểm
+        self.roi_refined = 0
+        # [TILE] Ảnh gốc lớn hơn Model: chia ô kích thước Model (không thu nhỏ), xoay vòng qua các frame
+        self.tile_enable = getattr(config, "TILE_ENABLE", False)
+        self.tile_overlap = getattr(config, "TILE_OVERLAP", 0.2)
+        self.tiles_per_frame = getattr(config, "TILES_PER_FRAME", 0)
+        self.tile_global = getattr(config, "TILE_GLOBAL", True)
+        self.tile_nms_iou = getattr(config, "TILE_NMS_IOU", 0.5)
+        self.tiles = []       # [CACHE] Danh sách ô ("global" hoặc TileTransform), tính lại khi đổi độ phân giải
+        self.tile_key = None
+        self.tile_next = 0    # Ô sẽ chạy tiếp theo (round-robin)
+        self.tile_results = {} # ô -> (số thứ tự frame, boxes, scores, kpts, has_points) lần chạy gần nhất
+        self.tile_frame = 0
 
-    def load(self):
+    def load(self, dual_buff=True):
+        """dual_buff=False khi thread NPU riêng gọi forward() (AsyncInference): mỗi job cần đúng kết quả của ảnh của nó"""
         try:
             print(f"🧠 Loading Model: {self.model_path}")
             
             # [AUTO-DETECT] Tự động chọn class phù hợp với phiên bản YOLO
             path_lower = self.model_path.lower()
+            # [ROI/TILE] dual_buff=True: detect() trả về kết quả của ảnh gửi lần TRƯỚC (NPU chạy song song ảnh sau).
+            # Nhiều lần chạy Model trong 1 frame (vùng cắt ROI, các ô Tile) sẽ nhận nhầm kết quả của ảnh khác -> tắt
+            dual_buff = dual_buff and not (self.roi_enable or self.tile_enable)
             # [UPDATE] Loại bỏ YOLOv5, tập trung vào YOLO11. YOLOv8 là phụ.
             if "yolov8" in path_lower:
-                self.model = nn.YOLOv8(self.model_path, dual_buff=True)
+                self.model = nn.YOLOv8(self.model_path, dual_buff=dual_buff)
             else:
                 # Mặc định là YOLO11 (cho cả yolo11n, yolo11s...)
-                self.model = nn.YOLO11(self.model_path, dual_buff=True)
+                self.model = nn.YOLO11(self.model_path, dual_buff=dual_buff)
             
             # [NEW] Tự động lấy kích thước input từ Model
             self.input_w = self.model.input_width()
             self.input_h = self.model.input_height()
-            print(f"📏 Model Input Size: {self.input_w}x{self.input_h}")
+            print(f"📏 Model Input Size: {self.input_w}x{self.input_h}" + ("" if dual_buff else " | dual_buff tắt"))
             
             return True
         except Exception as e:
@@ -33,88 +230,231 @@ class AIEngine:
             return False
 
     def process(self, img_hd):
-        if not self.model: return img_hd, []
-        
-        results = []
+        """[COMPAT] Trả về list các dict (định dạng cũ). Dùng process_batch() cho đường xử lý nhanh"""
+        img_hd, batch = self.process_batch(img_hd)
+        return img_hd, batch.to_dicts()
+
+    def process_batch(self, img_hd):
+        """Chạy Model và trả về PoseBatch (mảng NumPy, map toạ độ bằng 1 phép tính vector hoá)"""
+        if not self.model: return img_hd, PoseBatch.empty()
         
         try:
-            # --- GIAI ĐOẠN 1: TÌM NGƯỜI (GLOBAL DETECTION) ---
-            # [OPTIMIZATION] Kiểm tra nếu ảnh đầu vào đã đúng kích thước Model (320x224)
-            # thì bỏ qua bước Resize và Padding để tăng tốc độ xử lý.
-            if img_hd.width() == self.input_w and img_hd.height() == self.input_h:
-                img_input = img_hd
-                ratio = 1.0
-                pad_w = 0
-                pad_h = 0
+            # --- GIAI ĐOẠN 1: TÌM NGƯỜI (GLOBAL DETECTION, hoặc chia ô khi ảnh gốc lớn hơn Model) ---
+            if self.tile_enable and (img_hd.width() > self.input_w or img_hd.height() > self.input_h):
+                batch = self.process_tiles(img_hd)
             else:
-                # Tính tỷ lệ scale để ảnh vừa khít khung 320x224 mà không bị méo
-                ratio = min(self.input_w / img_hd.width(), self.input_h / img_hd.height())
-                new_w = int(img_hd.width() * ratio)
-                new_h = int(img_hd.height() * ratio)
-                
-                # Resize ảnh gốc
-                img_resized = img_hd.resize(new_w, new_h)
-                
-                # Tạo ảnh nền đen 320x224 và dán ảnh đã resize vào giữa
-                img_input = image.Image(self.input_w, self.input_h) # Mặc định là đen
-                pad_w = (self.input_w - new_w) // 2
-                pad_h = (self.input_h - new_h) // 2
-                img_input.draw_image(pad_w, pad_h, img_resized)
-
-            # Chạy Model lần 1 để lấy Box
-            # [FIX] Thêm keypoint_th để NPU không lọc bỏ điểm xương quá sớm
-            # Dùng config.KEYPOINT_THRESHOLD (0.15) để bắt được cả điểm mờ
-            
-            # [UPDATE] Đã loại bỏ YOLOv5, nên luôn gọi hàm detect chuẩn của YOLO11/8
-            objs = self.model.detect(img_input, conf_th=self.threshold, iou_th=0.45, keypoint_th=config.KEYPOINT_THRESHOLD)
-            
-            for obj in objs:
-                # Map Box gốc từ YOLO
-                bx = (obj.x - pad_w) / ratio
-                by = (obj.y - pad_h) / ratio
-                bw = obj.w / ratio
-                bh = obj.h / ratio
-
-                # [PADDING] Mở rộng 10% để bao quát toàn bộ vật thể (như lúc ổn định)
-                PAD_RATIO = 0.10
-                pad_w_val = bw * PAD_RATIO
-                pad_h_val = bh * PAD_RATIO
-                bx -= pad_w_val / 2
-                by -= pad_h_val / 2
-                bw += pad_w_val
-                bh += pad_h_val
-
-                # Map Points (Lấy dữ liệu trực tiếp từ AI Global)
-                final_points = []
-                if obj.points:
-                    # [FIX CRITICAL] Tự động xác định stride để tránh lỗi lệch pha dữ liệu
-                    # Nếu độ dài chia hết cho 3 -> [x, y, conf]. Nếu không -> [x, y]
-                    stride = 3 if len(obj.points) % 3 == 0 else 2
-                    num_points = len(obj.points) // stride
-
-                    for i in range(num_points):
-                        base = i * stride
-                        px = (obj.points[base] - pad_w) / ratio
-                        py = (obj.points[base+1] - pad_h) / ratio
-                        conf = obj.points[base+2] if stride == 3 else 1.0
-                        final_points.extend([px, py, conf])
-
-                # Convert sang int và kẹp biên
-                bx = int(max(0, bx))
-                by = int(max(0, by))
-                bw = int(min(img_hd.width() - bx, bw))
-                bh = int(min(img_hd.height() - by, bh))
-
-                results.append({
-                    "x": bx, "y": by, "w": bw, "h": bh, # [STABLE] Vẫn trả về Box gốc ổn định
-                    "score": obj.score,
-                    "class_id": 0,
-                    # [OFFICIAL] Trả về nguyên bản points để dùng hàm draw_pose nếu cần
-                    # Lưu ý: final_points của ta đã map về ảnh gốc, rất tốt.
-                    "points": final_points 
-                })
+                batch = self._detect(self.prepare_input(img_hd), self.transform)
+            if not len(batch): return img_hd, batch
+
+            # --- GIAI ĐOẠN 2: CẮT VÙNG NGƯỜI NHỎ/XA TỪ ẢNH GỐC, CHẠY LẠI MODEL (ROI REFINEMENT) ---
+            if self.roi_enable: self.refine(img_hd, batch)
+            return img_hd, batch
 
         except Exception as e:
             print(f"⚠️ AI Error: {e}")
         
-        return img_hd, results
+        return img_hd, PoseBatch.empty()
+
+    def _run_model(self, img_input):
+        """Chạy Model, trả về mảng thô (toạ độ Model) hoặc None nếu không thấy ai"""
+        # [FIX] Thêm keypoint_th để NPU không lọc bỏ điểm xương quá sớm
+        # Dùng config.KEYPOINT_THRESHOLD (0.15) để bắt được cả điểm mờ
+        # [UPDATE] Đã loại bỏ YOLOv5, nên luôn gọi hàm detect chuẩn của YOLO11/8
+        t0 = time.perf_counter()
+        objs = self.model.detect(img_input, conf_th=self.threshold, iou_th=0.45, keypoint_th=config.KEYPOINT_THRESHOLD)
+        PROFILER.lap("npu", t0)
+        if not objs: return None
+        return self._gather(objs)
+
+    def _detect(self, img_input, transform):
+        """Chạy Model trên 1 ảnh đầu vào, map kết quả về ảnh gốc theo transform"""
+        raw = self._run_model(img_input)
+        if raw is None: return PoseBatch.empty()
+        raw_boxes, scores, raw_kpts, has_points = raw
+        boxes, kpts = remap_batch(raw_boxes, raw_kpts, transform)
+        return PoseBatch(boxes, scores, kpts, has_points)
+
+    def forward(self, img_hd):
+        """
+        [ASYNC] Phần cần NPU của process_batch (dùng trong thread NPU, xem source/npu.py).
+        Trả về (kết quả thô, transform): map toạ độ để thread gọi làm sau (InferenceJob.result()).
+        Chế độ Tile / ROI cần nhiều lần chạy Model -> làm trọn trong thread NPU, trả về PoseBatch hoàn chỉnh.
+        """
+        if not self.model: return None, self.transform
+        if self.roi_enable or (self.tile_enable and (img_hd.width() > self.input_w or img_hd.height() > self.input_h)):
+            return self.process_batch(img_hd)[1], self.transform
+        img_input = self.prepare_input(img_hd)
+        return self._run_model(img_input), self.transform
+
+    def process_tiles(self, img_hd):
+        """
+        [TILE] Ảnh gốc độ phân giải cao -> các ô kích thước Model chồng lấn TILE_OVERLAP (+ 1 lượt toàn cảnh thu nhỏ
+        nếu TILE_GLOBAL, để bắt người gần to hơn 1 ô). Mỗi frame chạy TILES_PER_FRAME ô (0 = tất cả), xoay vòng;
+        kết quả mới nhất của mọi ô trong 1 vòng được gộp bằng NMS giữa các ô (kết quả mới hơn được ưu tiên).
+        """
+        src_w, src_h = img_hd.width(), img_hd.height()
+        transform = self.get_transform(src_w, src_h) # Transform toàn cảnh: Tracker/HUD dùng để kẹp biên
+        key = (src_w, src_h, self.input_w, self.input_h)
+        if key != self.tile_key:
+            self.tile_key = key
+            self.tiles = [TileTransform(src_w, src_h, *t)
+                          for t in tile_grid(src_w, src_h, self.input_w, self.input_h, self.tile_overlap)]
+            if self.tile_global: self.tiles.append("global")
+            self.tile_next = 0
+            self.tile_results = {}
+            print(f"🧩 Tile: {len(self.tiles)} lượt/vòng cho ảnh {src_w}x{src_h}")
+
+        self.tile_frame += 1
+        n = len(self.tiles)
+        per_frame = n if self.tiles_per_frame <= 0 else min(self.tiles_per_frame, n)
+        for _ in range(per_frame):
+            idx = self.tile_next
+            self.tile_next = (self.tile_next + 1) % n
+            tile = self.tiles[idx]
+            if tile == "global":
+                batch = self._detect(self.prepare_input(img_hd), transform)
+                cut = np.zeros(len(batch), bool)
+            else:
+                batch = self._detect(img_hd.crop(tile.x, tile.y, tile.w, tile.h), tile)
+                cut = self._cut_by_tile(batch.boxes, tile)
+            self.tile_results[idx] = (self.tile_frame, batch, cut)
+
+        # Gộp kết quả của 1 vòng gần nhất (ô chưa chạy lại thì dùng kết quả cũ tối đa 1 vòng)
+        cycle = (n + per_frame - 1) // per_frame
+        parts = [(self.tile_frame - f, b, c) for f, b, c in self.tile_results.values()
+                 if self.tile_frame - f < cycle and len(b)]
+        if not parts: return PoseBatch.empty()
+        boxes = np.concatenate([b.boxes for _, b, _ in parts])
+        scores = np.concatenate([b.scores for _, b, _ in parts])
+        kpts = np.concatenate([b.kpts for _, b, _ in parts])
+        has_points = np.concatenate([b.has_points for _, b, _ in parts])
+        cut = np.concatenate([c for _, _, c in parts])
+        age = np.concatenate([np.full(len(b), a) for a, b, _ in parts])
+        keep = merge_nms(boxes, scores, age, cut, self.tile_nms_iou)
+        return PoseBatch(boxes[keep], scores[keep], kpts[keep], has_points[keep])
+
+    @staticmethod
+    def _cut_by_tile(boxes, tile, margin=2):
+        """Box chạm mép ô nằm bên trong ảnh gốc (không phải mép ảnh) -> người bị ô cắt mất 1 phần"""
+        x0, y0 = boxes[:, 0], boxes[:, 1]
+        x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+        return (((x0 <= tile.x + margin) & (tile.x > 0)) |
+                ((y0 <= tile.y + margin) & (tile.y > 0)) |
+                ((x1 >= tile.x + tile.w - margin) & (tile.x + tile.w < tile.src_w)) |
+                ((y1 >= tile.y + tile.h - margin) & (tile.y + tile.h < tile.src_h)))
+
+    def get_transform(self, src_w, src_h):
+        """Trả về LetterboxTransform cho độ phân giải (src_w, src_h), chỉ tính lại khi độ phân giải đổi"""
+        t = self.transform
+        if t is None or t.src_w != src_w or t.src_h != src_h or t.dst_w != self.input_w or t.dst_h != self.input_h:
+            t = LetterboxTransform(src_w, src_h, self.input_w, self.input_h)
+            self.transform = t
+            self._reset_canvas()
+        return t
+
+    def _reset_canvas(self):
+        """Chuẩn bị canvas cho transform mới: cấp phát 1 lần, các lần sau chỉ xoá lại dải padding"""
+        t = self.transform
+        if t.identity: return
+        if self.canvas is None:
+            self.canvas = image.Image(self.input_w, self.input_h) # Mặc định là đen
+        else:
+            # Vùng ảnh thật cũ có thể nằm trong dải padding mới -> tô đen lại
+            black = image.Color(0, 0, 0)
+            for x, y, w, h in t.pad_strips():
+                self.canvas.draw_rect(x, y, w, h, black, -1)
+
+    def prepare_input(self, img_hd):
+        """Letterbox ảnh gốc vào canvas cấp phát sẵn (không tạo ảnh đen mới mỗi frame)"""
+        t = self.get_transform(img_hd.width(), img_hd.height())
+        # [OPTIMIZATION] Ảnh đầu vào đã đúng kích thước Model (320x224) -> bỏ qua Resize và Padding
+        if t.identity: return img_hd
+
+        # Resize ảnh gốc rồi dán vào giữa canvas (dải padding đã đen sẵn, không cần xoá lại)
+        t0 = time.perf_counter()
+        img_resized = img_hd.resize(t.new_w, t.new_h)
+        self.canvas.draw_image(t.pad_w, t.pad_h, img_resized)
+        PROFILER.lap("preprocess", t0)
+        return self.canvas
+
+    def roi_for(self, box, src_w, src_h):
+        """Vùng cắt (x, y, w, h) quanh box: nới ROI_PAD, cùng tỷ lệ khung với Model (resize không méo, không padding)"""
+        bx, by, bw, bh = box
+        aspect = self.input_w / self.input_h
+        h = bh * (1.0 + self.roi_pad)
+        w = max(bw * (1.0 + self.roi_pad), h * aspect)
+        h = w / aspect
+        w, h = int(min(w, src_w)), int(min(h, src_h))
+        # Dời vào trong ảnh thay vì cắt nhỏ lại (giữ nguyên tỷ lệ)
+        x = int(min(max(0, bx + bw / 2 - w / 2), src_w - w))
+        y = int(min(max(0, by + bh / 2 - h / 2), src_h - h))
+        return x, y, w, h
+
+    def refine(self, img_hd, batch):
+        """
+        [ROI] Người có box cao < ROI_MAX_HEIGHT px: cắt từ ảnh gốc, phóng to bằng kích thước Model và chạy lại.
+        Điểm của lần chạy lại (ghép theo IoU với box gốc) thay điểm cũ nếu tin cậy hơn (từng khớp).
+        Ngân sách mỗi frame: tối đa ROI_MAX_CROPS vùng và ROI_TIME_BUDGET_MS ms, người nhỏ nhất được ưu tiên.
+        Model nhận 1 ảnh/lần nên mỗi vùng là 1 lần chạy NPU (ghép nhiều vùng vào 1 ảnh sẽ thu nhỏ lại, mất ý nghĩa).
+        """
+        if not len(batch) or self.roi_max_crops <= 0: return batch
+        small = np.flatnonzero(batch.boxes[:, 3] < self.roi_max_height)
+        if not len(small): return batch
+        small = small[np.argsort(batch.boxes[small, 3])][:self.roi_max_crops]
+        src_w, src_h = img_hd.width(), img_hd.height()
+        t0 = time.time()
+        for i in small:
+            if (time.time() - t0) * 1000.0 > self.roi_budget_ms: break
+            rx, ry, rw, rh = self.roi_for(batch.boxes[i], src_w, src_h)
+            if rw < 8 or rh < 8: continue
+            t_crop = time.perf_counter()
+            crop = img_hd.crop(rx, ry, rw, rh).resize(self.input_w, self.input_h)
+            t_crop = PROFILER.lap("preprocess", t_crop)
+            objs = self.model.detect(crop, conf_th=self.threshold, iou_th=0.45, keypoint_th=config.KEYPOINT_THRESHOLD)
+            PROFILER.lap("npu", t_crop)
+            self.roi_crops += 1
+            if not objs: continue
+            raw_boxes, _, raw_kpts, has_points = self._gather(objs)
+            # Toạ độ Model -> toạ độ ảnh gốc (vùng cắt cùng tỷ lệ khung -> chỉ scale + dời)
+            sx, sy = rw / self.input_w, rh / self.input_h
+            raw_boxes[:, 0] = raw_boxes[:, 0] * sx + rx
+            raw_boxes[:, 1] = raw_boxes[:, 1] * sy + ry
+            raw_boxes[:, 2] *= sx
+            raw_boxes[:, 3] *= sy
+            iou = iou_matrix(batch.boxes[i:i + 1].astype(np.float64), raw_boxes.astype(np.float64))[0]
+            iou[~has_points] = 0.0
+            j = int(np.argmax(iou))
+            if iou[j] < self.roi_min_iou: continue
+            kp = raw_kpts[j]
+            kp[:, 0] = kp[:, 0] * sx + rx
+            kp[:, 1] = kp[:, 1] * sy + ry
+            # Ghép từng khớp: lấy bản tin cậy hơn
+            better = kp[:, 2] > batch.kpts[i, :, 2]
+            if not batch.has_points[i]: better[:] = True
+            batch.kpts[i][better] = kp[better]
+            batch.has_points[i] = True
+            self.roi_refined += 1
+        return batch
+
+    def _gather(self, objs):
+        """Gom dữ liệu thô của các object (đối tượng C++) vào mảng NumPy liên tục"""
+        n = len(objs)
+        raw_boxes = np.array([(o.x, o.y, o.w, o.h) for o in objs], dtype=np.float32).reshape(n, 4)
+        scores = np.array([o.score for o in objs], dtype=np.float32)
+        raw_kpts = np.zeros((n, NUM_KPTS, 3), dtype=np.float32)
+        has_points = np.zeros((n,), dtype=bool)
+
+        for i, obj in enumerate(objs):
+            pts = obj.points
+            if not pts: continue
+            # [FIX CRITICAL] Tự động xác định stride để tránh lỗi lệch pha dữ liệu
+            # Nếu độ dài chia hết cho 3 -> [x, y, conf]. Nếu không -> [x, y]
+            stride = 3 if len(pts) % 3 == 0 else 2
+            arr = np.asarray(pts, dtype=np.float32)
+            num_points = min(NUM_KPTS, len(arr) // stride)
+            arr = arr[:num_points * stride].reshape(num_points, stride)
+            raw_kpts[i, :num_points, :stride] = arr
+            if stride == 2: raw_kpts[i, :num_points, 2] = 1.0
+            has_points[i] = True
+
+        return raw_boxes, scores, raw_kpts, has_points
@@ -0,0 +1,141 @@
+# source/association.py
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment as _scipy_lsa # [OPTIONAL] Nhanh hơn nếu có SciPy
+except ImportError:
+    _scipy_lsa = None
+
+GATE_COST = 1e6 # Chi phí cho cặp bị loại bởi ngưỡng (không bao giờ được chọn)
+
+def box_centers(boxes):
+    """boxes: (N, 4) [x, y, w, h] -> (N, 2) tâm"""
+    return boxes[:, 0:2] + boxes[:, 2:4] / 2
+
+def dynamic_threshold(track_boxes):
+    """[DYNAMIC] Ngưỡng khoảng cách theo kích thước box (60..200px), tránh nhầm ID khi xa/gần"""
+    return np.clip(0.6 * np.maximum(track_boxes[:, 2], track_boxes[:, 3]), 60, 200)
+
+def iou_matrix(a, b):
+    """IoU giữa mọi cặp box (T, 4) x (D, 4) -> (T, D)"""
+    ax0, ay0 = a[:, 0:1], a[:, 1:2]
+    ax1, ay1 = ax0 + a[:, 2:3], ay0 + a[:, 3:4]
+    bx0, by0 = b[:, 0], b[:, 1]
+    bx1, by1 = bx0 + b[:, 2], by0 + b[:, 3]
+    iw = np.clip(np.minimum(ax1, bx1) - np.maximum(ax0, bx0), 0, None)
+    ih = np.clip(np.minimum(ay1, by1) - np.maximum(ay0, by0), 0, None)
+    inter = iw * ih
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1e-6)
+
+def pose_similarity(track_kpts, det_kpts, det_boxes, kappa=0.1):
+    """
+    Độ giống nhau dáng người kiểu OKS giữa mọi cặp (T, 17, 3) x (D, 17, 3) -> (T, D) trong [0, 1].
+    Chỉ tính trên các khớp cả 2 bên đều nhìn thấy (conf > 0); không có khớp chung -> 0.
+    """
+    scale2 = np.maximum(det_boxes[:, 2] * det_boxes[:, 3], 1.0)        # (D,)
+    d2 = ((track_kpts[:, None, :, :2] - det_kpts[None, :, :, :2]) ** 2).sum(axis=3) # (T, D, 17)
+    vis = (track_kpts[:, None, :, 2] > 0) & (det_kpts[None, :, :, 2] > 0)
+    e = np.exp(-d2 / (2 * scale2[None, :, None] * kappa ** 2))
+    cnt = vis.sum(axis=2)
+    return np.where(cnt > 0, (e * vis).sum(axis=2) / np.maximum(cnt, 1), 0.0)
+
+def build_cost_matrix(pred_centers, track_boxes, det_boxes, track_kpts=None, det_kpts=None,
+                      w_dist=1.0, w_iou=0.0, w_pose=0.0):
+    """
+    [VECTORIZED] Ma trận chi phí ghép cặp Track x Detection.
+    - Khoảng cách tâm (tâm dự đoán của track) chuẩn hoá theo ngưỡng động của track
+    - (1 - IoU) và (1 - độ giống dáng người) nếu có trọng số
+    Trả về (cost, dist, gate): gate[i, j] = True nếu cặp nằm trong ngưỡng khoảng cách.
+    """
+    det_centers = box_centers(det_boxes)
+    diff = pred_centers[:, None, :] - det_centers[None, :, :]
+    dist = np.sqrt((diff ** 2).sum(axis=2))
+    th = dynamic_threshold(track_boxes)[:, None]
+    gate = dist < th
+
+    cost = w_dist * (dist / th)
+    if w_iou > 0:
+        cost = cost + w_iou * (1.0 - iou_matrix(track_boxes, det_boxes))
+    if w_pose > 0 and track_kpts is not None and det_kpts is not None:
+        cost = cost + w_pose * (1.0 - pose_similarity(track_kpts, det_kpts, det_boxes))
+    return cost, dist, gate
+
+def greedy_assign(dist, gate):
+    """
+    [GREEDY] Cách cũ: duyệt từng track theo thứ tự, lấy detection gần nhất chưa dùng (trong ngưỡng).
+    Trả về list (track_idx, det_idx).
+    """
+    pairs = []
+    if dist.size == 0: return pairs
+    masked = np.where(gate, dist, np.inf)
+    for i in range(masked.shape[0]):
+        j = int(np.argmin(masked[i]))
+        if masked[i, j] == np.inf: continue
+        pairs.append((i, j))
+        masked[:, j] = np.inf # Đánh dấu đã dùng
+    return pairs
+
+def _solve_lsa(cost):
+    """Thuật toán Hungarian (Kuhn-Munkres, dạng thế vị) cho ma trận n x m với n <= m.
+    Vòng trong vector hoá bằng NumPy -> O(n^2) lệnh Python, O(n^2 * m) phép tính."""
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, np.intp)   # p[j]: hàng (1-based) đang giữ cột j
+    way = np.zeros(m + 1, np.intp)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            upd = free & (cur < minv[1:])
+            minv[1:][upd] = cur[upd]
+            way[1:][upd] = j0
+            cand = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(cand)) + 1
+            delta = cand[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if p[j0] == 0: break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    rows = p[1:] - 1
+    cols = np.nonzero(rows >= 0)[0]
+    return rows[cols], cols
+
+def linear_assignment(cost):
+    """Ghép cặp tối ưu toàn cục (tổng chi phí nhỏ nhất). Trả về (rows, cols)"""
+    if _scipy_lsa is not None:
+        return _scipy_lsa(cost)
+    if cost.shape[0] <= cost.shape[1]:
+        rows, cols = _solve_lsa(cost)
+    else:
+        cols, rows = _solve_lsa(cost.T)
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+def hungarian_assign(cost, gate):
+    """
+    [GLOBAL] Ghép cặp tối ưu trên ma trận chi phí, giữ nguyên ngưỡng động:
+    cặp ngoài ngưỡng bị gán chi phí rất lớn và bị loại sau khi giải.
+    Trả về list (track_idx, det_idx).
+    """
+    if cost.size == 0: return []
+    gated = np.where(gate, cost, GATE_COST)
+    rows, cols = linear_assignment(gated)
+    return [(int(i), int(j)) for i, j in zip(rows, cols) if gate[i, j]]
+
+ASSOCIATORS = {
+    "greedy": lambda cost, dist, gate: greedy_assign(dist, gate),
+    "hungarian": lambda cost, dist, gate: hungarian_assign(cost, gate),
+}
@@ -0,0 +1,162 @@
+# source/clip.py
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+import config
+from source import msgproto
+
+class ClipRecorder:
+    """
+    [CLIP] Bộ đệm vòng vài giây JPEG gần nhất + metadata tracker, giới hạn theo số byte (CLIP_BUFFER_BYTES).
+    Khi có cảnh báo trong CLIP_TRIGGERS -> ghép clip CLIP_PRE_SECONDS trước + CLIP_POST_SECONDS sau sự kiện,
+    rồi giao cho thread nền ghi đĩa / gửi qua cổng tin nhắn (stage Output không bao giờ phải chờ).
+    JPEG lấy lại bản Stream đã nén (EncodedFrame.best()), chỉ nén thêm khi không có ai xem Stream.
+    """
+    def __init__(self, msg_server=None):
+        self.msg_server = msg_server
+        self.enabled = getattr(config, "CLIP_ENABLE", True)
+        self.pre = getattr(config, "CLIP_PRE_SECONDS", 3.0)
+        self.post = getattr(config, "CLIP_POST_SECONDS", 2.0)
+        self.interval = 1.0 / max(1e-3, getattr(config, "CLIP_FPS", 10))
+        self.budget = getattr(config, "CLIP_BUFFER_BYTES", 4 * 1024 * 1024)
+        self.quality = getattr(config, "CLIP_JPEG_QUALITY", 25)
+        self.triggers = set(getattr(config, "CLIP_TRIGGERS", ("EMERGENCY_STOP", "URGENT_ATTENTION")))
+        self.outputs = set(getattr(config, "CLIP_OUTPUT", ("disk", "message")))
+        self.out_dir = getattr(config, "CLIP_DIR", "/root/clips")
+
+        self.ring = deque() # (t, jpg, meta) - meta là JSON bytes gọn của các người trong frame
+        self.ring_bytes = 0
+        self.active = None  # Clip đang ghi phần "sau sự kiện"
+        self.t_next = 0.0   # Thời điểm được lưu frame tiếp theo
+        self.clips = 0      # Số clip đã xuất
+        self.dropped = 0    # Clip bị bỏ do thread nền còn bận
+
+        self.jobs = queue.Queue(maxsize=2)
+        self.worker = threading.Thread(target=self._run, name="clip", daemon=True)
+        if self.enabled: self.worker.start()
+
+    # --- Stage Output (mỗi frame) ---
+    def push(self, t, frame, objects):
+        """Thêm 1 frame (EncodedFrame của JpegCache) vào bộ đệm, giới hạn CLIP_FPS"""
+        if not self.enabled or t < self.t_next: return
+        jpg = frame.best() or frame.jpeg(self.quality)
+        if jpg is None: return
+        # Giữ nhịp đều CLIP_FPS (không trượt theo FPS camera), frame bị trễ quá 1 nhịp -> tính lại từ t
+        self.t_next = self.t_next + self.interval if t - self.t_next < self.interval else t + self.interval
+        meta = self._meta(objects)
+        item = (t, jpg, meta)
+        size = len(jpg) + len(meta)
+
+        self.ring.append(item)
+        self.ring_bytes += size
+        # Bỏ frame cũ: quá ngân sách byte hoặc cũ hơn phần "trước sự kiện" cần giữ
+        while self.ring and (self.ring_bytes > self.budget or t - self.ring[0][0] > self.pre):
+            old = self.ring.popleft()
+            self.ring_bytes -= len(old[1]) + len(old[2])
+
+        clip = self.active
+        if clip is not None:
+            clip['frames'].append(item)
+            clip['bytes'] += size
+            if t >= clip['end_t'] or clip['bytes'] > self.budget:
+                self._finish()
+
+    def trigger(self, code, track_id=-1, t=None):
+        """Báo có cảnh báo mới (HUD.last_action_code). Chỉ các mã trong CLIP_TRIGGERS mới ghi clip"""
+        if not self.enabled or code not in self.triggers: return
+        t = time.time() if t is None else t
+        clip = self.active
+        if clip is not None:
+            # Cảnh báo tiếp theo khi clip chưa xong -> kéo dài phần "sau sự kiện"
+            clip['end_t'] = max(clip['end_t'], t + self.post)
+            clip['events'].append({'code': code, 'id': track_id, 't': t})
+            return
+        frames = [item for item in self.ring if item[0] >= t - self.pre]
+        self.active = {
+            'code': code, 'id': track_id, 't': t, 'end_t': t + self.post,
+            'events': [{'code': code, 'id': track_id, 't': t}],
+            'frames': frames, 'bytes': sum(len(f[1]) + len(f[2]) for f in frames),
+        }
+        print(f"🎬 Clip: ghi sự kiện {code} (ID {track_id}), {len(frames)} frame trước")
+
+    def _finish(self):
+        clip, self.active = self.active, None
+        try:
+            self.jobs.put_nowait(clip)
+        except queue.Full:
+            self.dropped += 1
+            print("⚠️ Clip: thread ghi còn bận, bỏ clip")
+
+    def _meta(self, objects):
+        people = []
+        for obj in objects:
+            pts = obj.get('points', [])
+            people.append({
+                'id': obj['id'],
+                'box': [int(v) for v in obj['box'][:4]],
+                'gestures': obj.get('gestures', []),
+                'kpts': [round(v, 1) for v in pts],
+            })
+        return json.dumps(people, separators=(',', ':')).encode('utf-8')
+
+    # --- Thread nền ---
+    def _run(self):
+        while True:
+            clip = self.jobs.get()
+            if clip is None: return
+            try:
+                if "disk" in self.outputs: self._write_disk(clip)
+                if "message" in self.outputs: self._send(clip)
+                self.clips += 1
+            except Exception as e:
+                print(f"⚠️ Lỗi xuất clip: {e}")
+
+    def _summary(self, clip, name):
+        return {
+            'name': name, 'code': clip['code'], 'id': clip['id'], 't': clip['t'], 'events': clip['events'],
+            'frames': [{'t': t, 'size': len(jpg), 'people': json.loads(meta)} for t, jpg, meta in clip['frames']],
+        }
+
+    def _name(self, clip):
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(clip['t']))
+        return f"clip_{stamp}_{clip['code'].lower()}"
+
+    def _write_disk(self, clip):
+        """<tên>.mjpeg (các JPEG nối liền, mở được bằng ffplay/VLC) + <tên>.json (thời điểm, metadata từng frame)"""
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = self._name(clip)
+        path = os.path.join(self.out_dir, name)
+        with open(path + ".mjpeg", "wb") as f:
+            for _, jpg, _ in clip['frames']:
+                f.write(jpg)
+        with open(path + ".json", "w") as f:
+            json.dump(self._summary(clip, name), f)
+        print(f"🎬 Clip đã lưu: {path}.mjpeg ({len(clip['frames'])} frame, {clip['bytes'] // 1024} KB)")
+
+    def _send(self, clip):
+        """Gửi từng frame (MSG_CLIP) rồi MSG_CLIP_END, nhường đường cho tin nhắn cảnh báo khi bộ đệm gửi đầy"""
+        server = self.msg_server
+        if server is None or not server.check_client() or not server.binary: return
+        limit = server.max_buffer // 2
+        written = threading.Event()
+        for t, jpg, _ in clip['frames']:
+            deadline = time.time() + 2.0
+            while server.backlog() + len(jpg) > limit:
+                if time.time() > deadline or not server.check_client(): return # PC quá chậm -> bỏ phần còn lại
+                time.sleep(0.02)
+            written.clear()
+            server.send_message(msgproto.MSG_CLIP, jpg, clip['id'], t)
+            server.core.call_soon(written.set) # call_soon theo thứ tự -> set() khi frame đã vào bộ đệm gửi
+            written.wait(1.0)
+        payload = json.dumps(self._summary(clip, self._name(clip)), separators=(',', ':')).encode('utf-8')
+        server.send_message(msgproto.MSG_CLIP_END, payload, clip['id'], clip['t'])
+
+    def close(self):
+        if self.active is not None: self._finish()
+        if self.worker.is_alive():
+            try: self.jobs.put(None, timeout=1.0)
+            except queue.Full: return
+            self.worker.join(timeout=5.0)
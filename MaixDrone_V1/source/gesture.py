@@ -1,291 +1,395 @@
-import math
-import time
-from collections import Counter # [NEW] Dùng để bỏ phiếu
+from collections import deque
+import numpy as np
+import config
+
+class RunningMean:
+    """[RING] Trung bình trượt N frame với tổng chạy: push + mean đều O(1) theo độ dài cửa sổ"""
+    def __init__(self, size, shape):
+        self.size = size
+        self.buf = np.zeros((size,) + shape, dtype=np.float64)
+        self.sum = np.zeros(shape, dtype=np.float64)
+        self.count = 0
+        self.pos = 0
+
+    def push(self, arr):
+        if self.count == self.size:
+            self.sum -= self.buf[self.pos] # Bỏ frame cũ nhất khỏi tổng
+        else:
+            self.count += 1
+        self.buf[self.pos] = arr
+        self.sum += arr
+        self.pos = (self.pos + 1) % self.size
+        # Tính lại tổng mỗi vòng để không tích luỹ sai số làm tròn (chi phí chia đều = O(1)/frame)
+        if self.pos == 0:
+            self.sum = self.buf[:self.count].sum(axis=0)
+
+    def mean(self):
+        return self.sum / max(1, self.count)
+
+    def __len__(self):
+        return self.count
+
+class VoteBuffer:
+    """
+    [RING] Bỏ phiếu cử chỉ trong N frame gần nhất với bộ đếm chạy.
+    Chỉ chấp nhận cử chỉ xuất hiện > ratio * N lần (đa số tuyệt đối) -> tối đa 1 ứng viên,
+    nên chỉ cần so sánh cử chỉ vừa thêm và cử chỉ đang dẫn đầu: O(1) mỗi frame.
+    """
+    def __init__(self, size, ratio=0.6):
+        self.size = size
+        self.threshold = size * ratio
+        self.buf = [None] * size
+        self.counts = {}
+        self.pos = 0
+        self.filled = 0
+        self.leader = None
+
+    def push(self, key):
+        """key: tuple cử chỉ (đã sort) hoặc None. Trả về cử chỉ đạt ngưỡng hoặc None"""
+        if self.filled == self.size:
+            old = self.buf[self.pos]
+            if old is not None:
+                self.counts[old] -= 1
+                if self.counts[old] == 0: del self.counts[old]
+        else:
+            self.filled += 1
+        self.buf[self.pos] = key
+        self.pos = (self.pos + 1) % self.size
+        if key is not None:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+        if key is not None and self.counts[key] > self.threshold:
+            self.leader = key
+        elif self.leader is not None and self.counts.get(self.leader, 0) <= self.threshold:
+            self.leader = None
+        return self.leader
+
+class WaveDetector:
+    """
+    [RING] Phát hiện vẫy tay từ chuỗi giá trị (có thể None) trong cửa sổ N frame, cập nhật tăng dần:
+    - Biên độ (max - min): 2 hàng đợi đơn điệu -> O(1) khấu hao
+    - Số lần đổi chiều: chỉ xét các bước nhảy >= noise giữa 2 giá trị hợp lệ liên tiếp,
+      giữ hàng đợi dấu các bước nhảy + bộ đếm đổi chiều, cập nhật khi thêm/bỏ phần tử.
+    """
+    def __init__(self, window, min_samples=10, min_amp=20, noise=10, min_changes=3):
+        self.window = window
+        self.min_samples = min_samples
+        self.min_amp = min_amp
+        self.noise = noise
+        self.min_changes = min_changes
+
+        self.seq = 0            # Số thứ tự frame tiếp theo
+        self.frames = deque()   # (seq, val) của cửa sổ hiện tại (val có thể None)
+        self.valid = 0          # Số giá trị hợp lệ trong cửa sổ
+        self.last = None        # (seq, val) hợp lệ gần nhất
+        self.maxq = deque()     # (seq, val) giảm dần
+        self.minq = deque()     # (seq, val) tăng dần
+        self.steps = deque()    # (seq của giá trị bắt đầu bước nhảy, dấu)
+        self.changes = 0
+
+    def push(self, val):
+        s = self.seq
+        self.seq += 1
+        self.frames.append((s, val))
+        if val is not None:
+            self.valid += 1
+            while self.maxq and self.maxq[-1][1] <= val: self.maxq.pop()
+            self.maxq.append((s, val))
+            while self.minq and self.minq[-1][1] >= val: self.minq.pop()
+            self.minq.append((s, val))
+            if self.last is not None:
+                diff = val - self.last[1]
+                if abs(diff) >= self.noise: # Lọc nhiễu nhỏ (coi như đứng yên)
+                    sign = 1 if diff > 0 else -1
+                    if self.steps and self.steps[-1][1] != sign:
+                        self.changes += 1
+                    self.steps.append((self.last[0], sign))
+            self.last = (s, val)
+
+        if len(self.frames) > self.window:
+            old_s, old_val = self.frames.popleft()
+            if old_val is not None:
+                self.valid -= 1
+                if self.maxq and self.maxq[0][0] == old_s: self.maxq.popleft()
+                if self.minq and self.minq[0][0] == old_s: self.minq.popleft()
+                # Bước nhảy bắt đầu từ giá trị bị bỏ cũng rời khỏi cửa sổ
+                if self.steps and self.steps[0][0] == old_s:
+                    _, sign = self.steps.popleft()
+                    if self.steps and self.steps[0][1] != sign:
+                        self.changes -= 1
+                if self.last is not None and self.last[0] == old_s:
+                    self.last = None
+
+    def is_waving(self):
+        if self.valid < self.min_samples: return False # Cần ít nhất 10 frame dữ liệu
+        # 1. Check Biên độ
+        if self.maxq[0][1] - self.minq[0][1] < self.min_amp: return False
+        # 2. Check Số lần đổi chiều (Oscillation)
+        return self.changes >= self.min_changes
+
+def _angle(v1x, v1y, v2x, v2y):
+    """|Góc| (độ) giữa 2 vector, tính cho cả mảng: atan2(cross, dot)"""
+    return np.abs(np.degrees(np.arctan2(v1x * v2y - v1y * v2x, v1x * v2x + v1y * v2y)))
+
+def _dist(kp, i, j):
+    return np.hypot(kp[:, i, 0] - kp[:, j, 0], kp[:, i, 1] - kp[:, j, 1])
+
+def _in_range(val, rng):
+    """Khoảng mở (lo, hi), None = không giới hạn"""
+    lo, hi = rng
+    mask = np.ones(val.shape, dtype=bool)
+    if lo is not None: mask &= val > lo
+    if hi is not None: mask &= val < hi
+    return mask
+
+class GestureEngine:
+    """
+    [RULES] Bộ đánh giá cử chỉ biên dịch từ bảng luật khai báo trong config.py
+    (GESTURE_ANGLES, GESTURE_RULES, GESTURE_COMBOS).
+    - Lúc khởi tạo: kiểm tra luật, chỉ giữ lại các góc mà luật đang bật thực sự dùng
+    - Mỗi frame: tính các góc đó cho TẤT CẢ người (N, 17) rồi đánh giá mọi luật trong 1 lượt vector hoá
+    - Trong 1 nhóm (body, arm_l, ...) luật đứng trước thắng (giống if/elif)
+    Input analyze(): kp (N, 17, 2), confs (N, 17), waving (N,) bool (từ WaveDetector).
+    """
+    VECTORS = ("UP", "SPINE", "SPINE_DOWN") # Vector đặc biệt dùng được trong GESTURE_ANGLES
+
+    def __init__(self, rules=None, angles=None, combos=None, min_conf=None):
+        self.min_conf = getattr(config, "GESTURE_MIN_CONF", 0.35) if min_conf is None else min_conf
+        angles = getattr(config, "GESTURE_ANGLES", {}) if angles is None else angles
+        rules = getattr(config, "GESTURE_RULES", []) if rules is None else rules
+        combos = getattr(config, "GESTURE_COMBOS", []) if combos is None else combos
+        self._compile(rules, angles, combos)
+
+    def _compile(self, rules, angles, combos):
+        self.rules = []
+        self.groups = []      # Thứ tự nhóm = thứ tự xuất hiện trong bảng luật
+        self.overrides = []   # Luật có "keep": khớp -> chỉ giữ các nhóm trong keep + tên luật
+        used = set()
+        for spec in rules:
+            if not spec.get("enabled", True): continue
+            conf = {j: self.min_conf for j in spec.get("joints", ())}
+            conf.update(spec.get("conf", {}))
+            rule = {
+                'name': spec["name"],
+                'group': spec.get("group", spec["name"]),
+                'conf': sorted(conf.items()),
+                'angles': list(spec.get("angles", {}).items()),
+                'any_angles': list(spec.get("any_angles", {}).items()),
+                'above': list(spec.get("above", ())),
+                'near': list(spec.get("near", ())),
+                'waving': spec.get("waving", None),
+                'keep': spec.get("keep", None),
+            }
+            for name, _ in rule['angles'] + rule['any_angles']:
+                if name not in angles:
+                    raise ValueError(f"Gesture rule '{rule['name']}': unknown angle '{name}'")
+                used.add(name)
+            if rule['keep'] is not None:
+                self.overrides.append(rule)
+                continue
+            if rule['group'] not in self.groups: self.groups.append(rule['group'])
+            self.rules.append(rule)
+
+        # [LAZY] Chỉ tính các góc được luật đang bật tham chiếu
+        self.angles = {}
+        for name in sorted(used):
+            spec = angles[name]
+            if len(spec) == 3: # Bộ 3 khớp (a, b, c): góc tại khớp giữa b
+                a, b, c = spec
+                spec = ((b, a), (b, c))
+            self.angles[name] = tuple(spec)
+        self.combos = [(c["name"], tuple(c["all"])) for c in combos if c.get("enabled", True)]
+
+        # Danh sách tên cử chỉ có thể xuất ra (thứ tự cố định -> mã số / bit cho giao thức nhị phân)
+        self.names = []
+        for name in [r['name'] for r in self.rules + self.overrides] + [name for name, _ in self.combos]:
+            if name not in self.names: self.names.append(name)
+
+    def _vector(self, v, kp, frame):
+        if isinstance(v, str):
+            if v not in self.VECTORS: raise ValueError(f"Unknown gesture vector '{v}'")
+            if v == "UP": return 0.0, -1.0
+            sx, sy = frame['spine']
+            return (sx, sy) if v == "SPINE" else (-sx, -sy)
+        i, j = v
+        return kp[:, j, 0] - kp[:, i, 0], kp[:, j, 1] - kp[:, i, 1]
+
+    def _ref_y(self, ref, kp, frame):
+        return frame['head_y'] if ref == "HEAD" else kp[:, ref, 1]
+
+    def _match(self, rule, kp, confs, waving, ang, frame):
+        mask = np.ones(kp.shape[0], dtype=bool)
+        for j, th in rule['conf']:
+            mask &= confs[:, j] > th
+        for name, rng in rule['angles']:
+            mask &= _in_range(ang[name], rng)
+        if rule['any_angles']:
+            any_mask = np.zeros_like(mask)
+            for name, rng in rule['any_angles']:
+                any_mask |= _in_range(ang[name], rng)
+            mask &= any_mask
+        for j, ref, k in rule['above']: # y[j] cao hơn mốc ref một đoạn k * thân người
+            mask &= kp[:, j, 1] < self._ref_y(ref, kp, frame) - k * frame['torso_len']
+        for i, j, k in rule['near']:    # 2 khớp gần nhau hơn k * độ dài tham chiếu
+            mask &= _dist(kp, i, j) < k * frame['ref_len']
+        if rule['waving'] is not None:
+            mask &= waving == bool(rule['waving'])
+        return mask
+
+    def analyze(self, kp, confs, waving):
+        """Trả về list N danh sách cử chỉ"""
+        n = kp.shape[0]
+        if n == 0: return []
+        waving = np.asarray(waving, dtype=bool)
+        c = confs > self.min_conf
+        X = kp[:, :, 0]; Y = kp[:, :, 1]
+
+        # [SCALE] Đại lượng dùng chung: cột sống, chiều dài thân, mốc đầu
+        # [SAFETY] Thiếu Hông/Vai -> giả định cột sống thẳng đứng
+        has_sho = c[:, 5] & c[:, 6]
+        has_spine = has_sho & c[:, 11] & c[:, 12]
+        mid_sho_x = (X[:, 5] + X[:, 6]) / 2; mid_sho_y = (Y[:, 5] + Y[:, 6]) / 2
+        mid_hip_x = (X[:, 11] + X[:, 12]) / 2; mid_hip_y = (Y[:, 11] + Y[:, 12]) / 2
+        sho_width = _dist(kp, 5, 6)
+        torso_len = np.where(has_spine, np.hypot(mid_sho_x - mid_hip_x, mid_sho_y - mid_hip_y),
+                             np.where(has_sho, sho_width, 1.0))
+        frame = {
+            'spine': (np.where(has_spine, mid_sho_x - mid_hip_x, 0.0), np.where(has_spine, mid_sho_y - mid_hip_y, -1.0)),
+            'torso_len': np.maximum(torso_len, 1.0),
+            # Mốc đầu: Mũi (0), không có thì Trung điểm vai
+            'head_y': np.where(X[:, 0] != 0, Y[:, 0], mid_sho_y),
+            # [FIX] Dùng độ dài Vai-Hông làm tham chiếu phụ vì khi giơ tay vai thường bị co lại
+            'ref_len': np.maximum(sho_width, np.where(X[:, 11] != 0, _dist(kp, 5, 11), 0.0)),
+        }
+
+        ang = {}
+        for name, (v1, v2) in self.angles.items():
+            v1x, v1y = self._vector(v1, kp, frame)
+            v2x, v2y = self._vector(v2, kp, frame)
+            ang[name] = _angle(v1x, v1y, v2x, v2y)
+
+        # Mỗi nhóm: chỉ số luật khớp đầu tiên (-1 = không khớp)
+        group_rules = {g: [r for r in self.rules if r['group'] == g] for g in self.groups}
+        codes = {}
+        for g, rules in group_rules.items():
+            masks = [self._match(r, kp, confs, waving, ang, frame) for r in rules]
+            codes[g] = np.select(masks, list(range(len(rules))), -1).tolist()
+        override_masks = [self._match(r, kp, confs, waving, ang, frame) for r in self.overrides]
+        override_code = np.select(override_masks, list(range(len(self.overrides))), -1).tolist() if self.overrides else [-1] * n
+
+        # Ghép kết quả (chỉ còn thao tác trên mã số nguyên)
+        results = []
+        for i in range(n):
+            if override_code[i] >= 0:
+                rule = self.overrides[override_code[i]]
+                status = [group_rules[g][codes[g][i]]['name'] for g in self.groups
+                          if g in rule['keep'] and codes[g][i] >= 0]
+                status.append(rule['name'])
+                results.append(status)
+                continue
+            status = [group_rules[g][codes[g][i]]['name'] for g in self.groups if codes[g][i] >= 0]
+            for name, members in self.combos: # [COMBO] Ghép nhiều cử chỉ thành 1
+                if all(m in status for m in members):
+                    pos = status.index(members[0])
+                    status = [s for s in status if s not in members]
+                    status.insert(pos, name)
+                    break
+            results.append(status)
+        return results
+
+class AlertTable:
+    """
+    [ALERT] Ánh xạ cử chỉ -> thông báo (config.GESTURE_ALERTS), dùng chung cho HUD, Tinker và MessageServer.
+    Nhiều cử chỉ có cảnh báo -> lấy cảnh báo có priority cao nhất.
+    """
+    def __init__(self, alerts=None):
+        alerts = getattr(config, "GESTURE_ALERTS", []) if alerts is None else alerts
+        self.by_gesture = {}
+        self.codes = [] # Mã số cảnh báo = vị trí trong danh sách + 1 (0 = không có)
+        for a in alerts:
+            if not a.get("enabled", True): continue
+            self.codes.append(a.get("code", a["text"]))
+            self.by_gesture[a["gesture"]] = {'gesture': a["gesture"], 'code': a.get("code", a["text"]),
+                                             'text': a["text"], 'priority': a.get("priority", 0),
+                                             'index': len(self.codes)}
+
+    def for_gestures(self, gestures):
+        """Cảnh báo (dict gesture/code/text/priority) của 1 người hoặc None"""
+        best = None
+        for g in gestures:
+            a = self.by_gesture.get(g)
+            if a is not None and (best is None or a['priority'] > best['priority']):
+                best = a
+        return best
+
+GESTURE_ENGINE = GestureEngine()
+GESTURE_ALERTS = AlertTable()
+
+def update_batch(estimators, keypoints_list, engine=None):
+    """
+    [BATCH] Cập nhật cử chỉ cho nhiều người: phần lịch sử (ring buffer) theo từng người,
+    phần hình học tính 1 lần cho cả nhóm. Trả về list cử chỉ đã ổn định cho từng estimator.
+    """
+    engine = engine or GESTURE_ENGINE
+    results = [[] for _ in estimators]
+    idx, kps, confs, waves = [], [], [], []
+    for i, (est, keypoints) in enumerate(zip(estimators, keypoints_list)):
+        obs = est.observe(keypoints)
+        if obs is None: continue
+        idx.append(i); kps.append(obs[0]); confs.append(obs[1]); waves.append(obs[2])
+    if not idx: return results
+
+    raw = engine.analyze(np.stack(kps), np.stack(confs), np.array(waves, dtype=bool))
+    for i, raw_gestures in zip(idx, raw):
+        results[i] = estimators[i].vote(raw_gestures)
+    return results
 
 class PoseEstimator:
+    """Trạng thái cử chỉ theo thời gian của 1 người (làm mượt, vẫy tay, bỏ phiếu).
+    Phần hình học dùng chung GestureEngine (xem update_batch)."""
     def __init__(self, history_size=5):
-        self.history = []
         self.history_size = history_size
-        self.gesture_buffer = [] # [NEW] Bộ nhớ đệm để chống rung cử chỉ
-        self.BUFFER_SIZE = 8     # Cần ổn định trong 8 frame (~0.3s) mới chốt
+        self.history = RunningMean(history_size, (17, 2)) # [RING] Trung bình trượt toạ độ khớp
+        self.BUFFER_SIZE = getattr(config, "GESTURE_BUFFER_SIZE", 8) # Cần ổn định trong 8 frame (~0.3s) mới chốt
+        self.gesture_buffer = VoteBuffer(self.BUFFER_SIZE, 0.6) # [RING] Bỏ phiếu chống rung cử chỉ
         
         # [WAVE DYNAMIC] Lịch sử vector tương đối (Cổ tay - Khuỷu tay) cho tay phải
-        self.rw_wave_hist = []
-        self.WAVE_LEN = 20       # Cửa sổ xét dao động (~0.6s)
+        self.WAVE_LEN = getattr(config, "GESTURE_WAVE_LEN", 20) # Cửa sổ xét dao động (~0.6s)
+        self.rw_wave = WaveDetector(self.WAVE_LEN, min_samples=10, min_amp=20, noise=10, min_changes=3)
 
     def update(self, keypoints):
         """
         Input: keypoints list [x1, y1, c1, x2, y2, c2, ...]
         Output: List of status strings (e.g., ["Standing", "Hands Up"])
         """
-        if not keypoints or len(keypoints) < 17 * 3: return []
+        return update_batch([self], [keypoints])[0]
+
+    def observe(self, keypoints):
+        """Cập nhật lịch sử với frame mới. Trả về (avg_kpts (17, 2), confs (17,), waving) hoặc None"""
+        if keypoints is None or len(keypoints) < 17 * 3: return None
         
         # 1. Parse Keypoints (x, y, conf)
-        current_kpts = []
-        current_confs = [] # [NEW] Lưu độ tin cậy
-        for i in range(0, len(keypoints), 3):
-            current_kpts.append((keypoints[i], keypoints[i+1]))
-            current_confs.append(keypoints[i+2])
+        kp = np.asarray(keypoints[:17 * 3], dtype=np.float64).reshape(17, 3)
             
         # [WAVE DYNAMIC] Cập nhật dữ liệu thô (Raw Data)
         # Tính chênh lệch X giữa Cổ tay phải (10) và Khuỷu tay phải (8)
-        # Index trong list phẳng: Elbow=24, Wrist=30
         val = None
-        if len(keypoints) >= 33:
-            if keypoints[26] > 0.4 and keypoints[32] > 0.4: # Conf > 0.4
-                val = keypoints[30] - keypoints[24] # Delta X
-        
-        self.rw_wave_hist.append(val)
-        if len(self.rw_wave_hist) > self.WAVE_LEN:
-            self.rw_wave_hist.pop(0)
+        if kp[8, 2] > 0.4 and kp[10, 2] > 0.4: # Conf > 0.4
+            val = float(kp[10, 0] - kp[8, 0]) # Delta X
+        self.rw_wave.push(val)
             
         # 2. Smooth Keypoints (Moving Average)
-        self.history.append(current_kpts)
-        if len(self.history) > self.history_size:
-            self.history.pop(0)
-
-        avg_kpts = []
-        for i in range(17):
-            sx = sum(frame[i][0] for frame in self.history)
-            sy = sum(frame[i][1] for frame in self.history)
-            n = len(self.history)
-            avg_kpts.append((sx/n, sy/n))
-
-        # 3. Phân tích cử chỉ (kèm độ tin cậy)
-        raw_gestures = self._analyze(avg_kpts, current_confs)
-        
-        # 4. [SMART] Cơ chế Bỏ phiếu (Voting)
-        # Chỉ trả về cử chỉ nếu nó xuất hiện liên tục (ổn định)
-        if raw_gestures:
-            self.gesture_buffer.append(tuple(sorted(raw_gestures))) # Lưu dưới dạng tuple để hash được
-        else:
-            self.gesture_buffer.append(None)
-            
-        if len(self.gesture_buffer) > self.BUFFER_SIZE:
-            self.gesture_buffer.pop(0)
-            
-        # Đếm tần suất xuất hiện trong buffer
-        valid_gestures = [g for g in self.gesture_buffer if g is not None]
-        if not valid_gestures: return []
-        
-        most_common, count = Counter(valid_gestures).most_common(1)[0]
-        
-        # Ngưỡng chấp nhận: Phải xuất hiện > 60% trong buffer
-        if count > (self.BUFFER_SIZE * 0.6):
-            return list(most_common)
-        else:
-            return []
-
-    def _analyze(self, kp, confs):
-        # Helper: Vector Math
-        def vec(p1, p2): return (p2[0] - p1[0], p2[1] - p1[1])
-        def dot(v1, v2): return v1[0]*v2[0] + v1[1]*v2[1]
-        def cross(v1, v2): return v1[0]*v2[1] - v1[1]*v2[0]
-        def angle(v1, v2): return math.degrees(math.atan2(cross(v1, v2), dot(v1, v2)))
-        def dist(p1, p2): return math.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
-        
-        # Indices (COCO)
-        # 5,6: Shoulders | 11,12: Hips | 7,8: Elbows | 9,10: Wrists | 13,14: Knees
-        
-        status = []
-        UP = (0, -1)
-        
-        # [SMART] Ngưỡng tin cậy tối thiểu để tính toán góc (tránh rác)
-        MIN_CONF = 0.35
-
-        # [SAFETY] Kiểm tra nếu thiếu các điểm quan trọng (Vai hoặc Hông)
-        # Nếu thiếu Hông (11, 12) -> Không thể tính Spine -> Bỏ qua Body State
-        has_hips = (confs[11] > MIN_CONF and confs[12] > MIN_CONF)
-        has_shoulders = (confs[5] > MIN_CONF and confs[6] > MIN_CONF)
-
-        # [SCALE] Chuẩn hoá theo kích thước cơ thể để ổn định mọi khoảng cách
-        if has_hips and has_shoulders:
-            mid_sho = ((kp[5][0]+kp[6][0])/2, (kp[5][1]+kp[6][1])/2)
-            mid_hip = ((kp[11][0]+kp[12][0])/2, (kp[11][1]+kp[12][1])/2)
-            torso_len = dist(mid_sho, mid_hip)
-        elif has_shoulders:
-            torso_len = dist(kp[5], kp[6])
-        else:
-            torso_len = 1.0
-        if torso_len < 1.0: torso_len = 1.0
-
-        # --- 1. BODY STATE (Standing/Sitting/Lying) ---
-        # Spine Vector (Mid-Hip to Mid-Shoulder)
-        if has_hips and has_shoulders:
-            mid_sho = ((kp[5][0]+kp[6][0])/2, (kp[5][1]+kp[6][1])/2)
-            mid_hip = ((kp[11][0]+kp[12][0])/2, (kp[11][1]+kp[12][1])/2)
-            spine = vec(mid_hip, mid_sho)
-            
-            spine_angle = abs(angle(UP, spine))
-            
-            body_pose = "Khong Ro"
-            if spine_angle < 30: # Upright
-                # Check Legs for Sitting vs Standing
-                # Thigh Vector (Hip to Knee) vs Spine
-                l_thigh = vec(kp[11], kp[13])
-                r_thigh = vec(kp[12], kp[14])
-                
-                # Angle between Spine (Up) and Thigh (Down)
-                # If standing, thigh goes down (~180 deg from spine). If sitting, thigh goes forward (~90 deg).
-                # Let's use relative angle to Spine vector (which points UP)
-                # Thigh points DOWN. So angle should be ~180.
-                l_leg_ang = abs(angle(spine, l_thigh))
-                r_leg_ang = abs(angle(spine, r_thigh))
-                
-                if l_leg_ang > 150 or r_leg_ang > 150:
-                    body_pose = "Dung"
-                elif l_leg_ang < 120 or r_leg_ang < 120:
-                    body_pose = "Ngoi"
-                else:
-                    body_pose = "Dung"
-            elif spine_angle < 70:
-                body_pose = "Nghieng"
-            else:
-                body_pose = "Nam"
-                
-            status.append(body_pose)
-        else:
-            # Nếu không thấy hông, giả định Spine thẳng đứng để tính tay
-            spine = (0, -1) 
-            spine_down = (0, 1)
-
-        # --- 2. ARM STATE (Control Signals) ---
-        # [STRICT LOGIC] Góc A (Vai) và Góc B (Khuỷu)
-        # Góc A: Giữa thân dưới (Spine Down) và bắp tay (Vai -> Khuỷu)
-        # Góc B: Góc trong khuỷu tay (180 là thẳng, 90 là vuông)
-        
-        if has_hips and has_shoulders:
-            spine_down = (-spine[0], -spine[1])
-        else:
-            spine_down = (0, 1)
-
-        l_status = None
-        r_status = None
-
-        # --- TAY TRÁI (Left Arm) ---
-        # Cần: Vai(5), Khuỷu(7), Cổ tay(9)
-        # [SMART] Chỉ tính nếu AI nhìn rõ cả 3 khớp
-        if confs[5] > MIN_CONF and confs[7] > MIN_CONF and confs[9] > MIN_CONF:
-            # Góc A: Thân dưới vs Vai->Khuỷu
-            v_sho_elb = vec(kp[5], kp[7])
-            ang_A = abs(angle(spine_down, v_sho_elb))
-            
-            # Góc B: Khuỷu->Vai vs Khuỷu->Cổ tay (Góc trong khuỷu tay)
-            v_elb_sho = vec(kp[7], kp[5])
-            v_elb_wri = vec(kp[7], kp[9])
-            ang_B = abs(angle(v_elb_sho, v_elb_wri))
-            
-            # [NEW] Góc C: Vai->Hông vs Vai->Cổ tay
-            ang_C = 0
-            if confs[11] > MIN_CONF:
-                v_sho_hip = vec(kp[5], kp[11])
-                v_sho_wri = vec(kp[5], kp[9])
-                ang_C = abs(angle(v_sho_hip, v_sho_wri))
-            
-            wrist_up = (kp[9][1] < kp[5][1] - 0.2 * torso_len)
-            if 140 < ang_A < 180 and 75 < ang_B < 90:
-                l_status = "Trai Cao Vuong"
-            elif 70 < ang_A < 100 and 60 < ang_B < 100:
-                l_status = "Trai Vuong"
-            elif 70 < ang_A < 100 and 140 < ang_B < 180:
-                l_status = "Trai Ngang"
-            elif 150 < ang_C < 180 and wrist_up:
-                l_status = "Trai Cao"
-
-        # --- TAY PHẢI (Right Arm) ---
-        # Cần: Vai(6), Khuỷu(8), Cổ tay(10)
-        # [SMART] Chỉ tính nếu AI nhìn rõ cả 3 khớp
-        if confs[6] > MIN_CONF and confs[8] > MIN_CONF and confs[10] > MIN_CONF:
-            # Góc A: Thân dưới vs Vai->Khuỷu
-            v_sho_elb = vec(kp[6], kp[8])
-            ang_A = abs(angle(spine_down, v_sho_elb))
-            
-            # Góc B: Khuỷu->Vai vs Khuỷu->Cổ tay
-            v_elb_sho = vec(kp[8], kp[6])
-            v_elb_wri = vec(kp[8], kp[10])
-            ang_B = abs(angle(v_elb_sho, v_elb_wri))
-            
-            # [NEW] Góc C: Vai->Hông vs Vai->Cổ tay
-            ang_C = 0
-            if confs[12] > MIN_CONF:
-                v_sho_hip = vec(kp[6], kp[12])
-                v_sho_wri = vec(kp[6], kp[10])
-                ang_C = abs(angle(v_sho_hip, v_sho_wri))
-            
-            wrist_up = (kp[10][1] < kp[6][1] - 0.2 * torso_len)
-            if 140 < ang_A < 180 and 75 < ang_B < 90:
-                r_status = "Phai Cao Vuong"
-            elif 70 < ang_A < 100 and 60 < ang_B < 100:
-                r_status = "Phai Vuong"
-            elif 70 < ang_A < 100 and 140 < ang_B < 180:
-                r_status = "Phai Ngang"
-            # [UPDATE] Mở rộng góc A lên 180 để bắt được tay giơ thẳng đứng
-            elif 150 < ang_C < 180 and wrist_up:
-                r_status = "Phai Cao"
-
-        # --- 3. COMBINED GESTURES (Tư thế phối hợp) ---
-        # Logic mới: Kết hợp từ trạng thái đơn lẻ "Cao Vuong"
-
-        # Tổng hợp trạng thái
-        # [UPDATE] Ưu tiên hiển thị tư thế kết hợp, ẩn tư thế con
-        
-        # [NEW LOGIC] Cheo Tay Tren Dau (Emergency Stop) - Hình học
-        is_crossed = False
-        # [SMART] Yêu cầu độ tin cậy cao hơn cho hành động quan trọng này
-        if has_shoulders and confs[9] > 0.4 and confs[10] > 0.4:
-            # Mốc Y: Mũi (0) hoặc Trung điểm vai
-            ref_y = kp[0][1] if kp[0][0] != 0 else (kp[5][1] + kp[6][1])/2
-            # Check 1: Tay cao hơn đầu
-            wrists_up = kp[9][1] < ref_y and kp[10][1] < ref_y
-            # Check 2: Hai tay gần nhau
-            sho_width = dist(kp[5], kp[6])
-            
-            # [FIX] Dùng độ dài thân (Vai-Hông) làm tham chiếu phụ vì khi giơ tay vai thường bị co lại
-            torso_len = dist(kp[5], kp[11]) if kp[11][0] != 0 else 0
-            ref_len = max(sho_width, torso_len) # Lấy thước đo lớn hơn để ổn định
-            
-            wrist_dist = dist(kp[9], kp[10])
-            if wrists_up and wrist_dist < (ref_len * 0.8):
-                is_crossed = True
+        self.history.push(kp[:, :2])
+        return self.history.mean(), kp[:, 2], self.rw_wave.is_waving()
 
-        if is_crossed:
-            status.append("Cheo Tay Tren Dau")
-        else:
-            # --- [NEW] DYNAMIC WAVE LOGIC (User Request) ---
-            # Xét dao động của vector Cổ tay - Khuỷu tay (Biên độ > 15px, Đổi chiều >= 2 lần)
-            def check_right_wave_dynamic():
-                data = [x for x in self.rw_wave_hist if x is not None]
-                if len(data) < 10: return False # Cần ít nhất 10 frame dữ liệu
-                
-                # 1. Check Biên độ (15px)
-                amp = max(data) - min(data)
-                if amp < 20: return False
-                
-                # 2. Check Số lần đổi chiều (Oscillation)
-                changes = 0
-                last_dir = 0
-                for i in range(1, len(data)):
-                    diff = data[i] - data[i-1]
-                    if abs(diff) < 10: continue # Lọc nhiễu nhỏ (<3px coi như đứng yên)
-                    curr_dir = 1 if diff > 0 else -1
-                    if last_dir != 0 and curr_dir != last_dir:
-                        changes += 1
-                    last_dir = curr_dir
-                
-                return changes >= 3
-
-            # Ưu tiên logic động này cho tay phải (Ghi đè logic tĩnh)
-            if check_right_wave_dynamic():
-                # Vẫn cần điều kiện: Cổ tay cao hơn Khuỷu tay (để tránh lúc đi bộ đánh tay thấp)
-                if kp[10][1] < kp[8][1]:
-                    r_status = "Vay Tay Phai"
-
-            if l_status == "Trai Ngang" and r_status == "Phai Ngang":
-                status.append("Hai Tay Ngang")
-            elif l_status == "Trai Cao" and r_status == "Phai Cao":
-                status.append("Tay Chu V")
-            else:
-                if l_status: status.append(l_status)
-                if r_status: status.append(r_status)
-        
-        return status
+    def alert_pending(self):
+        """[SCHEDULER] Có cử chỉ cảnh báo trong cửa sổ bỏ phiếu (đã chốt hoặc đang là ứng viên),
+        hoặc tay phải bắt đầu dao động -> cần dữ liệu AI dày để cửa sổ bỏ phiếu/vẫy tay không bị giãn"""
+        if self.rw_wave.changes > 0: return True
+        return any(GESTURE_ALERTS.for_gestures(key) for key in self.gesture_buffer.counts)
+
+    def vote(self, raw_gestures):
+        """[SMART] Cơ chế Bỏ phiếu: chỉ trả về cử chỉ xuất hiện > 60% trong buffer (ổn định)"""
+        key = tuple(sorted(raw_gestures)) if raw_gestures else None # Lưu dưới dạng tuple để hash được
+        stable = self.gesture_buffer.push(key)
+        return list(stable) if stable else []
@@ -0,0 +1,75 @@
+# source/jpegcache.py
+import threading
+import time
+from collections import OrderedDict
+import config
+from source.profiler import PROFILER
+
+class EncodedFrame:
+    """
+    [CACHE] Các bản JPEG của 1 frame, khoá (quality, width, height).
+    Chỉ nén khi có người cần (lazy) và mỗi biến thể nén đúng 1 lần, dù Stream, Tin nhắn hay Ghi clip cùng yêu cầu.
+    """
+    def __init__(self, frame_id, img, cache=None):
+        self.frame_id = frame_id
+        self.img = img
+        self.width, self.height = img.width(), img.height()
+        self.cache = cache
+        self.variants = {} # (quality, w, h) -> bytes
+        self.lock = threading.Lock()
+
+    def size_for(self, scale=1.0):
+        w, h = self.width, self.height
+        if scale >= 1.0: return w, h
+        # Bội số 8 cho bộ nén JPEG
+        return max(8, int(w * scale) // 8 * 8), max(8, int(h * scale) // 8 * 8)
+
+    def jpeg(self, quality, scale=1.0):
+        """Bytes JPEG ở quality/tỷ lệ yêu cầu (nén nếu chưa có). None nếu chưa có bản này và frame đã bị đẩy khỏi cache"""
+        w, h = self.size_for(scale)
+        key = (int(quality), w, h)
+        with self.lock:
+            data = self.variants.get(key)
+            if data is not None:
+                if self.cache: self.cache.hits += 1
+                return data
+            img = self.img
+            if img is None: return None
+            if (w, h) != (self.width, self.height):
+                img = img.resize(w, h)
+            t0 = time.perf_counter()
+            data = img.to_jpeg(quality=int(quality)).to_bytes()
+            PROFILER.lap("jpeg", t0) # [PROFILE] Chỉ tính lần nén thật (không tính lần dùng lại)
+            self.variants[key] = data
+            if self.cache: self.cache.encodes += 1
+            return data
+
+    def best(self):
+        """Bản đã nén có quality cao nhất (hoặc None) - dùng lại thay vì nén thêm"""
+        with self.lock:
+            if not self.variants: return None
+            return self.variants[max(self.variants, key=lambda k: (k[1] * k[2], k[0]))]
+
+    def release(self):
+        """Bỏ ảnh gốc (giữ lại các bản JPEG đã nén)"""
+        self.img = None
+
+class JpegCache:
+    """Giữ EncodedFrame của vài frame gần nhất, tra theo frame id (dùng chung cho mọi đầu ra)"""
+    def __init__(self, max_frames=None):
+        self.max_frames = max_frames or getattr(config, "JPEG_CACHE_FRAMES", 2)
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        self.encodes = 0 # Số lần nén thật
+        self.hits = 0    # Số lần dùng lại bản đã nén
+
+    def frame(self, frame_id, img):
+        with self.lock:
+            entry = self.frames.get(frame_id)
+            if entry is None:
+                entry = EncodedFrame(frame_id, img, self)
+                self.frames[frame_id] = entry
+                while len(self.frames) > self.max_frames:
+                    _, old = self.frames.popitem(last=False)
+                    old.release()
+            return entry
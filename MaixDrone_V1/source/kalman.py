@@ -0,0 +1,120 @@
+# source/kalman.py
+import numpy as np
+
+class KalmanBoxBank:
+    """
+    [BATCH] Bộ lọc Kalman vận tốc không đổi (constant-velocity) cho TẤT CẢ track.
+    State mỗi track: [cx, cy, w, h, vx, vy, vw, vh] (px và px/s), lưu liên tục trong mảng NumPy.
+    Nhiễu tỷ lệ theo chiều cao box (người xa rung ít px hơn người gần), giống DeepSORT.
+    Các độ lệch chuẩn được cho theo "mỗi frame ở REF_FPS" rồi quy đổi theo dt thực tế (giây).
+    """
+    REF_FPS = 30.0
+    DIM = 8
+
+    def __init__(self, capacity=8, std_pos=1.0 / 20, std_vel=1.0 / 160, std_meas=1.0 / 20, max_dt=1.0):
+        self.std_pos = std_pos   # Nhiễu quá trình của vị trí (x chiều cao box)
+        self.std_vel = std_vel   # Nhiễu quá trình của vận tốc (x chiều cao box)
+        self.std_meas = std_meas # Nhiễu đo của AI (x chiều cao box)
+        self.max_dt = max_dt     # Safety: không ngoại suy quá 1s
+        self.slots = {}          # oid -> slot
+        self.free = []
+        self.x = np.zeros((0, self.DIM))
+        self.P = np.zeros((0, self.DIM, self.DIM))
+        self.t = np.zeros((0,))
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        n_old = self.x.shape[0]
+        x = np.zeros((capacity, self.DIM)); x[:n_old] = self.x
+        P = np.tile(np.eye(self.DIM), (capacity, 1, 1)); P[:n_old] = self.P
+        t = np.zeros((capacity,)); t[:n_old] = self.t
+        self.x, self.P, self.t = x, P, t
+        self.free.extend(range(capacity - 1, n_old - 1, -1))
+
+    def slots_of(self, oids):
+        return np.array([self.slots[oid] for oid in oids], dtype=np.intp)
+
+    def init(self, oid, box, t):
+        """Khởi tạo track mới từ box [x, y, w, h], vận tốc = 0 (độ bất định vận tốc lớn)"""
+        if oid in self.slots:
+            slot = self.slots[oid]
+        else:
+            if not self.free:
+                self._alloc(max(8, self.x.shape[0] * 2))
+            slot = self.free.pop()
+            self.slots[oid] = slot
+        x, y, w, h = [float(v) for v in box[:4]]
+        self.x[slot] = [x + w / 2, y + h / 2, w, h, 0, 0, 0, 0]
+        hh = max(h, 1.0)
+        std = np.array([2 * self.std_pos * hh] * 4 + [10 * self.std_vel * hh * self.REF_FPS] * 4)
+        self.P[slot] = np.diag(std ** 2)
+        self.t[slot] = t
+
+    def release(self, oid):
+        slot = self.slots.pop(oid, None)
+        if slot is not None:
+            self.free.append(slot)
+
+    def _predict_arrays(self, slots, t):
+        """Dự đoán (không ghi lại) state + hiệp phương sai của các slot đến thời điểm t"""
+        x = self.x[slots]
+        P = self.P[slots]
+        dt = np.clip(t - self.t[slots], 0.0, self.max_dt)
+        m = len(slots)
+
+        F = np.tile(np.eye(self.DIM), (m, 1, 1))
+        F[:, 0:4, 4:8] = np.eye(4) * dt[:, None, None]
+        x = x.copy()
+        x[:, 0:4] += x[:, 4:8] * dt[:, None]
+
+        # Nhiễu quá trình tỷ lệ với số frame (ở REF_FPS) đã trôi qua; vận tốc tính theo px/s
+        hh = np.maximum(x[:, 3], 1.0)
+        steps = dt * self.REF_FPS
+        q_pos = (self.std_pos * hh) ** 2 * steps
+        q_vel = (self.std_vel * hh * self.REF_FPS) ** 2 * steps
+        Q = np.zeros((m, self.DIM, self.DIM))
+        idx = np.arange(4)
+        Q[:, idx, idx] = q_pos[:, None]
+        Q[:, idx + 4, idx + 4] = q_vel[:, None]
+        P = F @ P @ np.transpose(F, (0, 2, 1)) + Q
+        return x, P
+
+    def predict(self, oids, t):
+        """Box dự đoán (N, 4) [x, y, w, h] tại thời điểm t (không thay đổi trạng thái)"""
+        if not oids: return np.zeros((0, 4))
+        x, _ = self._predict_arrays(self.slots_of(oids), t)
+        return self.state_to_boxes(x)
+
+    def velocities(self, oids):
+        """Vận tốc (N, 4) [vx, vy, vw, vh] px/s của các track"""
+        if not oids: return np.zeros((0, 4))
+        return self.x[self.slots_of(oids), 4:8].copy()
+
+    def update(self, oids, t, boxes):
+        """Dự đoán đến t rồi hiệu chỉnh bằng box đo được (N, 4). Trả về box hậu nghiệm (N, 4)"""
+        if not oids: return np.zeros((0, 4))
+        slots = self.slots_of(oids)
+        x, P = self._predict_arrays(slots, t)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        z = np.concatenate([boxes[:, 0:2] + boxes[:, 2:4] / 2, boxes[:, 2:4]], axis=1)
+
+        hh = np.maximum(z[:, 3], 1.0)
+        r = (self.std_meas * hh) ** 2
+        S = P[:, 0:4, 0:4] + np.eye(4) * r[:, None, None]
+        PHt = P[:, :, 0:4]
+        # K = P H^T S^-1 (S đối xứng -> giải hệ thay vì nghịch đảo)
+        K = np.transpose(np.linalg.solve(S, np.transpose(PHt, (0, 2, 1))), (0, 2, 1))
+        innov = z - x[:, 0:4]
+        x = x + (K @ innov[:, :, None])[:, :, 0]
+        P = P - K @ P[:, 0:4, :]
+
+        self.x[slots] = x
+        self.P[slots] = P
+        self.t[slots] = t
+        return self.state_to_boxes(x)
+
+    @staticmethod
+    def state_to_boxes(x):
+        w = np.maximum(x[:, 2], 1.0)
+        h = np.maximum(x[:, 3], 1.0)
+        return np.stack([x[:, 0] - w / 2, x[:, 1] - h / 2, w, h], axis=1)
@@ -0,0 +1,89 @@
+# source/motion.py
+import time
+import numpy as np
+import config
+from maix import image
+
+class MotionGate:
+    """
+    [MOTION GATE] Phát hiện thay đổi rẻ tiền để bỏ qua NPU khi cảnh đứng yên.
+    - Thu nhỏ frame về ảnh xám MOTION_THUMB_SIZE, so với ảnh mẫu chụp ở lần chạy AI gần nhất
+    - Chia lưới MOTION_BLOCKS, khối có độ lệch sáng trung bình > MOTION_PIXEL_THRESHOLD là khối "động"
+    - Trễ (hysteresis): tỷ lệ khối động >= MOTION_ON_RATIO -> có chuyển động ngay;
+      phải < MOTION_OFF_RATIO liên tục MOTION_HOLD_FRAMES frame mới coi là đứng yên
+    - Đứng yên quá MOTION_MAX_IDLE giây -> vẫn chạy AI 1 lần để làm mới (người mới vào chậm, track hết hạn...)
+    """
+    def __init__(self):
+        self.thumb_w, self.thumb_h = getattr(config, "MOTION_THUMB_SIZE", (64, 48))
+        self.blocks_x, self.blocks_y = getattr(config, "MOTION_BLOCKS", (8, 6))
+        self.pixel_th = getattr(config, "MOTION_PIXEL_THRESHOLD", 12)
+        self.on_ratio = getattr(config, "MOTION_ON_RATIO", 0.03)
+        self.off_ratio = getattr(config, "MOTION_OFF_RATIO", 0.01)
+        self.hold_frames = getattr(config, "MOTION_HOLD_FRAMES", 15)
+        self.max_idle = getattr(config, "MOTION_MAX_IDLE", 2.0)
+        # Cắt thumbnail vừa khít lưới khối
+        self.bw = max(1, self.thumb_w // self.blocks_x)
+        self.bh = max(1, self.thumb_h // self.blocks_y)
+
+        self.reference = None # Ảnh xám (int16) lúc chạy AI gần nhất
+        self.current = None
+        self.t_ref = 0.0
+        self.moving = True
+        self.quiet = 0        # Số frame liên tiếp dưới MOTION_OFF_RATIO
+        self.ratio = 0.0      # Tỷ lệ khối động của frame gần nhất
+        self.frames = 0
+        self.skipped = 0
+
+    def thumbnail(self, img):
+        """Ảnh maix -> mảng xám (thumb_h, thumb_w) uint8 (thu nhỏ trước rồi mới đổi sang xám: rẻ)"""
+        small = img.resize(self.thumb_w, self.thumb_h)
+        if small.format() != image.Format.FMT_GRAYSCALE:
+            small = small.to_format(image.Format.FMT_GRAYSCALE)
+        return np.frombuffer(small.to_bytes(), dtype=np.uint8).reshape(self.thumb_h, self.thumb_w)
+
+    def block_ratio(self, gray):
+        """Tỷ lệ khối có độ lệch sáng trung bình so với ảnh mẫu > ngưỡng"""
+        h, w = self.blocks_y * self.bh, self.blocks_x * self.bw
+        diff = np.abs(gray[:h, :w] - self.reference[:h, :w])
+        blocks = diff.reshape(self.blocks_y, self.bh, self.blocks_x, self.bw).mean(axis=(1, 3))
+        return float(np.count_nonzero(blocks > self.pixel_th)) / blocks.size
+
+    def check(self, img=None, gray=None, t=None):
+        """True nếu cần chạy AI (có chuyển động / chưa có ảnh mẫu / quá MOTION_MAX_IDLE). gray: mảng xám có sẵn"""
+        t = time.time() if t is None else t
+        self.frames += 1
+        if gray is None: gray = self.thumbnail(img)
+        self.current = gray.astype(np.int16)
+        if self.reference is None or self.reference.shape != self.current.shape:
+            return True
+
+        self.ratio = self.block_ratio(self.current)
+        if self.ratio >= self.on_ratio:
+            self.moving = True
+            self.quiet = 0
+        elif self.ratio < self.off_ratio:
+            self.quiet += 1
+            if self.quiet >= self.hold_frames: self.moving = False
+        else:
+            self.quiet = 0 # Vùng giữa 2 ngưỡng: giữ nguyên trạng thái
+
+        if self.moving or t - self.t_ref >= self.max_idle:
+            return True
+        self.skipped += 1
+        return False
+
+    def accept(self, t=None):
+        """Frame vừa kiểm tra được chạy AI -> làm ảnh mẫu mới"""
+        if self.current is None: return
+        self.reference = self.current
+        self.t_ref = time.time() if t is None else t
+
+    def reset(self):
+        """Buộc lần check() tiếp theo chạy AI (VD: bật lại AI, client mới)"""
+        self.reference = None
+        self.moving = True
+        self.quiet = 0
+
+    def skip_ratio(self):
+        """Tỷ lệ frame bỏ qua AI nhờ cảnh đứng yên"""
+        return self.skipped / self.frames if self.frames else 0.0
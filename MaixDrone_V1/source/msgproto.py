@@ -0,0 +1,63 @@
+# source/msgproto.py
+# Giao thức nhị phân của cổng tin nhắn 8888 (Drone -> PC). Chỉ dùng thư viện chuẩn -> chạy được cả trên PC.
+import struct
+
+# Header (little-endian, 20 byte): magic "MD", version u8, type u8, timestamp f64 (epoch), track id i32 (-1 = không có),
+# độ dài payload u32. Payload ngay sau header, không mã hoá lại (JPEG gửi nguyên bản).
+HEADER = struct.Struct("<2sBBdiI")
+MAGIC = b"MD"
+VERSION = 1
+
+MSG_ALERT = 1   # Payload: text UTF-8 (VD: "emergency stop")
+MSG_CLEAR = 2   # Hết cảnh báo, payload rỗng
+MSG_IMAGE = 3   # Payload: JPEG ảnh bằng chứng
+MSG_TEXT = 4    # Payload: text UTF-8 khác
+MSG_CLIP = 5    # Payload: 1 frame JPEG của clip sự kiện (timestamp = thời điểm chụp)
+MSG_CLIP_END = 6 # Payload: JSON mô tả clip (sự kiện, thời điểm, metadata tracker từng frame)
+
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+def pack_header(msg_type, timestamp, track_id=-1, length=0):
+    return HEADER.pack(MAGIC, VERSION, msg_type, timestamp, track_id, length)
+
+class FrameReader:
+    """
+    Tách frame từ luồng TCP. feed(bytes) rồi duyệt frames():
+    mỗi frame = (type, timestamp, track_id, payload) với payload là memoryview trỏ thẳng vào bộ đệm (không copy).
+    Dùng xong payload trước lần feed() tiếp theo (hoặc tự bytes(payload) nếu cần giữ lâu).
+    """
+    def __init__(self, max_payload=MAX_PAYLOAD):
+        self.buf = bytearray()
+        self.start = 0 # Vị trí byte chưa xử lý đầu tiên
+        self.max_payload = max_payload
+        self.skipped = 0 # Số byte rác bị bỏ qua khi dò lại magic
+
+    def feed(self, data):
+        try:
+            if self.start:
+                del self.buf[:self.start] # Dồn bộ đệm (phần đã xử lý)
+                self.start = 0
+            self.buf += data
+        except BufferError:
+            # Người dùng vẫn giữ payload cũ -> tạo bộ đệm mới, payload cũ vẫn hợp lệ
+            self.buf = self.buf[self.start:] + data
+            self.start = 0
+
+    def frames(self):
+        view = memoryview(self.buf)
+        try:
+            while len(self.buf) - self.start >= HEADER.size:
+                magic, version, msg_type, ts, track_id, length = HEADER.unpack_from(self.buf, self.start)
+                if magic != MAGIC or version != VERSION or length > self.max_payload:
+                    # Lệch khung -> dò tới magic tiếp theo
+                    nxt = self.buf.find(MAGIC, self.start + 1)
+                    end = nxt if nxt >= 0 else len(self.buf) - 1
+                    self.skipped += end - self.start
+                    self.start = end
+                    continue
+                begin = self.start + HEADER.size
+                if len(self.buf) < begin + length: break # Chưa nhận đủ payload
+                self.start = begin + length
+                yield msg_type, ts, track_id, view[begin:begin + length]
+        finally:
+            view.release()
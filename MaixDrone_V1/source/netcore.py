@@ -0,0 +1,280 @@
+# source/netcore.py
+import heapq
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from source.profiler import PROFILER
+
+class NetCore(threading.Thread):
+    """
+    [I/O] 1 thread mạng duy nhất (selectors) sở hữu mọi socket: cổng Web, cổng tin nhắn, kết nối Tinkerboard.
+    - Thread xử lý ảnh KHÔNG gọi select/accept/connect nữa, chỉ gửi dữ liệu qua call_soon() (thread-safe)
+    - Mọi socket đều non-blocking, ghi qua bộ đệm; kết nối lại và timeout dùng call_later() (timer)
+    """
+    def __init__(self):
+        super().__init__(name="netcore", daemon=True)
+        self.sel = selectors.DefaultSelector()
+        self.calls = deque()
+        self.lock = threading.Lock()
+        self.timers = [] # heap (thời điểm, seq, fn, args)
+        self._seq = 0
+        self._wake_pending = False
+        self._rsock, self._wsock = socket.socketpair() # Đánh thức select() khi có việc từ thread khác
+        self._rsock.setblocking(False)
+        self._wsock.setblocking(False)
+        self.sel.register(self._rsock, selectors.EVENT_READ, self._on_wakeup)
+        self.running = False
+
+    def call_soon(self, fn, *args):
+        """[THREAD-SAFE] Chạy fn(*args) trong thread mạng"""
+        with self.lock:
+            self.calls.append((fn, args))
+            if self._wake_pending: return
+            self._wake_pending = True
+        try: self._wsock.send(b"\0")
+        except OSError: pass
+
+    def call_later(self, delay, fn, *args):
+        """Hẹn giờ chạy fn(*args) sau delay giây (chỉ gọi trong thread mạng)"""
+        self._seq += 1
+        heapq.heappush(self.timers, (time.time() + delay, self._seq, fn, args))
+
+    def set_events(self, sock, events, callback):
+        """Đăng ký / đổi / huỷ (events = 0) theo dõi socket. callback(sock, mask)"""
+        try:
+            key = self.sel.get_key(sock)
+        except (KeyError, ValueError):
+            key = None
+        if not events:
+            if key is not None: self.sel.unregister(sock)
+        elif key is None:
+            self.sel.register(sock, events, callback)
+        elif key.events != events or key.data is not callback:
+            self.sel.modify(sock, events, callback)
+
+    def _on_wakeup(self, sock, mask):
+        try:
+            while sock.recv(512): pass
+        except OSError: pass
+
+    def run(self):
+        self.running = True
+        while self.running:
+            timeout = 1.0
+            if self.timers:
+                timeout = min(timeout, max(0.0, self.timers[0][0] - time.time()))
+            for key, mask in self.sel.select(timeout):
+                try:
+                    key.data(key.fileobj, mask)
+                except Exception as e:
+                    print(f"⚠️ NetCore Error: {e}")
+
+            now = time.time()
+            while self.timers and self.timers[0][0] <= now:
+                _, _, fn, args = heapq.heappop(self.timers)
+                self._run(fn, args)
+
+            with self.lock:
+                calls, self.calls = self.calls, deque()
+                self._wake_pending = False
+            for fn, args in calls:
+                self._run(fn, args)
+
+    def _run(self, fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"⚠️ NetCore Error: {e}")
+
+    def stop(self):
+        self.running = False
+        self.call_soon(lambda: None)
+
+_core = None
+_core_lock = threading.Lock()
+
+def get_core():
+    """NetCore dùng chung của cả chương trình (tự khởi động lần đầu)"""
+    global _core
+    with _core_lock:
+        if _core is None:
+            _core = NetCore()
+            _core.start()
+        return _core
+
+class Connection:
+    """
+    Socket non-blocking với bộ đệm ghi (chỉ dùng trong thread mạng).
+    write() gửi ngay phần socket nhận được, phần còn lại chờ EVENT_WRITE. Không bao giờ chặn.
+    """
+    def __init__(self, core, sock, addr, on_data=None, on_close=None):
+        self.core = core
+        self.sock = sock
+        self.addr = addr
+        self.on_data = on_data    # on_data(conn, bytes)
+        self.on_close = on_close  # on_close(conn)
+        self.out = deque()        # Các memoryview đang chờ gửi
+        self.out_bytes = 0
+        self.sent_items = 0       # Số gói đã gửi trọn
+        self.bytes_sent = 0
+        self.closed = False
+        self.close_when_done = False
+        self.last_progress = time.time()
+        sock.setblocking(False)
+        self._update()
+
+    def write(self, data):
+        if self.closed: return
+        if not self.out: self.last_progress = time.time() # Hàng chờ trống -> tính timeout từ gói này
+        self.out.append(memoryview(data))
+        self.out_bytes += len(data)
+        self._flush()
+
+    def close_after_flush(self):
+        self.close_when_done = True
+        if not self.out: self.close()
+
+    def _flush(self):
+        t0 = time.perf_counter()
+        while self.out:
+            head = self.out[0]
+            try:
+                n = self.sock.send(head)
+            except (BlockingIOError, InterruptedError):
+                break # Bộ đệm socket đầy -> chờ EVENT_WRITE
+            except OSError:
+                self.close()
+                return
+            self.out_bytes -= n
+            self.bytes_sent += n
+            self.last_progress = time.time()
+            if n < len(head):
+                self.out[0] = head[n:]
+                break
+            self.out.popleft()
+            self.sent_items += 1
+        PROFILER.lap("network", t0) # [PROFILE] Thời gian gọi send() của 1 lượt xả bộ đệm
+        if not self.out and self.close_when_done:
+            self.close()
+            return
+        self._update()
+
+    def _update(self):
+        if self.closed: return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self.out else 0)
+        self.core.set_events(self.sock, events, self._on_event)
+
+    def _on_event(self, sock, mask):
+        if mask & selectors.EVENT_READ:
+            try:
+                data = sock.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                data = None
+            except OSError:
+                data = b""
+            if data == b"":
+                self.close()
+                return
+            if data and self.on_data: self.on_data(self, data)
+        if mask & selectors.EVENT_WRITE and not self.closed:
+            self._flush()
+
+    def close(self):
+        if self.closed: return
+        self.closed = True
+        self.core.set_events(self.sock, 0, None)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
+        try: self.sock.close()
+        except OSError: pass
+        self.out.clear()
+        self.out_bytes = 0
+        if self.on_close: self.on_close(self)
+
+class Listener:
+    """Cổng lắng nghe non-blocking: mỗi kết nối mới -> on_accept(sock, addr) trong thread mạng"""
+    def __init__(self, core, host, port, on_accept, backlog=4):
+        self.core = core
+        self.on_accept = on_accept
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(backlog)
+        self.sock.setblocking(False)
+        core.call_soon(core.set_events, self.sock, selectors.EVENT_READ, self._on_event)
+
+    def _on_event(self, sock, mask):
+        while True:
+            try:
+                conn, addr = sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print(f"⚠️ Lỗi kết nối: {e}")
+                return
+            self.on_accept(conn, addr)
+
+    def close(self):
+        def _close():
+            self.core.set_events(self.sock, 0, None)
+            self.sock.close()
+        self.core.call_soon(_close)
+
+class HttpServer:
+    """
+    Cổng HTTP tối giản chạy trên NetCore: đọc header (tối đa MAX_HEADER byte, có timeout),
+    tách "METHOD /path" rồi gọi route tương ứng: handler(conn, method, path, headers).
+    Đường dẫn không có route -> default_handler.
+    """
+    MAX_HEADER = 4096
+
+    def __init__(self, core, host, port, timeout=3.0, backlog=4):
+        self.core = core
+        self.timeout = timeout
+        self.routes = {}
+        self.default_handler = None
+        self.listener = Listener(core, host, port, self._on_accept, backlog)
+
+    def add_route(self, path, handler):
+        """Đăng ký đường dẫn (so khớp phần trước dấu ?)"""
+        self.routes[path] = handler
+
+    def _on_accept(self, sock, addr):
+        buf = bytearray()
+        conn = Connection(self.core, sock, addr)
+
+        def on_data(c, data):
+            buf.extend(data)
+            end = buf.find(b"\r\n\r\n")
+            if end < 0:
+                if len(buf) > self.MAX_HEADER: c.close()
+                return
+            c.on_data = None # Header xong -> các byte sau (nếu có) bỏ qua
+            self._dispatch(c, bytes(buf[:end]))
+
+        conn.on_data = on_data
+        # Không gửi header trong thời gian timeout -> đóng (tránh giữ socket rác)
+        self.core.call_later(self.timeout, lambda: conn.on_data is on_data and conn.close())
+
+    def _dispatch(self, conn, header):
+        lines = header.decode("utf-8", errors="ignore").split("\r\n")
+        parts = lines[0].split(" ")
+        method = parts[0] if parts else ""
+        path = parts[1].split("?", 1)[0] if len(parts) > 1 else "/"
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        handler = self.routes.get(path, self.default_handler)
+        if handler is None:
+            conn.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            conn.close_after_flush()
+            return
+        handler(conn, method, path, headers)
+
+    def close(self):
+        self.listener.close()
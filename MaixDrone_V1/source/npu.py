@@ -0,0 +1,102 @@
+# source/npu.py
+import threading
+import time
+from collections import deque
+from source.ai import PoseBatch, remap_batch
+
+class InferenceJob:
+    """Kết quả tương lai của 1 frame gửi lên NPU (gắn frame_id để ghép đúng ảnh)"""
+    def __init__(self, frame_id, img):
+        self.frame_id = frame_id
+        self.img = img
+        self.raw = None        # Kết quả thô từ thread NPU (mảng NumPy, toạ độ Model) hoặc PoseBatch hoàn chỉnh
+        self.batch = None
+        self.transform = None
+        self.infer_ms = 0.0    # Thời gian chiếm NPU (chuẩn bị ảnh + detect)
+        self.dropped = False   # Bị bỏ vì có frame mới hơn chờ (NPU không kịp)
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Chờ xong rồi trả về PoseBatch (đã map về ảnh gốc) hoặc None nếu bị bỏ / hết thời gian chờ"""
+        if not self._done.wait(timeout) or self.dropped: return None
+        if self.batch is None:
+            # Phần CPU (map toạ độ) chạy ở thread gọi result(), song song với NPU đang chạy frame sau
+            if isinstance(self.raw, PoseBatch):
+                self.batch = self.raw
+            elif self.raw is None:
+                self.batch = PoseBatch.empty()
+            else:
+                raw_boxes, scores, raw_kpts, has_points = self.raw
+                boxes, kpts = remap_batch(raw_boxes, raw_kpts, self.transform)
+                self.batch = PoseBatch(boxes, scores, kpts, has_points)
+            self.raw = None
+        return self.batch
+
+class AsyncInference(threading.Thread):
+    """
+    [ASYNC NPU] Thread riêng giữ NPU luôn bận: submit(frame_id, img) trả về InferenceJob ngay (không chờ),
+    poll() trả về các job đã xong theo đúng thứ tự gửi. Trong lúc NPU chạy frame N+1,
+    thread gọi tự map toạ độ / track / vẽ / stream frame N (InferenceJob.result()).
+    Hàng chờ: 1 frame đang chạy + max_pending frame chờ; đầy thì bỏ frame chờ cũ nhất (job.dropped).
+    """
+    def __init__(self, engine, max_pending=1):
+        super().__init__(name="npu", daemon=True)
+        self.engine = engine
+        self.max_pending = max(1, max_pending)
+        self.queue = deque()   # Job chờ NPU
+        self.jobs = deque()    # Mọi job chưa được poll() lấy ra (theo thứ tự gửi)
+        self.cond = threading.Condition()
+        self.running = False
+        self.submitted = 0
+        self.dropped = 0
+
+    def submit(self, frame_id, img):
+        job = InferenceJob(frame_id, img)
+        with self.cond:
+            while len(self.queue) >= self.max_pending:
+                old = self.queue.popleft()
+                old.dropped = True
+                old._done.set()
+                self.dropped += 1
+            self.queue.append(job)
+            self.jobs.append(job)
+            self.submitted += 1
+            self.cond.notify()
+        return job
+
+    def poll(self):
+        """Các job đã xong ở đầu hàng (theo thứ tự gửi). Không chờ"""
+        out = []
+        with self.cond:
+            while self.jobs and self.jobs[0].done():
+                out.append(self.jobs.popleft())
+        return out
+
+    def pending(self):
+        return len(self.jobs)
+
+    def run(self):
+        self.running = True
+        while self.running:
+            with self.cond:
+                while not self.queue and self.running:
+                    self.cond.wait(0.1)
+                if not self.running: break
+                job = self.queue.popleft()
+            t0 = time.time()
+            try:
+                job.raw, job.transform = self.engine.forward(job.img)
+            except Exception as e:
+                print(f"⚠️ NPU Error: {e}")
+                job.raw = None
+            job.infer_ms = (time.time() - t0) * 1000.0
+            job.img = None # Ảnh vẫn nằm trong packet của pipeline, job không cần giữ nữa
+            job._done.set()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
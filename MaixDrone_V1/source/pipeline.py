@@ -0,0 +1,176 @@
+# source/pipeline.py
+import threading
+import time
+from collections import deque
+
+class DropQueue:
+    """Hàng đợi giới hạn kích thước, khi đầy sẽ bỏ phần tử CŨ NHẤT (drop-oldest).
+    Dùng để nối các stage: stage sau luôn nhận frame mới nhất, không bao giờ làm treo stage trước.
+    keep(item) -> True: phần tử không bao giờ bị bỏ (VD: frame có kết quả AI). Đầy thì bỏ phần tử cũ nhất
+    không thuộc loại giữ lại; nếu không có -> put() chờ stage sau lấy bớt (backpressure) thay vì làm mất dữ liệu."""
+    def __init__(self, maxsize=2, keep=None):
+        self.maxsize = max(1, int(maxsize))
+        self.keep = keep
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.dropped = 0 # Số phần tử bị bỏ do đầy
+        self.closed = False
+
+    def put(self, item):
+        with self.cond:
+            while len(self.items) >= self.maxsize and not self.closed:
+                if self._drop_oldest(): break
+                self.cond.wait(0.1)
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def _drop_oldest(self):
+        for i, old in enumerate(self.items):
+            if self.keep is None or not self.keep(old):
+                del self.items[i]
+                self.dropped += 1
+                return True
+        return False
+
+    def get(self, timeout=None):
+        """Lấy phần tử cũ nhất còn lại. Trả về None nếu hết thời gian chờ hoặc hàng đợi đã đóng"""
+        with self.cond:
+            if not self.items and not self.closed:
+                self.cond.wait(timeout)
+            if not self.items: return None
+            item = self.items.popleft()
+            self.cond.notify_all() # put() có thể đang chờ chỗ trống
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+class StageTiming:
+    """Thống kê thời gian xử lý của 1 stage (EMA + Max trong chu kỳ báo cáo)"""
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.avg_ms = 0.0
+        self.max_ms = 0.0
+        self.count = 0
+
+    def add(self, ms):
+        if self.count == 0:
+            self.avg_ms = ms
+        else:
+            self.avg_ms = self.avg_ms * (1 - self.alpha) + ms * self.alpha
+        if ms > self.max_ms: self.max_ms = ms
+        self.count += 1
+
+    def reset_max(self):
+        self.max_ms = 0.0
+
+class PipelineStage(threading.Thread):
+    """1 stage = 1 thread. Lấy packet từ in_q, gọi func(packet), đẩy kết quả sang out_q.
+    - in_q = None: stage nguồn (Capture), func() tự sinh packet (trả None nếu chưa có dữ liệu).
+    - func trả về None: bỏ packet (không đẩy tiếp). Trả về list: đẩy lần lượt từng packet (VD: stage AI bất đồng bộ)."""
+    def __init__(self, name, func, in_q=None, out_q=None):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.in_q = in_q
+        self.out_q = out_q
+        self.timing = StageTiming()
+        self.running = False
+        self.error = None
+
+    def run(self):
+        self.running = True
+        while self.running:
+            if self.in_q is not None:
+                packet = self.in_q.get(timeout=0.1)
+                if packet is None: continue
+            else:
+                packet = None
+
+            t0 = time.time()
+            try:
+                out = self.func(packet) if self.in_q is not None else self.func()
+            except Exception as e:
+                print(f"⚠️ Stage '{self.name}' Error: {e}")
+                self.error = e
+                out = None
+            self.timing.add((time.time() - t0) * 1000.0)
+
+            if out is None:
+                # Stage nguồn chưa có frame -> nhường CPU một chút
+                if self.in_q is None: time.sleep(0.001)
+                continue
+            if self.out_q is not None:
+                if isinstance(out, list):
+                    for item in out: self.out_q.put(item)
+                else:
+                    self.out_q.put(out)
+
+    def stop(self):
+        self.running = False
+
+class Pipeline:
+    """Chuỗi các stage chạy song song, nối với nhau bằng DropQueue.
+    FPS tổng sẽ tiệm cận stage chậm nhất thay vì tổng thời gian các stage."""
+    def __init__(self, queue_size=2):
+        self.queue_size = queue_size
+        self.stages = []
+        self.queues = []
+
+    def add_source(self, name, func):
+        """Stage đầu tiên (không có input queue)"""
+        stage = PipelineStage(name, func)
+        self.stages.append(stage)
+        return stage
+
+    def add_stage(self, name, func, keep=None):
+        """Nối thêm 1 stage phía sau stage cuối cùng hiện có (keep: packet không được bỏ, xem DropQueue)"""
+        q = DropQueue(self.queue_size, keep)
+        self.queues.append(q)
+        if self.stages:
+            self.stages[-1].out_q = q
+        stage = PipelineStage(name, func, in_q=q)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+        for q in self.queues:
+            q.close()
+        for stage in self.stages:
+            stage.join(timeout=1.0)
+
+    def stats(self):
+        """Trả về dict thống kê: thời gian từng stage, độ sâu và số frame bị bỏ của từng queue"""
+        result = {'stages': {}, 'queues': []}
+        for stage in self.stages:
+            result['stages'][stage.name] = {
+                'avg_ms': stage.timing.avg_ms,
+                'max_ms': stage.timing.max_ms,
+                'count': stage.timing.count,
+            }
+        for stage in self.stages:
+            if stage.in_q is not None:
+                result['queues'].append({
+                    'to': stage.name,
+                    'depth': len(stage.in_q),
+                    'dropped': stage.in_q.dropped,
+                })
+        return result
+
+    def print_stats(self):
+        parts = []
+        for stage in self.stages:
+            parts.append(f"{stage.name} {stage.timing.avg_ms:.1f}ms(max {stage.timing.max_ms:.0f})")
+            stage.timing.reset_max()
+        drops = sum(q.dropped for q in self.queues)
+        print(f"📊 Pipeline: " + " | ".join(parts) + f" | dropped: {drops}")
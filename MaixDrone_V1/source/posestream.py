@@ -0,0 +1,152 @@
+# source/posestream.py
+import json
+import struct
+import numpy as np
+from source.gesture import GESTURE_ENGINE, GESTURE_ALERTS
+from source.netcore import Connection
+
+NUM_KPTS = 17
+
+# [BINARY] 1 frame = Header + N bản ghi người (little-endian, kích thước cố định -> tự tách frame được)
+# Header: magic "MDP1", frame_id u32, timestamp f64 (giây, epoch), số người u16, số khớp u8, reserved u8
+FRAME_HEADER = struct.Struct("<4sIdHBB")
+FRAME_MAGIC = b"MDP1"
+# Người: id u16, box i16[4] (x, y, w, h px), pose_score u8 (x255), alert u8 (0 = không có, xem /pose/schema),
+# gestures u32 (bit i = GESTURE_ENGINE.names[i]), kpts f16[17][2] (px), conf u8[17] (x255)
+PERSON_DTYPE = np.dtype([
+    ('id', '<u2'), ('box', '<i2', (4,)), ('score', 'u1'), ('alert', 'u1'),
+    ('gestures', '<u4'), ('kpts', '<f2', (NUM_KPTS, 2)), ('conf', 'u1', (NUM_KPTS,)),
+])
+
+CHUNKED_HEADER = (b"HTTP/1.1 200 OK\r\n"
+                  b"Content-Type: %s\r\n"
+                  b"Transfer-Encoding: chunked\r\n"
+                  b"Cache-Control: no-cache\r\n\r\n")
+
+def _chunk(payload):
+    """1 chunk HTTP/1.1 (Transfer-Encoding: chunked)"""
+    return b"%X\r\n" % len(payload) + payload + b"\r\n"
+
+class PoseClient(Connection):
+    """Người nhận luồng Pose: giữ tối đa 1 frame chờ (drop-to-latest) giống StreamClient"""
+    def __init__(self, core, sock, addr, fmt, on_close=None):
+        super().__init__(core, sock, addr, on_close=on_close)
+        self.fmt = fmt # "bin" | "json"
+        self.dropped = 0
+
+    def queue(self, chunk):
+        if len(self.out) > 1:
+            self.out_bytes -= len(self.out[-1])
+            self.out.pop()
+            self.dropped += 1
+        self.write(chunk)
+
+class PoseStream:
+    """
+    [META] Luồng chỉ có dữ liệu Pose (box, khớp, ID, cử chỉ) trên cùng cổng HTTP với MJPEG:
+    - GET /pose         : nhị phân (PERSON_DTYPE), ~100 byte/người/frame
+    - GET /pose.json    : JSON, mỗi frame 1 dòng
+    - GET /pose/schema  : bảng mã cử chỉ + cảnh báo + layout nhị phân
+    Mỗi frame được mã hoá tối đa 1 lần cho mỗi định dạng, và chỉ khi có người nhận định dạng đó.
+    """
+    def __init__(self, streamer):
+        self.streamer = streamer
+        self.core = streamer.core
+        self.clients = []
+        self.frame_id = 0
+        self.gesture_bits = {name: 1 << i for i, name in enumerate(GESTURE_ENGINE.names[:32])}
+        streamer.add_route("/pose", lambda c, m, p, h: self._open(c, "bin"))
+        streamer.add_route("/pose.json", lambda c, m, p, h: self._open(c, "json"))
+        streamer.add_route("/pose/schema", self._schema)
+
+    # --- Thread mạng ---
+    def _open(self, conn, fmt):
+        self.core.set_events(conn.sock, 0, None)
+        client = PoseClient(self.core, conn.sock, conn.addr, fmt, on_close=self._on_close)
+        ctype = b"application/octet-stream" if fmt == "bin" else b"application/x-ndjson"
+        client.write(CHUNKED_HEADER % ctype)
+        self.clients = self.clients + [client]
+        print(f"🔗 Pose Stream ({fmt}) Connected: {conn.addr}")
+
+    def _on_close(self, client):
+        self.clients = [c for c in self.clients if c is not client]
+
+    def _schema(self, conn, method, path, headers):
+        body = json.dumps({
+            'header': {'struct': FRAME_HEADER.format, 'fields': ['magic', 'frame_id', 'timestamp', 'count', 'num_kpts', 'reserved']},
+            'person': {'itemsize': PERSON_DTYPE.itemsize, 'fields': [[n, str(PERSON_DTYPE[n])] for n in PERSON_DTYPE.names]},
+            'gestures': GESTURE_ENGINE.names[:32],
+            'alerts': [None] + GESTURE_ALERTS.codes,
+        }).encode('utf-8')
+        conn.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+        conn.close_after_flush()
+
+    def _fan_out(self, chunks):
+        for client in self.clients:
+            chunk = chunks.get(client.fmt)
+            if chunk is not None and not client.closed: client.queue(chunk)
+
+    # --- Thread xử lý ảnh (thread-safe) ---
+    def has_clients(self):
+        return bool(self.clients)
+
+    def publish(self, objects, timestamp):
+        """Gửi kết quả tracker (get_display_objects / predict) của 1 frame cho mọi người nhận"""
+        clients = self.clients
+        if not clients: return
+        self.frame_id += 1
+        fmts = {c.fmt for c in clients}
+        chunks = {}
+        if "bin" in fmts: chunks["bin"] = _chunk(self.encode_binary(objects, timestamp, self.frame_id))
+        if "json" in fmts: chunks["json"] = _chunk(self.encode_json(objects, timestamp, self.frame_id))
+        self.core.call_soon(self._fan_out, chunks)
+
+    def _alert_of(self, gestures):
+        alert = GESTURE_ALERTS.for_gestures(gestures)
+        return alert['index'] if alert else 0
+
+    def encode_binary(self, objects, timestamp, frame_id=0):
+        n = len(objects)
+        rec = np.zeros(n, dtype=PERSON_DTYPE)
+        if n:
+            rec['id'] = [obj['id'] & 0xFFFF for obj in objects]
+            rec['box'] = np.clip(np.asarray([obj['box'][:4] for obj in objects], dtype=np.float64), -32768, 32767)
+            rec['score'] = np.clip(np.asarray([obj.get('pose_score', 0.0) for obj in objects]) * 255, 0, 255)
+            rec['alert'] = [self._alert_of(obj.get('gestures', [])) for obj in objects]
+            rec['gestures'] = [sum(self.gesture_bits.get(g, 0) for g in obj.get('gestures', [])) for obj in objects]
+            for i, obj in enumerate(objects):
+                pts = obj.get('points', [])
+                if len(pts) == NUM_KPTS * 3:
+                    kp = np.asarray(pts, dtype=np.float64).reshape(NUM_KPTS, 3)
+                    rec['kpts'][i] = kp[:, :2]
+                    rec['conf'][i] = np.clip(kp[:, 2] * 255, 0, 255)
+        return FRAME_HEADER.pack(FRAME_MAGIC, frame_id & 0xFFFFFFFF, timestamp, n, NUM_KPTS, 0) + rec.tobytes()
+
+    def encode_json(self, objects, timestamp, frame_id=0):
+        people = []
+        for obj in objects:
+            gestures = obj.get('gestures', [])
+            alert = GESTURE_ALERTS.for_gestures(gestures)
+            pts = obj.get('points', [])
+            people.append({
+                'id': obj['id'],
+                'box': [round(v, 1) for v in obj['box'][:4]],
+                'score': round(obj.get('pose_score', 0.0), 3),
+                'gestures': gestures,
+                'alert': alert['code'] if alert else None,
+                'kpts': [[round(pts[k], 1), round(pts[k + 1], 1), round(pts[k + 2], 2)]
+                         for k in range(0, len(pts) - 2, 3)],
+            })
+        return (json.dumps({'frame': frame_id, 't': timestamp, 'people': people}, separators=(',', ':')) + "\n").encode('utf-8')
+
+def decode_binary(buf):
+    """Tách 1 frame nhị phân từ buf (bytes/bytearray/memoryview).
+    Trả về (frame_id, timestamp, records, số byte đã dùng) hoặc None nếu chưa đủ dữ liệu."""
+    if len(buf) < FRAME_HEADER.size: return None
+    magic, frame_id, ts, n, k, _ = FRAME_HEADER.unpack_from(buf, 0)
+    if magic != FRAME_MAGIC or k != NUM_KPTS: raise ValueError("Bad pose frame")
+    size = FRAME_HEADER.size + n * PERSON_DTYPE.itemsize
+    if len(buf) < size: return None
+    # copy(): không giữ tham chiếu vào buf -> người gọi được phép xoá/ghi đè bytearray ngay sau đó
+    rec = np.frombuffer(buf, dtype=PERSON_DTYPE, count=n, offset=FRAME_HEADER.size).copy()
+    return frame_id, ts, rec, size
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 import config
 
 class OneEuroFilter:
@@ -39,9 +40,184 @@ class OneEuroFilter:
         self.t_prev = t
         return x_hat
 
+class OneEuroFilterBank:
+    """
+    [BATCH] Bộ lọc One Euro dạng mảng cho TẤT CẢ track cùng lúc.
+    Mỗi track chiếm 1 slot: x_prev/dx_prev (slot, khớp, 2) và t_prev (slot,) lưu liên tục trong NumPy,
+    cutoff/beta truyền vào theo từng toạ độ mỗi lần gọi -> 1 lần gọi lọc toàn bộ người trong frame.
+    """
+    def __init__(self, num_kpts=17, capacity=8, d_cutoff=1.0):
+        self.num_kpts = num_kpts
+        self.d_cutoff = d_cutoff
+        self.slots = {}   # oid -> slot
+        self.free = []    # Các slot đã giải phóng, dùng lại
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        x_prev = np.zeros((capacity, self.num_kpts, 2), np.float64)
+        dx_prev = np.zeros((capacity, self.num_kpts, 2), np.float64)
+        t_prev = np.zeros((capacity,), np.float64)
+        n_old = 0
+        if hasattr(self, 'x_prev'):
+            n_old = self.x_prev.shape[0]
+            x_prev[:n_old] = self.x_prev
+            dx_prev[:n_old] = self.dx_prev
+            t_prev[:n_old] = self.t_prev
+        self.x_prev, self.dx_prev, self.t_prev = x_prev, dx_prev, t_prev
+        self.free.extend(range(capacity - 1, n_old - 1, -1))
+
+    def has(self, oid):
+        return oid in self.slots
+
+    def slot_of(self, oid):
+        """Trả về (slot, is_new). Tự mở rộng mảng (x2) khi hết slot"""
+        slot = self.slots.get(oid)
+        if slot is not None: return slot, False
+        if not self.free:
+            self._alloc(self.x_prev.shape[0] * 2)
+        slot = self.free.pop()
+        self.slots[oid] = slot
+        return slot, True
+
+    def release(self, oid):
+        slot = self.slots.pop(oid, None)
+        if slot is not None:
+            self.free.append(slot)
+
+    @staticmethod
+    def smoothing_factor(t_e, cutoff):
+        r = 2 * math.pi * cutoff * t_e
+        return r / (r + 1)
+
+    def __call__(self, slots, is_new, t, x, min_cutoff, beta):
+        """
+        slots: (M,) int - is_new: (M,) bool - t: thời điểm hiện tại
+        x: (M, K, 2) giá trị đo - min_cutoff, beta: (M, K, 1) hoặc broadcast được
+        Trả về x_hat (M, K, 2)
+        """
+        x_prev = self.x_prev[slots]
+        dx_prev = self.dx_prev[slots]
+        t_e = (t - self.t_prev[slots]).reshape(-1, 1, 1)
+
+        # Slot mới: khởi tạo = giá trị đo (giống OneEuroFilter(t0, x0) rồi gọi tại cùng t)
+        x_prev = np.where(is_new.reshape(-1, 1, 1), x, x_prev)
+        dx_prev = np.where(is_new.reshape(-1, 1, 1), 0.0, dx_prev)
+        active = (t_e > 0.0) & ~is_new.reshape(-1, 1, 1)
+        t_safe = np.where(active, t_e, 1.0)
+
+        # Tính đạo hàm (vận tốc thay đổi)
+        a_d = self.smoothing_factor(t_safe, self.d_cutoff)
+        dx = (x - x_prev) / t_safe
+        dx_hat = a_d * dx + (1 - a_d) * dx_prev
+
+        # Vận tốc càng lớn -> Cutoff càng lớn -> Ít lọc -> Bám sát chuyển động
+        cutoff = min_cutoff + beta * np.abs(dx_hat)
+        a = self.smoothing_factor(t_safe, cutoff)
+        x_hat = a * x + (1 - a) * x_prev
+
+        # t_e <= 0 (hoặc slot mới): giữ nguyên trạng thái cũ
+        x_hat = np.where(active, x_hat, x_prev)
+        dx_hat = np.where(active, dx_hat, dx_prev)
+
+        self.x_prev[slots] = x_hat
+        self.dx_prev[slots] = dx_hat
+        upd = active.reshape(-1) | is_new
+        self.t_prev[slots[upd]] = t
+        return x_hat
+
+class AnatomyConstraints:
+    """
+    [BATCH] Ràng buộc độ dài xương cho toàn bộ khung xương COCO, áp dụng cho tất cả người cùng lúc.
+    Bảng xương được "biên dịch" 1 lần thành các tầng (theo độ sâu từ gốc): các xương cùng tầng độc lập
+    nhau nên được sửa trong 1 phép tính mảng; tầng sau dùng toạ độ đã sửa của tầng trước.
+    Thước đo: Tay/Đầu dùng bề rộng vai. Thân/Chân (khớp con thuộc body_joints) dùng thước đo không co lại
+    khi người xoay nghiêng (vai chỉ còn vài px): max(bề rộng vai, box_ref * cạnh lớn của box).
+    """
+    DEFAULT_BONES = [(5, 7, 1.2), (7, 9, 1.0), (6, 8, 1.2), (8, 10, 1.0)]
+    DEFAULT_BODY_JOINTS = (11, 12, 13, 14, 15, 16)
+
+    def __init__(self, bones, ref_scale=2.0, min_ref=10, body_joints=None, box_ref=0.3):
+        self.ref_scale = ref_scale
+        self.min_ref = min_ref
+        self.box_ref = box_ref
+        self.body_joints = set(self.DEFAULT_BODY_JOINTS if body_joints is None else body_joints)
+        self.levels = self._compile(bones, self.body_joints)
+
+    @staticmethod
+    def _compile(bones, body_joints=()):
+        """Chia xương thành các tầng: tầng của xương = tầng của xương sinh ra khớp cha + 1"""
+        parent_bone = {c_idx: (p_idx, c_idx, ratio) for p_idx, c_idx, ratio in bones}
+        def depth(bone, seen=()):
+            up = parent_bone.get(bone[0])
+            if up is None or up in seen: return 0
+            return depth(up, seen + (bone,)) + 1
+
+        levels = []
+        for bone in bones:
+            lv = depth(bone)
+            while len(levels) <= lv: levels.append([])
+            levels[lv].append(bone)
+        compiled = []
+        for lv in levels:
+            compiled.append((np.array([b[0] for b in lv], np.intp),
+                             np.array([b[1] for b in lv], np.intp),
+                             np.array([b[2] for b in lv], np.float64),
+                             np.array([b[1] in body_joints for b in lv], bool)))
+        return compiled
+
+    def apply(self, kpts, boxes=None):
+        """kpts: (M, 17, 3) [x, y, conf] - sửa trực tiếp. boxes: (M, 4) [x, y, w, h] hoặc None"""
+        if kpts.shape[0] == 0: return kpts
+
+        # 1. Tính độ dài thân người (Torso) làm thước đo chuẩn: ~ 2 lần khoảng cách 2 vai (5-6)
+        s5 = kpts[:, 5]; s6 = kpts[:, 6]
+        ref_len = np.hypot(s5[:, 0] - s6[:, 0], s5[:, 1] - s6[:, 1]) * self.ref_scale
+        ref_ok = (s5[:, 2] > 0) & (s6[:, 2] > 0) & (ref_len >= self.min_ref)
+        # Thân/Chân: vai co lại khi xoay nghiêng nhưng thân và chân thì không -> lấy thêm theo kích thước box
+        body_len = np.where(ref_ok, ref_len, 0.0)
+        if boxes is not None:
+            body_len = np.maximum(body_len, np.max(np.asarray(boxes, np.float64)[:, 2:4], axis=1) * self.box_ref)
+        else:
+            # Không có box -> dùng độ dài thân đang thấy (trung điểm vai -> trung điểm hông)
+            hips = kpts[:, 11:13]
+            torso_ok = (s5[:, 2] > 0) & (s6[:, 2] > 0)
+            torso_ok &= (hips[:, 0, 2] > 0) & (hips[:, 1, 2] > 0)
+            mid_s = (s5[:, :2] + s6[:, :2]) / 2
+            mid_h = hips[:, :, :2].mean(axis=1)
+            torso = np.hypot(*(mid_h - mid_s).T)
+            body_len = np.maximum(body_len, np.where(torso_ok, torso, 0.0))
+        body_ok = body_len >= self.min_ref
+        if not (ref_ok.any() or body_ok.any()): return kpts # Không đủ dữ liệu để tính
+        ref_len = ref_len[:, None]; body_len = body_len[:, None]
+        ref_ok = ref_ok[:, None]; body_ok = body_ok[:, None]
+
+        # 2. Ràng buộc các xương theo từng tầng (cha trước, con sau)
+        for p_idx, c_idx, ratios, is_body in self.levels:
+            p = kpts[:, p_idx]; c = kpts[:, c_idx]      # (M, B, 3)
+            dx = c[:, :, 0] - p[:, :, 0]
+            dy = c[:, :, 1] - p[:, :, 1]
+            d = np.hypot(dx, dy)
+            max_len = np.where(is_body, body_len, ref_len) * ratios
+            ok = np.where(is_body, body_ok, ref_ok)
+            # Nếu xương quá dài -> Kéo khớp con về phía khớp cha
+            over = ok & (p[:, :, 2] > 0) & (c[:, :, 2] > 0) & (d > max_len)
+            if not over.any(): continue
+            factor = np.where(over, max_len / np.where(over, d, 1.0), 1.0)
+            kpts[:, c_idx, 0] = p[:, :, 0] + dx * factor
+            kpts[:, c_idx, 1] = p[:, :, 1] + dy * factor
+        return kpts
+
 class PoseFilter:
     def __init__(self):
-        self.object_filters = {}
+        self.banks = {} # [BATCH] OneEuroFilterBank theo số khớp K (mỗi K 1 bank, giữ trạng thái khi xen kẽ K)
+        self.anatomy = None
+        if getattr(config, "ANATOMY_ENABLE", True):
+            self.anatomy = AnatomyConstraints(
+                getattr(config, "ANATOMY_BONES", AnatomyConstraints.DEFAULT_BONES),
+                getattr(config, "ANATOMY_REF_SCALE", 2.0),
+                getattr(config, "ANATOMY_MIN_REF", 10),
+                getattr(config, "ANATOMY_BODY_JOINTS", AnatomyConstraints.DEFAULT_BODY_JOINTS),
+                getattr(config, "ANATOMY_BOX_REF", 0.3))
         # [UPDATE] Cấu hình "Siêu Mượt" (Heavy Smoothing) để chống nhảy điểm
         # [NOISE REDUCTION] Giảm mạnh các thông số để ưu tiên độ ổn định (chấp nhận trễ nhẹ)
         self.min_cutoff = 0.004 # [TUNING] Rất nhỏ (0.004) để khử rung triệt để khi đứng yên
@@ -49,134 +225,89 @@ class PoseFilter:
         self.d_cutoff = 1.0
 
     def filter_kpts(self, oid, t, kpts, bbox=None):
+        """[COMPAT] Lọc 1 người (list phẳng [x, y, conf, ...] hoặc [x, y, ...]). Dùng filter_batch cho nhiều người"""
         if not kpts: return []
         
         # [DYNAMIC STRIDE] Tự động xác định stride (2 hoặc 3) dựa trên độ dài dữ liệu
         # Nếu chia hết cho 3 -> [x, y, conf]. Nếu không -> [x, y]
         stride = 3 if len(kpts) % 3 == 0 else 2
+        arr = np.asarray(kpts, dtype=np.float64).reshape(1, -1, stride)
+        if stride == 2:
+            arr = np.concatenate([arr, np.ones(arr.shape[:2] + (1,))], axis=2)
+        boxes = None
+        if bbox and len(bbox) >= 4:
+            boxes = np.asarray([bbox[:4]], dtype=np.float64)
+
+        out = self.filter_batch([oid], t, arr, boxes)
+        if stride == 2:
+            out = out[:, :, :2]
+        return out.reshape(-1).tolist()
+
+    def filter_batch(self, oids, t, kpts, bboxes=None):
+        """
+        [BATCH] Lọc toàn bộ người trong frame bằng 1 lần gọi.
+        oids: list M track id - kpts: (M, K, 3) [x, y, conf] - bboxes: (M, 4) [x, y, w, h] hoặc None
+        Trả về mảng (M, K, 3) đã lọc (conf có thể bị hạ về 0).
+        """
+        kpts = np.asarray(kpts, dtype=np.float64)
+        m, k = kpts.shape[0], kpts.shape[1]
+        if m == 0: return kpts.copy()
+        bank = self.banks.get(k)
+        if bank is None:
+            bank = self.banks[k] = OneEuroFilterBank(k, d_cutoff=self.d_cutoff)
+
+        slots = np.empty((m,), np.intp)
+        is_new = np.empty((m,), bool)
+        for i, oid in enumerate(oids):
+            slots[i], is_new[i] = bank.slot_of(oid)
 
         # Adaptive theo khoảng cách (bbox_h)
-        bbox_h = 1.0
-        if bbox and len(bbox) >= 4:
-            bbox_h = max(1.0, float(bbox[3]))
-
-        if bbox_h < 100:
-            min_cutoff = 0.002 # [XA] Khóa cứng điểm khi ở xa
-            beta = 0.02        # [XA] Rất đầm
-        elif bbox_h < 200:
-            min_cutoff = 0.005
-            beta = 0.05
+        if bboxes is not None:
+            bboxes = np.asarray(bboxes, dtype=np.float64)
+            bbox_h = np.maximum(1.0, bboxes[:, 3])
         else:
-            min_cutoff = 0.01
-            beta = 0.1 # [GAN] Giảm beta xuống 0.1 (trước là 0.4) để tay không bị văng khi múa
-        
-        if oid not in self.object_filters:
-            self.object_filters[oid] = {}
-            
-        filters = self.object_filters[oid]
-        filtered_kpts = []
-        
-        num_points = len(kpts) // stride
-        
-        for i in range(num_points):
-            base = i * stride
-            
-            # Confidence-weighted smoothing
-            conf = kpts[base+2] if stride == 3 else 1.0
-            if conf < config.KEYPOINT_THRESHOLD:
-                conf = 0.0
-
-            c_weight = max(0.0, min(1.0, conf))
-            c_min_cutoff = min_cutoff * (0.6 + 0.4 * c_weight)
-            c_beta = beta * (0.6 + 0.4 * c_weight)
-
-            # [FIX] Joint Locking: Nếu độ tin cậy thấp, giữ nguyên vị trí cũ
-            # Ngăn chặn hiện tượng "co rút" hoặc điểm xương bay loạn xạ khi AI mất dấu
-            target_x = kpts[base]
-            target_y = kpts[base+1]
-            
-            if conf == 0.0 and base in filters:
-                target_x = filters[base].x_prev
-                target_y = filters[base+1].x_prev
-
-            # Lọc tọa độ X
-            if base not in filters:
-                filters[base] = OneEuroFilter(t, target_x, min_cutoff=c_min_cutoff, beta=c_beta, d_cutoff=self.d_cutoff)
-            else:
-                filters[base].min_cutoff = c_min_cutoff
-                filters[base].beta = c_beta
-            fx = filters[base](t, target_x)
-            
-            # Lọc tọa độ Y
-            if (base+1) not in filters:
-                filters[base+1] = OneEuroFilter(t, target_y, min_cutoff=c_min_cutoff, beta=c_beta, d_cutoff=self.d_cutoff)
-            else:
-                filters[base+1].min_cutoff = c_min_cutoff
-                filters[base+1].beta = c_beta
-            fy = filters[base+1](t, target_y)
-
-            # Clamp vào bbox nếu có
-            if bbox and len(bbox) >= 4:
-                bx, by, bw, bh = bbox[0], bbox[1], bbox[2], bbox[3]
-                fx = max(bx, min(bx + bw - 1, fx))
-                fy = max(by, min(by + bh - 1, fy))
-                # Bỏ điểm nhiễu ở góc trên-trái bbox
-                tl_px = getattr(config, "BBOX_TL_IGNORE_PX", 6)
-                if abs(fx - bx) <= tl_px and abs(fy - by) <= tl_px:
-                    conf = 0.0
-            
-            filtered_kpts.extend([fx, fy])
-            
-            # Giữ nguyên Confidence Score (nếu có)
-            if stride == 3:
-                filtered_kpts.append(conf)
-                
-        # [ANATOMY] Áp dụng ràng buộc giải phẫu học (Chống tay dài/ngắn bất thường)
-        self._apply_anatomy_constraints(filtered_kpts, stride)
-        
-        return filtered_kpts
-
-    def _apply_anatomy_constraints(self, kpts, stride):
-        """Kiểm tra và sửa lỗi độ dài xương dựa trên tỷ lệ cơ thể"""
-        def get_p(idx):
-            base = idx * stride
-            if base + 1 >= len(kpts): return (0,0,0)
-            return kpts[base], kpts[base+1], (kpts[base+2] if stride==3 else 1.0)
-            
-        def set_p(idx, x, y):
-            base = idx * stride
-            if base + 1 < len(kpts):
-                kpts[base] = x
-                kpts[base+1] = y
-
-        def dist(p1, p2):
-            return math.sqrt((p1[0]-p2[0])**2 + (p1[1]-p2[1])**2)
-
-        # 1. Tính độ dài thân người (Torso) làm thước đo chuẩn
-        # Dùng khoảng cách 2 vai (5-6) hoặc Vai-Hông
-        s5 = get_p(5); s6 = get_p(6)
-        
-        ref_len = 0
-        if s5[2]>0 and s6[2]>0:
-            ref_len = dist(s5, s6) * 2.0 # Ước lượng thân người ~ 2 lần vai
-        
-        if ref_len < 10: return # Không đủ dữ liệu để tính
-
-        # 2. Ràng buộc các xương chi (Tay/Chân)
-        # Cấu trúc: (Khớp Cha, Khớp Con, Tỷ lệ tối đa so với thân)
-        bones = [
-            (5, 7, 1.2), (7, 9, 1.0),   # Tay Trái (Vai->Khuỷu, Khuỷu->Cổ tay)
-            (6, 8, 1.2), (8, 10, 1.0),  # Tay Phải
-        ]
+            bbox_h = np.ones((m,))
+        # [XA] (<100) Khóa cứng điểm, rất đầm | (<200) Trung bình | [GAN] beta 0.1 để tay không bị văng khi múa
+        min_cutoff = np.select([bbox_h < 100, bbox_h < 200], [0.002, 0.005], 0.01).reshape(-1, 1)
+        beta = np.select([bbox_h < 100, bbox_h < 200], [0.02, 0.05], 0.1).reshape(-1, 1)
+
+        # Confidence-weighted smoothing
+        conf = kpts[:, :, 2].copy()
+        conf[conf < config.KEYPOINT_THRESHOLD] = 0.0
+        c_weight = np.clip(conf, 0.0, 1.0)
+        c_scale = 0.6 + 0.4 * c_weight
+        c_min_cutoff = (min_cutoff * c_scale)[:, :, None]
+        c_beta = (beta * c_scale)[:, :, None]
+
+        # [FIX] Joint Locking: Nếu độ tin cậy thấp, giữ nguyên vị trí cũ
+        # Ngăn chặn hiện tượng "co rút" hoặc điểm xương bay loạn xạ khi AI mất dấu
+        target = kpts[:, :, :2].copy()
+        lock = (conf == 0.0) & ~is_new[:, None]
+        if lock.any():
+            target[lock] = bank.x_prev[slots][lock]
+
+        fxy = bank(slots, is_new, t, target, c_min_cutoff, c_beta)
+
+        # Clamp vào bbox nếu có
+        if bboxes is not None:
+            bx, by = bboxes[:, 0:1], bboxes[:, 1:2]
+            bw, bh = bboxes[:, 2:3], bboxes[:, 3:4]
+            fx = np.maximum(bx, np.minimum(bx + bw - 1, fxy[:, :, 0]))
+            fy = np.maximum(by, np.minimum(by + bh - 1, fxy[:, :, 1]))
+            fxy = np.stack([fx, fy], axis=2)
+            # Bỏ điểm nhiễu ở góc trên-trái bbox
+            tl_px = getattr(config, "BBOX_TL_IGNORE_PX", 6)
+            conf[(np.abs(fx - bx) <= tl_px) & (np.abs(fy - by) <= tl_px)] = 0.0
+
+        out = np.concatenate([fxy, conf[:, :, None]], axis=2)
+
+        # [ANATOMY] Áp dụng ràng buộc giải phẫu học cho tất cả người cùng lúc (Chống tay/chân dài bất thường)
+        if self.anatomy is not None and k == 17:
+            self.anatomy.apply(out, bboxes)
         
-        for p_idx, c_idx, ratio in bones:
-            p = get_p(p_idx); c = get_p(c_idx)
-            if p[2] > 0 and c[2] > 0:
-                d = dist(p, c)
-                max_len = ref_len * ratio
-                # Nếu xương quá dài -> Kéo khớp con về phía khớp cha
-                if d > max_len:
-                    factor = max_len / d
-                    new_x = p[0] + (c[0] - p[0]) * factor
-                    new_y = p[1] + (c[1] - p[1]) * factor
-                    set_p(c_idx, new_x, new_y)
+        return out
+
+    def release(self, oid):
+        """Giải phóng bộ lọc của track đã bị xoá"""
+        for bank in self.banks.values():
+            bank.release(oid)
@@ -0,0 +1,184 @@
+# source/profiler.py
+import bisect
+import gc
+import time
+import config
+
+# Các stage đo mặc định (thứ tự in ra). Tên khác vẫn dùng được, sẽ tự thêm vào cuối.
+STAGES = ("capture", "preprocess", "npu", "remap", "track", "filter", "gesture",
+          "hud", "jpeg", "network", "display", "e2e", "gc")
+# Biên trên các bucket (ms), bucket cuối = +Inf
+BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0)
+
+METRICS_HEADER = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: %d\r\n\r\n"
+
+class LatencyHistogram:
+    """
+    Histogram thời gian với bucket cố định (không cấp phát khi ghi, chỉ bisect + cộng).
+    Không khoá: 2 thread ghi cùng lúc hiếm khi mất 1 mẫu, chấp nhận được với số liệu thống kê.
+    """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0    # Max trong chu kỳ in tóm tắt
+        self.last = None     # Bản sao counts lúc in tóm tắt lần trước (tính phân vị theo chu kỳ)
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        if ms > self.max_ms: self.max_ms = ms
+
+    @staticmethod
+    def percentile(counts, q, max_ms):
+        """Phân vị q (0-1) ước lượng từ bucket: biên trên của bucket chứa mẫu thứ q*n (không vượt max)"""
+        n = sum(counts)
+        if not n: return 0.0
+        rank = q * n
+        acc = 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= rank:
+                return min(BUCKETS_MS[i], max_ms) if i < len(BUCKETS_MS) else max_ms
+        return max_ms
+
+    def interval(self):
+        """(số mẫu, p50, p95, max) từ lần gọi trước, rồi bắt đầu chu kỳ mới"""
+        counts = list(self.counts)
+        window = counts if self.last is None else [a - b for a, b in zip(counts, self.last)]
+        max_ms = self.max_ms
+        self.last = counts
+        self.max_ms = 0.0
+        return sum(window), self.percentile(window, 0.5, max_ms), self.percentile(window, 0.95, max_ms), max_ms
+
+class Profiler:
+    """
+    [PROFILE] Đo thời gian từng stage trên đường nóng, gọn đủ để bật thường trực (< 1% CPU):
+    - t = PROFILER.lap("track", t0): ghi (now - t0) vào histogram "track", trả về now để đo tiếp stage sau
+    - Gauge (độ sâu hàng đợi, frame bị bỏ...) là hàm chỉ được gọi khi xuất số liệu -> không tốn gì mỗi frame
+    - Thời gian dừng của GC qua gc.callbacks
+    Xuất: GET /metrics (định dạng text Prometheus) trên cổng StreamServer, và tóm tắt định kỳ ra stdout.
+    """
+    def __init__(self, enable=None):
+        self.enable = getattr(config, "PROFILE_ENABLE", True) if enable is None else enable
+        self.hists = {name: LatencyHistogram() for name in STAGES}
+        self.gauges = [] # (tên metric, labels, hàm, kiểu "gauge"/"counter")
+        self.gc_counts = [0, 0, 0] # Số lần GC theo thế hệ
+        self.gc_t0 = None
+        self.calls = 0
+        self.cost_us = 0.0 # Chi phí ước lượng của 1 lần lap() (đo lúc start)
+        self.t_start = time.time()
+        self.t_summary = time.perf_counter()
+        self.calls_summary = 0
+
+    def lap(self, name, t0):
+        now = time.perf_counter()
+        if self.enable:
+            hist = self.hists.get(name)
+            if hist is None: hist = self.hists[name] = LatencyHistogram()
+            hist.add((now - t0) * 1000.0)
+            self.calls += 1
+        return now
+
+    def add(self, name, ms):
+        """Ghi 1 mẫu đã đo sẵn (ms)"""
+        if not self.enable: return
+        hist = self.hists.get(name)
+        if hist is None: hist = self.hists[name] = LatencyHistogram()
+        hist.add(ms)
+        self.calls += 1
+
+    def add_gauge(self, name, func, labels=None, kind="gauge"):
+        """Đăng ký số liệu đọc lúc xuất: func() -> số. kind="counter" cho giá trị chỉ tăng (VD: frame bị bỏ)"""
+        self.gauges.append((name, labels or {}, func, kind))
+
+    def start(self, streamer=None):
+        """Đo chi phí lap(), móc vào GC và đăng ký /metrics trên cổng StreamServer"""
+        if not self.enable: return
+        n = 2000
+        probe = LatencyHistogram()
+        t0 = time.perf_counter()
+        for _ in range(n):
+            now = time.perf_counter()
+            probe.add((now - t0) * 1000.0)
+        self.cost_us = (time.perf_counter() - t0) * 1e6 / n
+        gc.callbacks.append(self._on_gc)
+        if streamer is not None:
+            streamer.add_route("/metrics", self._serve)
+
+    def stop(self):
+        if self._on_gc in gc.callbacks: gc.callbacks.remove(self._on_gc)
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self.gc_t0 = time.perf_counter()
+        elif self.gc_t0 is not None:
+            self.add("gc", (time.perf_counter() - self.gc_t0) * 1000.0)
+            self.gc_counts[min(info.get("generation", 0), 2)] += 1
+            self.gc_t0 = None
+
+    # --- Xuất số liệu ---
+    def render(self):
+        """Text định dạng Prometheus (histogram tích luỹ từ lúc khởi động + các gauge)"""
+        lines = [
+            "# HELP maixdrone_stage_latency_ms Thoi gian xu ly tung stage (ms)",
+            "# TYPE maixdrone_stage_latency_ms histogram",
+        ]
+        for name, hist in list(self.hists.items()):
+            counts = list(hist.counts)
+            acc = 0
+            for bound, c in zip(BUCKETS_MS, counts):
+                acc += c
+                lines.append(f'maixdrone_stage_latency_ms_bucket{{stage="{name}",le="{bound:g}"}} {acc}')
+            acc += counts[-1]
+            lines.append(f'maixdrone_stage_latency_ms_bucket{{stage="{name}",le="+Inf"}} {acc}')
+            lines.append(f'maixdrone_stage_latency_ms_sum{{stage="{name}"}} {hist.sum_ms:.3f}')
+            lines.append(f'maixdrone_stage_latency_ms_count{{stage="{name}"}} {acc}')
+
+        lines.append("# TYPE maixdrone_gc_collections_total counter")
+        for gen, c in enumerate(self.gc_counts):
+            lines.append(f'maixdrone_gc_collections_total{{generation="{gen}"}} {c}')
+
+        # Cùng tên metric phải nằm liền nhau (1 dòng TYPE) -> gom theo thứ tự đăng ký đầu tiên
+        order = {}
+        for g in self.gauges: order.setdefault(g[0], len(order))
+        typed = set()
+        for name, labels, func, kind in sorted(self.gauges, key=lambda g: order[g[0]]):
+            try:
+                value = float(func())
+            except Exception:
+                continue
+            if name not in typed:
+                lines.append(f"# TYPE {name} {kind}")
+                typed.add(name)
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_str}}} {value:g}" if label_str else f"{name} {value:g}")
+
+        lines.append("# TYPE maixdrone_uptime_seconds gauge")
+        lines.append(f"maixdrone_uptime_seconds {time.time() - self.t_start:.1f}")
+        return "\n".join(lines) + "\n"
+
+    def _serve(self, conn, method, path, headers):
+        # Thread mạng: dựng text ngay tại đây (chỉ khi có người hỏi)
+        body = self.render().encode("utf-8")
+        conn.write(METRICS_HEADER % len(body) + body)
+        conn.close_after_flush()
+
+    def summary(self):
+        """Tóm tắt từ lần gọi trước: số mẫu, p50/p95/max từng stage + chi phí ước lượng của chính Profiler"""
+        now = time.perf_counter()
+        wall = max(now - self.t_summary, 1e-9)
+        calls = self.calls - self.calls_summary
+        self.t_summary, self.calls_summary = now, self.calls
+        parts = []
+        for name, hist in list(self.hists.items()):
+            n, p50, p95, max_ms = hist.interval()
+            if n: parts.append(f"{name} {p50:.2f}/{p95:.2f}/{max_ms:.1f}ms x{n}")
+        overhead = calls * self.cost_us / 1e6 / wall
+        return "⏱️ Profile (p50/p95/max): " + (" | ".join(parts) or "chưa có mẫu") + f" | overhead ~{overhead:.2%}"
+
+    def print_summary(self):
+        if self.enable: print(self.summary())
+
+PROFILER = Profiler() # Dùng chung cho mọi module (main, ai, tracker, jpegcache, netcore...)
@@ -0,0 +1,111 @@
+# source/recording.py
+import os
+import struct
+import time
+import numpy as np
+import config
+from source.ai import PoseBatch, LetterboxTransform, NUM_KPTS
+
+# [RECORD] File ghi phiên chạy (append-only, little-endian), để replay.py chạy lại Tracker/Gesture/Cảnh báo trên PC.
+# File header: magic "MDR1", version u8, reserved u8[3]
+# Mỗi bản ghi: kind u8, timestamp f64 (epoch), frame_id u32, count u16 + payload
+#   REC_DETECT    : count x DET_DTYPE (PoseBatch của AIEngine.process_batch, trước khi Tracker sửa)
+#   REC_PREDICT   : frame Scheduler bỏ qua AI (Tracker.predict), không có payload
+#   REC_TRANSFORM : LetterboxTransform mới, payload = src_w, src_h, dst_w, dst_h (u16)
+#   REC_STATIC    : frame Motion Gate bỏ qua AI (giữ nguyên kết quả Tracker), không có payload
+FILE_HEADER = struct.Struct("<4sB3x")
+FILE_MAGIC = b"MDR1"
+FILE_VERSION = 1
+RECORD_HEADER = struct.Struct("<BdIH")
+TRANSFORM = struct.Struct("<HHHH")
+REC_DETECT = 0
+REC_PREDICT = 1
+REC_TRANSFORM = 2
+REC_STATIC = 3
+DET_DTYPE = np.dtype([
+    ('box', '<f4', (4,)), ('score', '<f4'), ('has_points', 'u1'), ('kpts', '<f4', (NUM_KPTS, 3)),
+])
+
+class DetectionRecorder:
+    """
+    Ghi kết quả AI thô của từng frame (không ghi ảnh) -> ~225 byte/người/frame.
+    Ghi nối đuôi qua bộ đệm file, mất điện giữa chừng chỉ mất bản ghi cuối (read_records bỏ qua phần cụt).
+    """
+    def __init__(self, path=None, flush_interval=1.0):
+        self.path = path or getattr(config, "RECORD_PATH", "/root/records/session.mdr")
+        self.flush_interval = flush_interval
+        folder = os.path.dirname(self.path)
+        if folder: os.makedirs(folder, exist_ok=True)
+        self.file = open(self.path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION))
+        self.transform_key = None
+        self.t_flush = time.time()
+        self.frames = 0
+        self.bytes = 0
+
+    def _write(self, kind, t, frame_id, count, payload=b""):
+        data = RECORD_HEADER.pack(kind, t, frame_id & 0xFFFFFFFF, count) + payload
+        self.file.write(data)
+        self.bytes += len(data)
+        if time.time() - self.t_flush > self.flush_interval:
+            self.file.flush()
+            self.t_flush = time.time()
+
+    def record(self, t, frame_id, batch, transform=None):
+        """1 frame có chạy AI: batch là PoseBatch (hoặc None nếu AI lỗi / tắt)"""
+        if transform is not None:
+            key = (transform.src_w, transform.src_h, transform.dst_w, transform.dst_h)
+            if key != self.transform_key:
+                self.transform_key = key
+                self._write(REC_TRANSFORM, t, frame_id, 0, TRANSFORM.pack(*key))
+        n = len(batch) if batch is not None else 0
+        rec = np.zeros(n, dtype=DET_DTYPE)
+        if n:
+            rec['box'] = batch.boxes
+            rec['score'] = batch.scores
+            rec['has_points'] = batch.has_points
+            rec['kpts'] = batch.kpts
+        self._write(REC_DETECT, t, frame_id, n, rec.tobytes())
+        self.frames += 1
+
+    def record_predict(self, t, frame_id, static=False):
+        """1 frame Scheduler cho Tracker dự đoán (static=True: Motion Gate, giữ nguyên kết quả cũ)"""
+        self._write(REC_STATIC if static else REC_PREDICT, t, frame_id, 0)
+        self.frames += 1
+
+    def close(self):
+        if self.file.closed: return
+        self.file.flush()
+        self.file.close()
+
+def read_records(path):
+    """
+    Duyệt file ghi: mỗi phần tử = (kind, timestamp, frame_id, data)
+    data: PoseBatch (REC_DETECT), LetterboxTransform (REC_TRANSFORM) hoặc None (REC_PREDICT / REC_STATIC).
+    """
+    with open(path, "rb") as f:
+        buf = f.read()
+    if len(buf) < FILE_HEADER.size: return
+    magic, version = FILE_HEADER.unpack_from(buf, 0)
+    if magic != FILE_MAGIC or version != FILE_VERSION:
+        raise ValueError(f"Không phải file ghi MaixDrone: {path}")
+    pos = FILE_HEADER.size
+    while pos + RECORD_HEADER.size <= len(buf):
+        kind, t, frame_id, n = RECORD_HEADER.unpack_from(buf, pos)
+        pos += RECORD_HEADER.size
+        if kind == REC_DETECT:
+            size = n * DET_DTYPE.itemsize
+            if pos + size > len(buf): return # Bản ghi cuối bị cụt
+            rec = np.frombuffer(buf, dtype=DET_DTYPE, count=n, offset=pos)
+            pos += size
+            data = PoseBatch(rec['box'].copy(), rec['score'].copy(), rec['kpts'].copy(), rec['has_points'].astype(bool))
+        elif kind == REC_TRANSFORM:
+            if pos + TRANSFORM.size > len(buf): return
+            data = LetterboxTransform(*TRANSFORM.unpack_from(buf, pos))
+            pos += TRANSFORM.size
+        elif kind in (REC_PREDICT, REC_STATIC):
+            data = None
+        else:
+            raise ValueError(f"Bản ghi lạ (kind={kind}) tại byte {pos - RECORD_HEADER.size}")
+        yield kind, t, frame_id, data
@@ -0,0 +1,96 @@
+# source/scheduler.py
+import math
+import config
+
+class InferenceScheduler:
+    """
+    Bộ lập lịch chạy AI (NPU) dùng chung cho main.py và main_web.py.
+    Mỗi frame quyết định: chạy AI thật (tracker.update) hay để Tracker dự đoán (tracker.predict).
+    - Người di chuyển nhanh / độ tin cậy Pose thấp -> chạy AI dày hơn
+    - Cảnh tĩnh -> giãn dần đến SCHED_MAX_SKIP frame giữa 2 lần chạy AI (tiết kiệm pin, giảm nhiệt)
+    - Ngân sách: thời gian AI đo được không vượt quá SCHED_NPU_BUDGET của mỗi frame ở SCHED_TARGET_FPS
+    """
+    def __init__(self, mode=None, gate=None):
+        self.mode = mode or getattr(config, "INFER_SCHEDULER", "adaptive") # "adaptive" | "fixed"
+        self.fixed_skip = getattr(config, "SKIP_FRAMES", 0)
+        self.min_skip = getattr(config, "SCHED_MIN_SKIP", 0)
+        self.max_skip = getattr(config, "SCHED_MAX_SKIP", 4)
+        self.target_fps = getattr(config, "SCHED_TARGET_FPS", 30)
+        self.budget = getattr(config, "SCHED_NPU_BUDGET", 0.6)
+        self.fast_motion = getattr(config, "SCHED_FAST_MOTION", 1.0)  # Chiều cao người / giây
+        self.fast_limb = getattr(config, "SCHED_FAST_LIMB", 0.5)      # Tốc độ cổ tay/khuỷu (chiều cao người / giây)
+        self.min_score = getattr(config, "SCHED_MIN_POSE_SCORE", 0.3)
+
+        self.gate = gate          # [MOTION GATE] MotionGate (None = luôn coi như có chuyển động)
+        self.static = False       # Frame vừa xét bị bỏ qua vì cảnh đứng yên (dùng lại kết quả Tracker cũ)
+        self.since_last = 0       # Số frame đã dự đoán kể từ lần chạy AI gần nhất
+        self.infer_ms = 0.0       # EMA thời gian 1 lần chạy AI (process + update)
+        self.current_skip = self.fixed_skip
+        self.frames = 0
+        self.inferred = 0
+        self.force() # Frame đầu tiên luôn chạy AI
+
+    def should_infer(self, tracker=None, img=None):
+        """Gọi 1 lần mỗi frame. True -> chạy AI, False -> dùng tracker.predict()
+        (hoặc tracker.get_display_objects() nếu self.static: cảnh đứng yên, giữ nguyên kết quả cũ)"""
+        self.frames += 1
+        self.static = False
+        if self.gate is not None and img is not None and not self.gate.check(img):
+            self.static = True
+            self.since_last += 1
+            return False
+        self.current_skip = self._skip_for(tracker)
+        if self.since_last >= self.current_skip:
+            self.since_last = 0
+            self.inferred += 1
+            if self.gate is not None: self.gate.accept()
+            return True
+        self.since_last += 1
+        return False
+
+    def force(self):
+        """Buộc frame tiếp theo chạy AI (VD: vừa bật lại AI, có client mới...)"""
+        self.since_last = self.max_skip + self.fixed_skip + 1
+        if self.gate is not None: self.gate.reset()
+
+    def report_inference(self, ms):
+        """Báo thời gian 1 lần chạy AI để tính ngân sách NPU"""
+        self.infer_ms = ms if self.infer_ms == 0 else self.infer_ms * 0.9 + ms * 0.1
+
+    def _skip_for(self, tracker):
+        if self.mode != "adaptive":
+            return self.fixed_skip
+
+        motion = getattr(tracker, "motion_stats", None) if tracker is not None else None
+        if motion and motion['count'] > 0:
+            # Độ tin cậy thấp -> cần dữ liệu thật ngay
+            if motion['min_pose_score'] < self.min_score:
+                return self.min_skip
+            if motion.get('gesture_active'):
+                # Cửa sổ bỏ phiếu / vẫy tay tính theo frame AI -> giãn ra sẽ làm trễ hoặc mất cảnh báo
+                skip = self.min_skip
+            else:
+                # Nội suy tuyến tính: đứng yên -> max_skip, nhanh (>= fast_motion) -> min_skip.
+                # Tay cử động (vẫy, giơ tay) tính như di chuyển dù box gần như đứng yên
+                k = max(motion['max_speed'] / max(self.fast_motion, 1e-6),
+                        motion.get('max_limb_speed', 0.0) / max(self.fast_limb, 1e-6))
+                k = min(1.0, k)
+                skip = int(round(self.max_skip - k * (self.max_skip - self.min_skip)))
+        else:
+            skip = self.max_skip # Không có ai -> chỉ quét định kỳ để phát hiện người mới
+
+        # Ngân sách NPU: infer_ms / (frame_ms * (skip + 1)) <= budget
+        if self.infer_ms > 0 and self.budget > 0:
+            frame_ms = 1000.0 / max(self.target_fps, 1)
+            need = int(math.ceil(self.infer_ms / (self.budget * frame_ms))) - 1
+            skip = max(skip, need)
+        # max_skip là giới hạn cứng để khung xương không bị "cũ" quá lâu (ưu tiên hơn ngân sách)
+        return max(self.min_skip, min(skip, max(self.max_skip, self.min_skip)))
+
+    def static_ratio(self):
+        """Tỷ lệ frame bỏ qua AI nhờ Motion Gate"""
+        return self.gate.skip_ratio() if self.gate is not None else 0.0
+
+    def infer_ratio(self):
+        """Tỷ lệ frame có chạy AI"""
+        return self.inferred / self.frames if self.frames else 0.0
@@ -1,188 +1,357 @@
 # source/stream.py
-import socket
+import threading
 import time
-import select # [NEW] Dùng để kiểm tra kết nối không chặn (Non-blocking)
 import binascii # [NEW] Để mã hóa ảnh sang text (Base64)
+import config
+from source.netcore import get_core, Connection, Listener, HttpServer
+from source import msgproto
+from source.jpegcache import EncodedFrame
+
+STREAM_HEADER = (b"HTTP/1.1 200 OK\r\n"
+                 b"Content-Type: multipart/x-mixed-replace; boundary=frame\r\n\r\n")
+READY_RESPONSE = (b"HTTP/1.1 200 OK\r\n"
+                  b"Content-Type: text/plain\r\n\r\n"
+                  b"MaixDrone Video Streamer Ready.")
+
+class AdaptiveBitrate:
+    """
+    [ABR] Bộ điều khiển chất lượng stream cho 1 người xem, giữ độ trễ gửi quanh STREAM_TARGET_LATENCY.
+    Đo: thông lượng gửi thực tế (EMA byte/s) và độ trễ hàng chờ = byte đang chờ / thông lượng.
+    - Nghẽn (trễ > target hoặc bị bỏ frame): giảm quality -> thu nhỏ ảnh -> giảm số frame (decimate)
+    - Mạng tốt liên tục (trễ < 1/2 target): khôi phục theo thứ tự ngược lại, quality tăng dần từng bước
+    Sau mỗi lần thay đổi chờ vài frame (cooldown) để số đo ổn định rồi mới quyết định tiếp.
+    """
+    def __init__(self, quality=None):
+        self.enabled = getattr(config, "STREAM_ADAPTIVE", True)
+        self.target = getattr(config, "STREAM_TARGET_LATENCY", 0.3)
+        self.q_min = getattr(config, "JPEG_QUALITY_MIN", 10)
+        self.q_max = getattr(config, "JPEG_QUALITY_MAX", 60)
+        self.scales = list(getattr(config, "STREAM_SCALES", (1.0, 0.75, 0.5)))
+        self.max_decimate = getattr(config, "STREAM_MAX_DECIMATE", 4)
+        self.cooldown_frames = getattr(config, "STREAM_ABR_COOLDOWN", 5)
+        self.quality = int(quality or getattr(config, "JPEG_QUALITY", 25))
+        self.scale_idx = 0
+        self.decimate = 1     # Gửi 1 trên N frame
+        self.throughput = 0.0 # byte/s
+        self.latency = 0.0    # giây
+        self._bytes = 0
+        self._t = time.time()
+        self._dropped = 0
+        self._cooldown = 0
+        self._good = 0
+
+    @property
+    def scale(self):
+        return self.scales[self.scale_idx]
+
+    def update(self, bytes_sent, backlog, dropped):
+        """Gọi mỗi lần có frame mới cho người xem này (thread mạng)"""
+        now = time.time()
+        dt = now - self._t
+        if dt > 0:
+            rate = (bytes_sent - self._bytes) / dt
+            self.throughput = rate if self.throughput == 0 else self.throughput * 0.8 + rate * 0.2
+        self._bytes = bytes_sent
+        self._t = now
+        self.latency = backlog / max(self.throughput, 1.0)
+        congested = dropped > self._dropped or self.latency > self.target
+        self._dropped = dropped
+        if not self.enabled: return
+
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return
+        if congested:
+            self._good = 0
+            self._degrade()
+            self._cooldown = self.cooldown_frames
+        elif self.latency < self.target * 0.5:
+            self._good += 1
+            if self._good >= self.cooldown_frames * 3:
+                self._good = 0
+                self._improve()
+                self._cooldown = self.cooldown_frames
+
+    def _degrade(self):
+        if self.quality > self.q_min:
+            self.quality = max(self.q_min, self.quality - 5)
+        elif self.scale_idx < len(self.scales) - 1:
+            self.scale_idx += 1
+        elif self.decimate < self.max_decimate:
+            self.decimate += 1
+
+    def _improve(self):
+        if self.decimate > 1:
+            self.decimate -= 1
+        elif self.scale_idx > 0:
+            self.scale_idx -= 1
+        elif self.quality < self.q_max:
+            self.quality = min(self.q_max, self.quality + 2)
+
+class StreamClient(Connection):
+    """
+    1 người xem MJPEG với bộ đệm gửi riêng (non-blocking, chạy trong thread mạng).
+    - out[0]: gói đang gửi dở -> luôn gửi trọn gói để không vỡ multipart
+    - out[1]: gói mới nhất đang chờ; frame mới đến khi vẫn còn gói chờ -> thay thế (drop-to-latest)
+    Người xem chậm chỉ bị mất frame của chính họ, không làm chậm Drone hay người xem khác.
+    """
+    def __init__(self, core, sock, addr, on_close=None, quality=None):
+        super().__init__(core, sock, addr, on_close=on_close)
+        self.dropped = 0
+        self.rate = AdaptiveBitrate(quality)
+        self.offered = 0 # Số frame đã xét (dùng cho decimate, chỉ thread xử lý ảnh đếm)
+
+    def wants_frame(self):
+        """[ABR] Bỏ bớt frame theo decimate của người xem này (thread xử lý ảnh)"""
+        self.offered += 1
+        return self.offered % self.rate.decimate == 0
+
+    def variant(self):
+        """(quality, scale) hiện tại của người xem này"""
+        return self.rate.quality, self.rate.scale
+
+    @property
+    def sent_frames(self):
+        return max(0, self.sent_items - 1) # Trừ gói Header HTTP
+
+    def queue(self, packet):
+        self.rate.update(self.bytes_sent, self.out_bytes, self.dropped)
+        if len(self.out) > 1:
+            self.out_bytes -= len(self.out[-1])
+            self.out.pop()
+            self.dropped += 1
+        self.write(packet)
+
+    def backlog(self):
+        """Số byte đang chờ gửi"""
+        return self.out_bytes
 
 class StreamServer:
-    def __init__(self, host, port, timeout):
+    def __init__(self, host, port, timeout, max_clients=None, core=None):
         self.host = host
         self.port = port
-        self.timeout = timeout
-        self.sock = None
-        self.conn = None
-        
+        self.timeout = timeout # Người xem không nhận được byte nào trong timeout giây -> ngắt
+        self.max_clients = max_clients or getattr(config, "STREAM_MAX_CLIENTS", 4)
+        self.core = core
+        self.http = None
+        self.clients = [] # [FAN-OUT] Nhiều người xem cùng lúc, mỗi người 1 bộ đệm gửi (chỉ sửa trong thread mạng)
+        self.encoded_frames = 0
+        self.quality = getattr(config, "JPEG_QUALITY", 25) # Quality khởi đầu của người xem mới
+        self.client_event = threading.Event() # Có ít nhất 1 người xem
+
     def start(self):
-        """Khởi tạo Socket Server (Có cơ chế thử lại nếu cổng bị kẹt)"""
+        """Khởi tạo cổng HTTP trên NetCore (Có cơ chế thử lại nếu cổng bị kẹt)"""
+        self.core = self.core or get_core()
         while True:
             try:
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                self.sock.bind((self.host, self.port))
-                self.sock.listen(1)
-                
+                self.http = HttpServer(self.core, self.host, self.port, self.timeout, self.max_clients)
+                self.http.add_route("/stream", self._open_stream)
+                self.http.default_handler = self._ready
+
                 print(f"📡 Video Stream: http://{self.host}:{self.port}/stream")
                 break
             except Exception as e:
                 print(f"⚠️ Cổng mạng đang bận ({e}), thử lại sau 2s...")
                 time.sleep(2)
+        self.core.call_later(1.0, self._watchdog)
 
-    def wait_for_client(self):
-        """Chờ kết nối và xử lý HTTP Request (Dashboard hoặc Stream)"""
-        while True:
-            try:
-                self.close_client()
-                print("⏳ Đang chờ kết nối...")
-                conn, addr = self.sock.accept()
-                conn.settimeout(self.timeout)
-                
-                # Đọc Header để biết trình duyệt muốn gì
-                request = conn.recv(1024).decode('utf-8', errors='ignore')
-                
-                # [ROUTER] Phân loại yêu cầu
-                if "GET /stream" in request:
-                    # Yêu cầu luồng Video -> Chấp nhận và giữ kết nối
-                    print(f"🔗 Stream Connected: {addr}")
-                    conn.sendall(b"HTTP/1.1 200 OK\r\n"
-                                 b"Content-Type: multipart/x-mixed-replace; boundary=frame\r\n\r\n")
-                    self.conn = conn
-                    return True
-                
-                else:
-                    # [UPDATE] Bỏ HTML Dashboard, trả về thông báo text đơn giản
-                    response = (b"HTTP/1.1 200 OK\r\n"
-                                b"Content-Type: text/plain\r\n\r\n"
-                                b"MaixDrone Video Streamer Ready.")
-                    conn.sendall(response)
-                    conn.close() # Đóng ngay để trình duyệt gọi tiếp /stream
-                    
-            except Exception as e:
-                print(f"⚠️ Lỗi kết nối: {e}")
-                return False
+    def add_route(self, path, handler):
+        """Thêm đường dẫn HTTP trên cùng cổng (VD: /metrics). handler(conn, method, path, headers)"""
+        self.http.add_route(path, handler)
+
+    @property
+    def conn(self):
+        """Tương thích code cũ: kết nối của người xem đầu tiên (hoặc None)"""
+        clients = self.clients
+        return clients[0].sock if clients else None
+
+    # --- Thread mạng ---
+    def _ready(self, conn, method, path, headers):
+        # [UPDATE] Bỏ HTML Dashboard, trả về thông báo text đơn giản
+        conn.write(READY_RESPONSE)
+        conn.close_after_flush() # Đóng ngay để trình duyệt gọi tiếp /stream
+
+    def _open_stream(self, conn, method, path, headers):
+        # Chuyển socket sang StreamClient (bộ đệm drop-to-latest)
+        self.core.set_events(conn.sock, 0, None)
+        client = StreamClient(self.core, conn.sock, conn.addr, on_close=self._on_client_close, quality=self.quality)
+        clients = list(self.clients)
+        if len(clients) >= self.max_clients:
+            # Đủ người xem -> nhường chỗ cho người mới (người cũ nhất bị ngắt)
+            old = clients.pop(0)
+            old.on_close = None
+            old.close()
+        print(f"🔗 Stream Connected: {conn.addr} ({len(clients) + 1} viewer)")
+        client.write(STREAM_HEADER)
+        clients.append(client)
+        self.clients = clients
+        self.client_event.set()
+
+    def _on_client_close(self, client):
+        print(f"👋 Client {client.addr} ngắt kết nối hoặc mạng quá yếu.")
+        self.clients = [c for c in self.clients if c is not client]
+        if not self.clients: self.client_event.clear()
+
+    def _fan_out(self, targets):
+        for client, packet in targets:
+            if not client.closed: client.queue(packet)
+
+    def _watchdog(self):
+        """Ngắt người xem treo (còn dữ liệu chờ nhưng không nhận byte nào trong timeout giây)"""
+        now = time.time()
+        for client in list(self.clients):
+            if client.backlog() and now - client.last_progress > self.timeout:
+                client.close()
+        self.core.call_later(1.0, self._watchdog)
+
+    # --- Thread xử lý ảnh (thread-safe) ---
+    def wait_for_client(self, timeout=None):
+        """Chờ (chặn) đến khi có ít nhất 1 người xem /stream"""
+        if not self.clients: print("⏳ Đang chờ kết nối...")
+        return self.client_event.wait(timeout)
 
     def check_new_client(self):
-        """[NEW] Kiểm tra kết nối mới (Non-blocking) dùng cho main.py"""
-        try:
-            # Kiểm tra xem có ai đang gọi cổng 80 không?
-            readable, _, _ = select.select([self.sock], [], [], 0)
-            if readable:
-                conn, addr = self.sock.accept()
-                conn.settimeout(self.timeout)
-                request = conn.recv(1024).decode('utf-8', errors='ignore')
-                
-                if "GET /stream" in request:
-                    print(f"🔗 Stream Connected: {addr}")
-                    conn.sendall(b"HTTP/1.1 200 OK\r\n"
-                                 b"Content-Type: multipart/x-mixed-replace; boundary=frame\r\n\r\n")
-                    self.close_client() # Đóng kết nối cũ (chỉ hỗ trợ 1 client stream)
-                    self.conn = conn
-                else:
-                    # [UPDATE] Bỏ HTML Dashboard
-                    response = (b"HTTP/1.1 200 OK\r\n"
-                                b"Content-Type: text/plain\r\n\r\n"
-                                b"MaixDrone Video Streamer Ready.")
-                    conn.sendall(response)
-                    conn.close()
-        except Exception as e:
-            pass # Không in lỗi để tránh spam terminal
+        """Giữ để tương thích: NetCore tự nhận kết nối mới, không cần gọi mỗi frame"""
+        return bool(self.clients)
 
-    def send_frame(self, img_obj, quality):
-        """Nén và gửi ảnh (Bắt lỗi kỹ càng)"""
+    def has_clients(self):
+        return bool(self.clients)
 
-        if not self.conn: return False
-        
+    def send_frame(self, img_obj, quality, frame=None):
+        """Phát frame cho tất cả người xem, mỗi mức (quality, scale) đang dùng nén đúng 1 lần.
+        frame: EncodedFrame dùng chung (JpegCache) để Tin nhắn/Ghi clip dùng lại bản đã nén.
+        False nếu không còn người xem nào"""
+        clients = self.clients
+        if not clients: return False
+        self.quality = quality
+        frame = frame or EncodedFrame(None, img_obj)
+
+        packets = {}
+        targets = []
+        for client in clients:
+            if not client.wants_frame(): continue
+            key = client.variant()
+            if key not in packets:
+                packets[key] = self._encode(frame, *key)
+            if packets[key] is not None:
+                targets.append((client, packets[key]))
+        if targets:
+            self.core.call_soon(self._fan_out, targets)
+        return True
+
+    def _encode(self, frame, quality, scale):
         try:
-            # Nén ảnh
-            jpg_bytes = img_obj.to_jpeg(quality=quality).to_bytes()
-            
-            # Gửi Header + Data
-            # Gộp chung thành 1 gói tin lớn để giảm số lần gọi lệnh send -> Ổn định hơn
-            packet = (b"--frame\r\n"
-                      b"Content-Type: image/jpeg\r\n"
-                      b"Content-Length: " + str(len(jpg_bytes)).encode() + b"\r\n\r\n" + 
-                      jpg_bytes + b"\r\n")
-            
-            self.conn.sendall(packet)
-            return True
-            
-        except (BrokenPipeError, ConnectionResetError, socket.timeout):
-            print("👋 Client ngắt kết nối hoặc mạng quá yếu.")
-            return False
+            # Nén ảnh (hoặc lấy bản đã nén trong cache)
+            jpg_bytes = frame.jpeg(quality, scale)
         except Exception as e:
-            print(f"⚠️ Lỗi gửi frame: {e}")
-            return False
+            print(f"⚠️ Lỗi nén frame: {e}")
+            return None
+        if jpg_bytes is None: return None
+        self.encoded_frames += 1
+
+        # Gửi Header + Data
+        # Gộp chung thành 1 gói tin lớn, dùng chung (không copy) cho mọi người xem cùng mức
+        return (b"--frame\r\n"
+                b"Content-Type: image/jpeg\r\n"
+                b"Content-Length: " + str(len(jpg_bytes)).encode() + b"\r\n\r\n" +
+                jpg_bytes + b"\r\n")
+
+    def stats(self):
+        """Thống kê từng người xem: frame đã gửi/bị bỏ (drop-to-latest), byte đang chờ, mức ABR hiện tại"""
+        return [{'addr': c.addr, 'sent': c.sent_frames, 'dropped': c.dropped, 'backlog': c.backlog(),
+                 'quality': c.rate.quality, 'scale': c.rate.scale, 'decimate': c.rate.decimate,
+                 'kbps': c.rate.throughput * 8 / 1000, 'latency_ms': c.rate.latency * 1000}
+                for c in self.clients]
 
     def close_client(self):
-        if self.conn:
-            try: 
-                self.conn.shutdown(socket.SHUT_RDWR)
-                self.conn.close()
-            except: pass
-            self.conn = None
+        def _close_all():
+            for client in list(self.clients):
+                client.close()
+        self.core.call_soon(_close_all)
 
 class MessageServer:
-    """Server riêng để gửi thông báo Text qua cổng 8888"""
-    def __init__(self, port=8888):
+    """Server riêng để gửi thông báo + ảnh bằng chứng qua cổng 8888 (chạy trên NetCore, gửi không chặn).
+    MESSAGE_PROTOCOL = "binary": frame có độ dài (source/msgproto.py), JPEG gửi nguyên bản.
+    MESSAGE_PROTOCOL = "text": giao thức dòng cũ (IMG:<base64>) cho bản pc_serial_monitor.py cũ."""
+    def __init__(self, port=8888, core=None):
         self.port = port
-        self.sock = None
+        self.core = core
+        self.listener = None
         self.client = None
-    
+        self.binary = getattr(config, "MESSAGE_PROTOCOL", "binary") == "binary"
+        self.max_buffer = getattr(config, "MESSAGE_MAX_BUFFER", 512 * 1024) # PC đọc không kịp -> bỏ tin mới
+
     def start(self):
+        self.core = self.core or get_core()
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.sock.bind(('0.0.0.0', self.port))
-            self.sock.listen(1)
-            self.sock.setblocking(False) # Non-blocking
+            self.listener = Listener(self.core, '0.0.0.0', self.port, self._on_accept, backlog=1)
             print(f"💬 Message Server đang chạy tại Port {self.port}")
         except Exception as e:
             print(f"❌ Lỗi khởi tạo Message Server: {e}")
 
+    def _on_accept(self, sock, addr):
+        print(f"🔗 Máy tính đã kết nối nhận tin nhắn: {addr}")
+        if self.client:
+            self.client.on_close = None
+            self.client.close()
+        self.client = Connection(self.core, sock, addr, on_close=self._on_close)
+
+    def _on_close(self, conn):
+        print("👋 Máy tính đã ngắt kết nối tin nhắn.")
+        if self.client is conn: self.client = None
+
+    def _write(self, *parts):
+        client = self.client
+        if client is None: return
+        if client.out_bytes + sum(len(p) for p in parts) > self.max_buffer:
+            return # [FIX] Máy tính bận đọc không nhận kịp -> Bỏ qua, không chờ
+        for part in parts: # Header + payload ghi riêng -> không ghép (copy) ảnh lớn
+            client.write(part)
+
+    def backlog(self):
+        """Số byte đang chờ gửi tới máy tính"""
+        client = self.client
+        return client.out_bytes if client else 0
+
+    def send_message(self, msg_type, payload, track_id=-1, timestamp=None):
+        """Gửi 1 frame nhị phân bất kỳ (msgproto). False nếu không có máy tính / dùng giao thức text"""
+        if not self.client or not self.binary: return False
+        ts = time.time() if timestamp is None else timestamp
+        self.core.call_soon(self._write, msgproto.pack_header(msg_type, ts, track_id, len(payload)), payload)
+        return True
+
     def check_client(self):
-        """Kiểm tra xem máy tính có kết nối vào không"""
-        if not self.sock: return
-        try:
-            readable, _, _ = select.select([self.sock], [], [], 0)
-            if readable:
-                conn, addr = self.sock.accept()
-                print(f"🔗 Máy tính đã kết nối nhận tin nhắn: {addr}")
-                conn.settimeout(0.05) # [FIX] Timeout gửi cực ngắn (50ms) để không làm treo Drone
-                if self.client: 
-                    try: self.client.close()
-                    except: pass
-                self.client = conn
-        except: pass
-
-    def send(self, msg):
-        """Gửi tin nhắn xuống máy tính"""
+        """Giữ để tương thích: NetCore tự nhận kết nối từ máy tính"""
+        return self.client is not None
+
+    def send(self, msg, track_id=-1):
+        """Gửi tin nhắn xuống máy tính (None = hết cảnh báo)"""
         if not self.client: return
-        try:
+        if not self.binary:
             # Gửi kèm ký tự xuống dòng để bên nhận biết hết câu
-            data = (str(msg) + "\n").encode('utf-8')
-            self.client.sendall(data)
-        except socket.timeout:
-            pass # [FIX] Nếu máy tính bận đọc không nhận kịp -> Bỏ qua, không chờ
-        except:
-            print("👋 Máy tính đã ngắt kết nối tin nhắn.")
-            self.client = None
-
-    def send_image(self, img_obj):
-        """[NEW] Mã hóa ảnh thành Base64 và gửi đi như tin nhắn text"""
+            self.core.call_soon(self._write, (str(msg) + "\n").encode('utf-8'))
+            return
+        payload = b"" if msg is None else str(msg).encode('utf-8')
+        header = msgproto.pack_header(msgproto.MSG_CLEAR if msg is None else msgproto.MSG_ALERT,
+                                      time.time(), track_id, len(payload))
+        self.core.call_soon(self._write, header, payload)
+
+    def send_image(self, img_obj, track_id=-1, frame=None):
+        """[NEW] Gửi ảnh bằng chứng (JPEG). frame: EncodedFrame dùng chung (JpegCache) nếu có"""
         if not self.client: return
         try:
-            # 1. Nén ảnh thành JPEG (Quality 80 để nhẹ)
-            # to_jpeg trả về đối tượng Bytes
-            jpg_bytes = img_obj.to_jpeg(quality=80).to_bytes()
-            
-            # 2. Mã hóa sang Base64 (để gửi qua socket text an toàn)
-            # b2a_base64 trả về bytes có kèm \n ở cuối
-            b64_bytes = binascii.b2a_base64(jpg_bytes)
-            b64_str = b64_bytes.decode('utf-8').strip()
-            
-            # 3. Gửi với tiền tố IMG:
-            # Format: IMG:<base64_string>\n
-            msg = f"IMG:{b64_str}\n"
-            self.client.sendall(msg.encode('utf-8'))
-            # print(f"📸 Đã gửi ảnh ({len(msg)} bytes)")
+            # 1. Nén ảnh thành JPEG (Quality 80 để rõ chi tiết) - qua cache, không nén trùng
+            frame = frame or EncodedFrame(None, img_obj)
+            jpg_bytes = frame.jpeg(getattr(config, "EVIDENCE_JPEG_QUALITY", 80))
+            if jpg_bytes is None: return
+
+            if self.binary:
+                # 2. Gửi nguyên bản: header 20 byte + JPEG (không base64, không ghép chuỗi)
+                header = msgproto.pack_header(msgproto.MSG_IMAGE, time.time(), track_id, len(jpg_bytes))
+                self.core.call_soon(self._write, header, jpg_bytes)
+            else:
+                # Giao thức cũ: IMG:<base64_string>\n
+                b64_bytes = binascii.b2a_base64(jpg_bytes)
+                self.core.call_soon(self._write, b"IMG:" + b64_bytes.strip() + b"\n")
         except Exception as e:
-            print(f"⚠️ Lỗi gửi ảnh: {e}")
\ No newline at end of file
+            print(f"⚠️ Lỗi gửi ảnh: {e}")
@@ -1,66 +1,115 @@
+import errno
+import selectors
 import socket
 import time
 import datetime # [NEW] Để lấy giờ hiện tại
 import os       # [NEW] Để chạy lệnh set giờ hệ thống
+import config
+from source.gesture import GESTURE_ALERTS # [RULES] Cử chỉ -> Thông báo
+from source.netcore import get_core, Connection
 
 class TinkerClient:
-    def __init__(self, host, port):
+    """
+    Gửi thông báo sang Tinkerboard. Kết nối do NetCore quản lý (thread mạng):
+    connect non-blocking, tự kết nối lại với backoff tăng dần, đồng bộ giờ không chặn.
+    Thread xử lý ảnh chỉ gọi send_pose() (không bao giờ chờ mạng).
+    """
+    def __init__(self, host, port, core=None):
         self.host = host
         self.port = port
-        self.sock = None
-        self.last_connect_time = 0
-        self.connect_cooldown = 3.0 # Thử lại sau mỗi 3s nếu mất kết nối
+        self.core = core
+        self.sock = None            # Socket đã kết nối (None nếu chưa)
+        self.conn = None
+        self.started = False
+        self.connect_timeout = getattr(config, "TINKER_CONNECT_TIMEOUT", 3.0)
+        self.backoff_min = getattr(config, "TINKER_RECONNECT_MIN", 1.0)
+        self.backoff_max = getattr(config, "TINKER_RECONNECT_MAX", 30.0)
+        self.backoff = self.backoff_min
         self.last_send_time = 0     # [NEW] Biến lưu thời gian gửi tin cuối cùng
+        self._pending = None        # Socket đang connect dở
+        self._rx = b""
 
     def connect(self):
-        """Thiết lập kết nối Socket"""
-        if self.sock: return True
-        
-        # Tránh spam kết nối liên tục gây lag
-        if time.time() - self.last_connect_time < self.connect_cooldown:
-            return False
-
-        self.last_connect_time = time.time()
-        try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.settimeout(0.1) # Non-blocking connect (quan trọng để không treo Drone)
-            self.sock.connect((self.host, self.port))
-            print(f"✅ [TinkerClient] Connected to {self.host}:{self.port}")
-            
-            # [NEW] Đồng bộ thời gian ngay khi kết nối thành công
-            self.sync_clock()
-            
-            return True
-        except Exception as e:
-            print(f"⚠️ [TinkerClient] Connect failed: {e}") # [DEBUG] Bật lên để xem lỗi
-            self.sock = None
-            return False
-
-    def sync_clock(self):
-        """Hỏi giờ từ TinkerBoard và cập nhật cho MaixCam"""
-        try:
-            self.sock.sendall(b"SYNC_REQ")
-            # Tăng timeout tạm thời để chờ phản hồi
-            self.sock.settimeout(1.0)
-            data = self.sock.recv(1024)
-            self.sock.settimeout(0.1) # Trả về timeout ngắn
-            
-            msg = data.decode('utf-8').strip()
-            if msg.startswith("SYNC_TIME:"):
-                ts = float(msg.split(":")[1])
-                # Format lệnh date của Linux: date -s "YYYY-MM-DD HH:MM:SS"
-                dt_str = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-                print(f"⏰ Syncing system time to: {dt_str}")
-                os.system(f'date -s "{dt_str}"')
-        except Exception as e:
-            print(f"⚠️ Time sync failed: {e}")
-            # Reset timeout nếu lỗi
-            if self.sock: self.sock.settimeout(0.1)
+        """Bắt đầu kết nối nền (không chặn). True nếu đã kết nối"""
+        if not self.started:
+            self.started = True
+            self.core = self.core or get_core()
+            self.core.call_soon(self._connect)
+        return self.sock is not None
+
+    # --- Thread mạng ---
+    def _connect(self):
+        if not self.started or self.conn is not None or self._pending is not None: return
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False) # Non-blocking connect (quan trọng để không treo Drone)
+        err = sock.connect_ex((self.host, self.port))
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            sock.close()
+            self._retry(f"Connect failed: {os.strerror(err)}")
+            return
+        self._pending = sock
+        self.core.set_events(sock, selectors.EVENT_WRITE, self._on_connect)
+        self.core.call_later(self.connect_timeout, self._connect_timeout, sock)
+
+    def _on_connect(self, sock, mask):
+        self.core.set_events(sock, 0, None)
+        self._pending = None
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            sock.close()
+            self._retry(f"Connect failed: {os.strerror(err)}")
+            return
+        print(f"✅ [TinkerClient] Connected to {self.host}:{self.port}")
+        self.backoff = self.backoff_min
+        self._rx = b""
+        self.conn = Connection(self.core, sock, (self.host, self.port), on_data=self._on_data, on_close=self._on_close)
+        self.sock = sock
+
+        # [NEW] Đồng bộ thời gian ngay khi kết nối thành công (phản hồi xử lý trong _on_data)
+        self.conn.write(b"SYNC_REQ")
+
+    def _connect_timeout(self, sock):
+        if self._pending is not sock: return
+        self.core.set_events(sock, 0, None)
+        self._pending = None
+        sock.close()
+        self._retry("Connect failed: timeout")
+
+    def _retry(self, reason):
+        print(f"⚠️ [TinkerClient] {reason} (thử lại sau {self.backoff:.0f}s)")
+        self.core.call_later(self.backoff, self._connect)
+        self.backoff = min(self.backoff * 2, self.backoff_max)
 
+    def _on_data(self, conn, data):
+        self._rx = (self._rx + data)[-1024:]
+        msg = self._rx.decode('utf-8', errors='ignore').strip()
+        if msg.startswith("SYNC_TIME:"):
+            self._rx = b""
+            try:
+                self.sync_clock(float(msg.split(":")[1]))
+            except Exception as e:
+                print(f"⚠️ Time sync failed: {e}")
+
+    def _on_close(self, conn):
+        if self.conn is not conn: return
+        self.conn = None
+        self.sock = None
+        self._retry("👋 Mất kết nối Tinkerboard")
+
+    def sync_clock(self, ts):
+        """Cập nhật giờ hệ thống MaixCam theo giờ TinkerBoard gửi về"""
+        # Format lệnh date của Linux: date -s "YYYY-MM-DD HH:MM:SS"
+        dt_str = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"⏰ Syncing system time to: {dt_str}")
+        os.system(f'date -s "{dt_str}"')
+
+    def _write(self, data):
+        if self.conn is not None: self.conn.write(data)
+
+    # --- Thread xử lý ảnh (thread-safe) ---
     def send_pose(self, objects):
-        # Tự động kết nối nếu chưa có
-        if not self.sock:
-            if not self.connect(): return
+        # Tự động kết nối nếu chưa có (kết nối chạy nền, frame này bỏ qua)
+        if not self.connect(): return
 
         # [UPDATE] Rate Limit: Chỉ gửi 1 lần mỗi giây (Delay 1s)
         if time.time() - self.last_send_time < 1.0:
@@ -70,18 +119,11 @@ class TinkerClient:
         messages = []
         for obj in objects:
             gestures = obj.get('gestures', [])
-            
-            # Mapping cử chỉ sang thông báo đặc biệt (giống logic trong ui.py)
-            special_msg = None
-            if "Cheo Tay Tren Dau" in gestures:
-                special_msg = "EMERGENCY STOP"
-            elif "Vay Tay Phai" in gestures:
-                special_msg = "URGENT ATTENTION"
-            elif "Trai Cao" in gestures:
-                special_msg = "SHORTAGE OF MATERIAL"
-            elif "Phai Cao" in gestures:
-                special_msg = "TECHNICAL OR QUALITY ISSUE"
-            
+
+            # Mapping cử chỉ sang thông báo đặc biệt (bảng dùng chung với ui.py)
+            alert = GESTURE_ALERTS.for_gestures(gestures)
+            special_msg = alert['text'] if alert else None
+
             if special_msg:
                 # [UPDATE] Thêm thời gian gửi từ MaixCam (Send Time)
                 # Format: [HH:MM:SS.ms] ACTION: Message
@@ -90,20 +132,19 @@ class TinkerClient:
 
         if not messages: return # Không có thông báo đặc biệt thì không gửi
 
-        try:
-            # Gửi các dòng thông báo, ngăn cách bằng xuống dòng
-            msg = "\n".join(messages) + "\n"
-            self.sock.sendall(msg.encode('utf-8'))
-            
-            # [UPDATE] Cập nhật thời gian gửi và in ra Terminal MaixCam
-            self.last_send_time = time.time()
-            print(f"[MaixCam Sent] {msg.strip()}")
-        except Exception as e:
-            print(f"[TinkerClient] Send error: {e}")
-            self.close()
+        # Gửi các dòng thông báo, ngăn cách bằng xuống dòng (ghi qua bộ đệm của thread mạng)
+        msg = "\n".join(messages) + "\n"
+        self.core.call_soon(self._write, msg.encode('utf-8'))
+
+        # [UPDATE] Cập nhật thời gian gửi và in ra Terminal MaixCam
+        self.last_send_time = time.time()
+        print(f"[MaixCam Sent] {msg.strip()}")
 
     def close(self):
-        if self.sock:
-            try: self.sock.close()
-            except: pass
-            self.sock = None
\ No newline at end of file
+        def _close():
+            self.started = False
+            if self.conn is not None:
+                conn, self.conn = self.conn, None
+                conn.close()
+            self.sock = None
+        if self.core is not None: self.core.call_soon(_close)
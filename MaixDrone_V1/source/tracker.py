@@ -1,8 +1,12 @@
 import math
 import time
+import numpy as np
 import config
 from source.postprocess import PoseFilter # [FIX] Import bộ lọc
-from source.gesture import PoseEstimator # [NEW] Import bộ phân tích cử chỉ
+from source.gesture import PoseEstimator, update_batch # [NEW] Import bộ phân tích cử chỉ
+from source.kalman import KalmanBoxBank # [NEW] Kalman dạng mảng cho box
+from source.profiler import PROFILER # [PROFILE] Đo filter / gesture
+from source.association import ASSOCIATORS, box_centers, build_cost_matrix # [NEW] Ghép cặp Track-Detection
 
 class ObjectTracker:
     def __init__(self):
@@ -13,145 +17,161 @@ class ObjectTracker:
         self.max_miss_count = 30  # [UPDATE] Tăng lên 30 frame (1s) để chịu được vật cản che khuất
         self.dist_threshold = 100 # Khoảng cách tối đa để coi là cùng 1 người (pixel)
         self.filter = PoseFilter() # [FIX] Khởi tạo bộ lọc
+        # [KALMAN] Mô hình chuyển động vận tốc không đổi cho box (thay EMA vận tốc + EMA box)
+        self.kf = KalmanBoxBank(std_pos=getattr(config, "KALMAN_STD_POS", 1.0 / 20),
+                                std_vel=getattr(config, "KALMAN_STD_VEL", 1.0 / 160),
+                                std_meas=getattr(config, "KALMAN_STD_MEAS", 1.0 / 20))
+        self.transform = None # [NEW] LetterboxTransform dùng chung với AIEngine (set_transform)
+        self.clock = time.time # [REPLAY] Nguồn thời gian (replay.py gán thời điểm đã ghi -> kết quả lặp lại được)
+        # [SCHEDULER] Tóm tắt chuyển động sau mỗi lần update (đọc từ thread khác nên gán nguyên dict)
+        self.motion_stats = {'count': 0, 'max_speed': 0.0, 'max_limb_speed': 0.0, 'min_pose_score': 1.0, 'gesture_active': False}
+
+        # [ASSOCIATION] Thuật toán ghép cặp: "greedy" (cách cũ) hoặc "hungarian" (tối ưu toàn cục)
+        self.association = getattr(config, "TRACKER_ASSOCIATION", "greedy")
+        self.associate = ASSOCIATORS.get(self.association, ASSOCIATORS["greedy"])
+        self.w_dist = getattr(config, "TRACKER_W_DIST", 1.0)
+        self.w_iou = getattr(config, "TRACKER_W_IOU", 0.0)
+        self.w_pose = getattr(config, "TRACKER_W_POSE", 0.0)
+
+    def set_transform(self, transform):
+        """Nhận LetterboxTransform từ AIEngine để biết kích thước ảnh thật (kẹp box dự đoán vào khung hình)"""
+        self.transform = transform
 
     def update(self, ai_results):
         """
-        Thuật toán Centroid Tracking cơ bản:
-        So sánh tâm của Box mới với Box cũ để gán ID.
+        Thuật toán Centroid Tracking:
+        So sánh tâm dự đoán của Box cũ với tâm Box mới để gán ID
+        (ma trận chi phí vector hoá + ghép cặp greedy/hungarian).
         """
-        t_now = time.time()
-        
-        # 1. Tính tâm của các Box mới từ AI
-        input_centroids = []
-        for res in ai_results:
-            cx = res['x'] + res['w'] / 2
-            cy = res['y'] + res['h'] / 2
-            input_centroids.append((cx, cy, res))
+        t_now = self.clock()
 
-        # 2. Nếu chưa có đối tượng nào -> Đăng ký mới hết
+        # [COMPAT] Nhận cả PoseBatch (AIEngine.process_batch) lẫn list dict (AIEngine.process)
+        if hasattr(ai_results, 'to_dicts'):
+            ai_results = ai_results.to_dicts()
+        
+        # 1. Nếu chưa có đối tượng nào -> Đăng ký mới hết
         if not self.objects:
-            for _, _, res in input_centroids:
+            for res in ai_results:
                 self.register(res)
+            self._update_motion_stats()
             return self.get_display_objects()
 
-        # 3. So sánh khoảng cách để update ID
-        # Tạo danh sách ID hiện có và tâm của chúng
+        # 2. Dự đoán box của các object cũ bằng Kalman (Predictive Matching)
+        # Dự đoán vị trí hiện tại dựa trên vận tốc, giúp tránh nhầm lẫn khi 2 người đi qua nhau
         object_ids = list(self.objects.keys())
-        object_centroids = []
-        for oid in object_ids:
-            box = self.objects[oid]['box']
-            vel = self.objects[oid].get('velocity', [0,0,0,0])
-            
-            # [FIX 1] Predictive Matching (Bắt cặp dựa trên Dự đoán)
-            # Dự đoán vị trí hiện tại dựa trên vận tốc, giúp tránh nhầm lẫn khi 2 người đi qua nhau
-            dt_match = t_now - self.objects[oid].get('last_time', t_now)
-            if dt_match > 1.0: dt_match = 0 # Safety check
-            
-            pred_cx = box[0] + box[2]/2 + vel[0] * dt_match
-            pred_cy = box[1] + box[3]/2 + vel[1] * dt_match
-            object_centroids.append((pred_cx, pred_cy))
+        track_boxes = self.kf.predict(object_ids, t_now)
+        pred_centers = box_centers(track_boxes)
 
-        # Đánh dấu đã dùng
-        used_input = [False] * len(input_centroids)
+        # 3. Ghép cặp Track <-> Detection (greedy hoặc hungarian, xem config.TRACKER_ASSOCIATION)
+        det_boxes = np.array([[res['x'], res['y'], res['w'], res['h']] for res in ai_results], dtype=np.float64).reshape(-1, 4)
+        track_kpts = det_kpts = None
+        if self.w_pose > 0:
+            track_kpts = self._kpts_array([self.objects[oid].get('points', []) for oid in object_ids])
+            det_kpts = self._kpts_array([res.get('points', []) for res in ai_results])
+        cost, dist, gate = build_cost_matrix(pred_centers, track_boxes, det_boxes, track_kpts, det_kpts,
+                                             self.w_dist, self.w_iou, self.w_pose)
+        pairs = self.associate(cost, dist, gate)
 
-        # Duyệt qua từng object cũ, tìm input mới gần nhất
-        for i, (old_cx, old_cy) in enumerate(object_centroids):
-            min_dist = 999999
-            best_match_idx = -1
+        # Đánh dấu đã dùng
+        used_input = [False] * len(ai_results)
+        matched_track = [False] * len(object_ids)
+        matched = [] # (oid, res, smooth_box) của các object bắt cặp thành công
 
-            for j, (new_cx, new_cy, _) in enumerate(input_centroids):
-                if used_input[j]: continue
-                
-                dist = math.sqrt((old_cx - new_cx)**2 + (old_cy - new_cy)**2)
-                # [DYNAMIC] Ngưỡng theo kích thước box (tránh nhầm ID khi xa/gần)
-                dynamic_th = self.dist_threshold
-                if i < len(object_ids):
-                    obox = self.objects[object_ids[i]]['box']
-                    dynamic_th = max(60, min(200, 0.6 * max(obox[2], obox[3])))
-                if dist < min_dist and dist < dynamic_th:
-                    min_dist = dist
-                    best_match_idx = j
+        for i, j in pairs:
+            oid = object_ids[i]
+            res = ai_results[j]
             
-            # Nếu tìm thấy cặp đôi hoàn hảo
-            if best_match_idx != -1:
-                oid = object_ids[i]
-                res = input_centroids[best_match_idx][2]
-                
-                raw_box = [res['x'], res['y'], res['w'], res['h']]
-                old_data = self.objects[oid]
-                old_box = old_data['box']
+            matched.append((oid, res, [res['x'], res['y'], res['w'], res['h']]))
+            self.objects[oid]['score'] = res['score']
+            self.objects[oid]['miss'] = 0 # Reset biến đếm mất dấu
+            
+            used_input[j] = True
+            matched_track[i] = True
 
-                # [EMA SMOOTHING] Adaptive Alpha (Làm mượt thích ứng)
-                # Tính khoảng cách di chuyển của tâm Box so với frame trước
-                center_dist = math.sqrt(((raw_box[0]+raw_box[2]/2) - (old_box[0]+old_box[2]/2))**2 + 
-                                      ((raw_box[1]+raw_box[3]/2) - (old_box[1]+old_box[3]/2))**2)
-                
-                # Logic: 
-                # - Đứng yên (dist < 3px): Alpha cực nhỏ (0.05) -> Khóa cứng, chống rung tuyệt đối
-                # - Di chuyển (> 3px): Alpha tăng dần lên 0.4 -> Bám sát chuyển động
-                # - Di chuyển nhanh (> 20px): Alpha = 0.5 -> Phản hồi tức thì
-                alpha = 0.05 if center_dist < 3.0 else min(0.5, 0.05 + (center_dist / 20.0) * 0.45)
-                
-                smooth_box = [r * alpha + o * (1 - alpha) for r, o in zip(raw_box, old_box)]
-                
-                # [UPDATE] Tính vận tốc để dự đoán hướng đi khi bị che khuất
-                dt = t_now - old_data['last_time']
-                if dt > 0:
-                    vx = (smooth_box[0] - old_box[0]) / dt
-                    vy = (smooth_box[1] - old_box[1]) / dt
-                    old_vel = old_data.get('velocity', [0,0,0,0])
-                    # Lọc mạnh (alpha nhỏ) để tránh nhiễu do rung lắc ở xa
-                    v_alpha = 0.2
-                    svx = vx * v_alpha + old_vel[0] * (1 - v_alpha)
-                    svy = vy * v_alpha + old_vel[1] * (1 - v_alpha)
-                    self.objects[oid]['velocity'] = [svx, svy, 0, 0]
-                
-                self.objects[oid]['box'] = smooth_box
+        # Không tìm thấy input mới cho object này -> Tăng biến mất dấu
+        for i, oid in enumerate(object_ids):
+            if not matched_track[i]:
+                self.objects[oid]['miss'] += 1
+
+        # 3b. [KALMAN] Hiệu chỉnh box + vận tốc của tất cả object đã bắt cặp (1 lần gọi)
+        if matched:
+            m_oids = [oid for oid, _, _ in matched]
+            raw_boxes = [raw_box for _, _, raw_box in matched]
+            smooth_boxes = self.kf.update(m_oids, t_now, raw_boxes).tolist()
+            velocities = self.kf.velocities(m_oids).tolist()
+            for k, (oid, res, raw_box) in enumerate(matched):
+                self.objects[oid]['box'] = smooth_boxes[k]
+                self.objects[oid]['velocity'] = velocities[k]
                 self.objects[oid]['prev_raw_box'] = raw_box
                 self.objects[oid]['last_time'] = t_now
-                
-                # [FILTERING] Chỉ lọc điểm (Points) để chống rung
-                raw_points = res.get('points', [])
-                
-                old_points = self.objects[oid].get('points', [])
-                
-                # [ROBUST] Nếu điểm trống/yếu -> giữ điểm cũ vài frame
-                if not raw_points:
-                    filtered_points = self.objects[oid].get('points', [])
-                else:
-                    filtered_points = self.filter.filter_kpts(oid, t_now, raw_points, bbox=smooth_box)
+                matched[k] = (oid, res, smooth_boxes[k])
 
-                self.objects[oid]['points'] = filtered_points
-                
-                # [METRIC ADVANCED] Tính điểm chất lượng dựa trên OKS & MPJPE (Proxy)
-                # So sánh độ lệch giữa Raw và Filtered để đánh giá độ ổn định
-                # [UPDATE] Truyền thêm chiều cao (h) để chuẩn hóa Jitter theo kích thước người
-                pose_score = self._calculate_quality(raw_points, filtered_points, res['score'], smooth_box[3])
-                self.objects[oid]['pose_score'] = pose_score
-                
-                # [GESTURE] Phân tích cử chỉ bằng RAW POINTS (để lấy độ tin cậy gốc)
-                # Filtered points chỉ dùng để vẽ cho mượt, còn logic cần biết AI chắc chắn đến đâu
-                gestures = self.objects[oid]['estimator'].update(raw_points)
-                self.objects[oid]['gestures'] = gestures
-                
-                self.objects[oid]['score'] = res['score']
-                self.objects[oid]['miss'] = 0 # Reset biến đếm mất dấu
-                
-                used_input[best_match_idx] = True
-            else:
-                # Không tìm thấy input mới cho object này -> Tăng biến mất dấu
-                self.objects[object_ids[i]]['miss'] += 1
+        # 3c. Lọc điểm + chấm điểm + phân tích cử chỉ cho các object đã bắt cặp
+        self._update_points(matched, t_now)
 
         # 4. Đăng ký các input mới chưa có chủ
-        for i, used in enumerate(used_input):
+        for j, used in enumerate(used_input):
             if not used:
-                self.register(input_centroids[i][2])
+                self.register(ai_results[j])
 
         # 5. Xóa các object mất dấu quá lâu
         self.clean_up()
+        self._update_motion_stats()
 
         return self.get_display_objects()
 
+    @staticmethod
+    def _kpts_array(points_list):
+        """List các points phẳng -> mảng (N, 17, 3); người không có điểm -> toàn 0 (conf = 0)"""
+        arr = np.zeros((len(points_list), 17, 3), dtype=np.float64)
+        for i, pts in enumerate(points_list):
+            if len(pts) == 17 * 3:
+                arr[i] = np.asarray(pts, dtype=np.float64).reshape(17, 3)
+        return arr
+
+    def _update_points(self, matched, t_now):
+        # [FILTERING] Chỉ lọc điểm (Points) để chống rung - 1 lần gọi cho toàn bộ người
+        # [ROBUST] Nếu điểm trống/yếu -> giữ điểm cũ vài frame
+        to_filter = [(oid, res, box) for oid, res, box in matched if len(res.get('points', [])) == 17 * 3]
+        filtered = {}
+        t0 = time.perf_counter()
+        if to_filter:
+            oids = [oid for oid, _, _ in to_filter]
+            kpts = np.asarray([res['points'] for _, res, _ in to_filter], dtype=np.float64).reshape(len(oids), 17, 3)
+            boxes = np.asarray([box for _, _, box in to_filter], dtype=np.float64)
+            out = self.filter.filter_batch(oids, t_now, kpts, boxes)
+            for oid, pts in zip(oids, out.reshape(len(oids), -1).tolist()):
+                filtered[oid] = pts
+
+        for oid, res, smooth_box in matched:
+            raw_points = res.get('points', [])
+            if oid in filtered:
+                filtered_points = filtered[oid]
+            elif raw_points:
+                # Số điểm lạ (không phải 17 khớp) -> dùng đường lọc từng người
+                filtered_points = self.filter.filter_kpts(oid, t_now, raw_points, bbox=smooth_box)
+            else:
+                filtered_points = self.objects[oid].get('points', [])
+
+            self.objects[oid]['points'] = filtered_points
+            self._update_limb_speed(self.objects[oid], raw_points, t_now, smooth_box[3])
+            
+            # [METRIC ADVANCED] Tính điểm chất lượng dựa trên OKS & MPJPE (Proxy)
+            # So sánh độ lệch giữa Raw và Filtered để đánh giá độ ổn định
+            # [UPDATE] Truyền thêm chiều cao (h) để chuẩn hóa Jitter theo kích thước người
+            pose_score = self._calculate_quality(raw_points, filtered_points, res['score'], smooth_box[3])
+            self.objects[oid]['pose_score'] = pose_score
+        t0 = PROFILER.lap("filter", t0)
+            
+        # [GESTURE] Phân tích cử chỉ bằng RAW POINTS (để lấy độ tin cậy gốc)
+        # Filtered points chỉ dùng để vẽ cho mượt, còn logic cần biết AI chắc chắn đến đâu
+        # [BATCH] Hình học của tất cả người được tính trong 1 lượt vector hoá
+        estimators = [self.objects[oid]['estimator'] for oid, _, _ in matched]
+        gestures = update_batch(estimators, [res.get('points', []) for _, res, _ in matched])
+        for (oid, _, _), g in zip(matched, gestures):
+            self.objects[oid]['gestures'] = g
+        PROFILER.lap("gesture", t0)
+
     def register(self, res):
         # [INIT] Áp dụng Padding và Ratio ngay từ đầu để Box đẹp ngay frame đầu tiên
         raw_h = res['h']
@@ -164,12 +184,13 @@ class ObjectTracker:
         # Với frame đầu tiên, filtered = raw, nên jitter = 0 -> Score cao
         pose_score = self._calculate_quality(raw_points, raw_points, res['score'], res['h'])
         
+        self.kf.init(self.next_id, [raw_x, raw_y, raw_w, raw_h], self.clock())
         self.objects[self.next_id] = {
             'box': [raw_x, raw_y, raw_w, raw_h],
             'score': res['score'],
             'miss': 0,
             'velocity': [0.0, 0.0, 0.0, 0.0], # px/s
-            'last_time': time.time(),
+            'last_time': self.clock(),
             'pose_score': pose_score, # [NEW] Lưu độ tin cậy Pose
             'prev_raw_box': [raw_x, raw_y, raw_w, raw_h],
             'points': res.get('points', []), # [RAW] Lưu điểm thô
@@ -178,6 +199,46 @@ class ObjectTracker:
         }
         self.next_id += 1
 
+    LIMB_JOINTS = (7, 8, 9, 10) # Khuỷu + Cổ tay: vẫy/giơ tay gần như không làm box di chuyển
+
+    def _update_limb_speed(self, data, raw_points, t_now, box_h):
+        """Tốc độ lớn nhất của khuỷu/cổ tay (chiều cao người / giây) giữa 2 lần chạy AI, từ điểm thô"""
+        prev = data.get('limb_prev')
+        cur = None
+        if len(raw_points) == 17 * 3:
+            cur = [(raw_points[j * 3], raw_points[j * 3 + 1], raw_points[j * 3 + 2]) for j in self.LIMB_JOINTS]
+        speed = 0.0
+        if prev is not None and cur is not None:
+            dt = t_now - data.get('limb_time', t_now)
+            if dt > 1e-3:
+                for (x0, y0, c0), (x1, y1, c1) in zip(prev, cur):
+                    if c0 > 0.4 and c1 > 0.4:
+                        speed = max(speed, math.hypot(x1 - x0, y1 - y0) / dt)
+                speed /= max(1.0, box_h)
+        data['limb_speed'] = speed
+        data['limb_prev'] = cur
+        data['limb_time'] = t_now
+
+    def _update_motion_stats(self):
+        """Tốc độ lớn nhất của box và của tay (chiều cao người / giây), Pose Score thấp nhất
+        và có ai đang có cử chỉ cảnh báo (đã chốt / ứng viên) trong số những người đang thấy"""
+        max_speed = 0.0
+        max_limb = 0.0
+        min_score = 1.0
+        active = False
+        count = 0
+        for data in self.objects.values():
+            if data['miss'] != 0: continue
+            vel = data.get('velocity', [0, 0, 0, 0])
+            speed = math.sqrt(vel[0]**2 + vel[1]**2) / max(1.0, data['box'][3])
+            max_speed = max(max_speed, speed)
+            max_limb = max(max_limb, data.get('limb_speed', 0.0))
+            min_score = min(min_score, data.get('pose_score', 0.0))
+            active = active or data['estimator'].alert_pending()
+            count += 1
+        self.motion_stats = {'count': count, 'max_speed': max_speed, 'max_limb_speed': max_limb,
+                             'min_pose_score': min_score, 'gesture_active': active}
+
     def clean_up(self):
         # Xóa ID nếu miss > max_miss_count
         to_delete = []
@@ -186,6 +247,8 @@ class ObjectTracker:
                 to_delete.append(oid)
         for oid in to_delete:
             del self.objects[oid]
+            self.filter.release(oid) # [FIX] Giải phóng slot bộ lọc (trước đây bị giữ mãi)
+            self.kf.release(oid)
 
     def get_display_objects(self):
         # Trả về định dạng để UI vẽ
@@ -203,12 +266,42 @@ class ObjectTracker:
         return results
     
     def predict(self):
-        # [PREDICTION] Dự đoán vị trí trong các frame bị skip
-        # Giúp tăng FPS (bằng cách tăng SKIP_FRAMES) mà hình ảnh vẫn mượt
-        
-        # [TEST] Tắt tính toán dự đoán (Zero Order Hold) để kiểm tra độ ổn định
-        # Box sẽ đứng yên trong các frame bị skip
-        return self.get_display_objects()
+        """
+        [PREDICTION] Dự đoán vị trí trong các frame bị skip (không chạy AI)
+        Box được ngoại suy bằng Kalman, khung xương được dời/co giãn theo box dự đoán.
+        Không ghi đè trạng thái tracker -> frame AI tiếp theo vẫn hiệu chỉnh từ dữ liệu thật.
+        """
+        t_now = self.clock()
+        oids = [oid for oid, data in self.objects.items() if data['miss'] == 0]
+        if not oids: return []
+
+        old_boxes = np.array([self.objects[oid]['box'] for oid in oids], dtype=np.float64).reshape(-1, 4)
+        boxes = self.kf.predict(oids, t_now)
+        if self.transform is not None:
+            self.transform.clamp_boxes(boxes)
+
+        # Dời + co giãn khung xương quanh tâm box (vector hoá cho mọi người có đủ 17 khớp)
+        scale = boxes[:, 2:4] / np.maximum(old_boxes[:, 2:4], 1.0)
+        old_c = box_centers(old_boxes)
+        new_c = box_centers(boxes)
+        has_kpts = [len(self.objects[oid].get('points', [])) == 17 * 3 for oid in oids]
+        kpts = self._kpts_array([self.objects[oid].get('points', []) for oid in oids])
+        kpts[:, :, 0:2] = new_c[:, None, :] + (kpts[:, :, 0:2] - old_c[:, None, :]) * scale[:, None, :]
+
+        results = []
+        boxes = boxes.tolist()
+        kpts = kpts.reshape(len(oids), -1).tolist()
+        for k, oid in enumerate(oids):
+            data = self.objects[oid]
+            results.append({
+                'id': oid,
+                'box': boxes[k],
+                'score': data.get('score', 0.0),
+                'pose_score': data.get('pose_score', 0.0),
+                'points': kpts[k] if has_kpts[k] else data.get('points', []),
+                'gestures': data.get('gestures', [])
+            })
+        return results
 
     def _calculate_quality(self, raw_points, filtered_points, det_score=0.0, bbox_height=1.0):
         """
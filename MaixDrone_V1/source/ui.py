@@ -1,6 +1,7 @@
 from maix import image
 import time
 import config
+from source.gesture import GESTURE_ALERTS # [RULES] Cử chỉ -> Thông báo
 from maix import nn # Import để dùng hàm vẽ tĩnh nếu cần (tùy phiên bản SDK)
 
 class HUD:
@@ -31,9 +32,12 @@ class HUD:
             (11, 13), (13, 15), (12, 14), (14, 16)  # Chân
         ]
         
-        self.last_print_time = time.time()
+        self.clock = time.time # [REPLAY] Nguồn thời gian (replay.py dùng thời điểm đã ghi)
+        self.last_print_time = self.clock()
         # [NEW] Biến để giới hạn tốc độ in log ra terminal (1s/lần)
         self.last_action_msg = None
+        self.last_action_id = -1 # ID người phát ra thông báo hiện tại (-1 = không có)
+        self.last_action_code = None # Mã cảnh báo (VD: "EMERGENCY_STOP")
         self.last_action_time = 0
         
         self.keypoint_names = {
@@ -59,9 +63,11 @@ class HUD:
         do_print = False
         notification_msg = None # Biến lưu nội dung thông báo
         current_max_score = -1.0 # [NEW] Biến lưu điểm tin cậy cao nhất để ưu tiên hiển thị
-        if time.time() - self.last_print_time > 2.0:
+        notification_id = -1
+        notification_code = None
+        if self.clock() - self.last_print_time > 2.0:
             do_print = True
-            self.last_print_time = time.time()
+            self.last_print_time = self.clock()
 
         for obj in results:
             # Lấy thông tin từ Tracker
@@ -89,19 +95,15 @@ class HUD:
                     g_text = " + ".join(gestures)
                     
                     # [NOTIFY] Hiển thị thông báo trạng thái hệ thống
-                    temp_msg = None
-                    if "Trai Cao" in gestures:
-                        temp_msg = "shortage of material"
-                    elif "Phai Cao" in gestures:
-                        temp_msg = "technical or quality issue"
-                    elif "Cheo Tay Tren Dau" in gestures:
-                        temp_msg = "emergency stop"
-                    elif "Vay Tay Phai" in gestures:
-                        temp_msg = "urgent attention"
+                    # [RULES] Bảng cảnh báo dùng chung (config.GESTURE_ALERTS)
+                    alert = GESTURE_ALERTS.for_gestures(gestures)
+                    temp_msg = alert['text'].lower() if alert else None
                     
                     # [LOGIC] Chỉ hiển thị thông báo của người có độ tin cậy Pose cao nhất
                     if temp_msg and pose_score > current_max_score:
                         notification_msg = temp_msg
+                        notification_id = oid
+                        notification_code = alert['code']
                         current_max_score = pose_score
 
                     # [UI] Giảm kích thước chữ 50% (1.5 -> 0.8) cho gọn
@@ -163,6 +165,8 @@ class HUD:
         # (Quan trọng: Phải cập nhật biến này thì PC mới nhận được tin nhắn)
         if notification_msg != self.last_action_msg:
             self.last_action_msg = notification_msg
+            self.last_action_id = notification_id
+            self.last_action_code = notification_code
             # print(f"🔔 ACTION: {notification_msg}") # Uncomment dòng này nếu muốn xem log trên Drone
             
         if do_print:
@@ -0,0 +1,4 @@
+# stubs/maix/__init__.py
+# [STUB] Module "maix" giả cho PC (không có MaixPy): đủ để import source/* và chạy replay.py, benchmarks/.
+# Không có Camera/NPU thật: image.Image chỉ đếm lệnh vẽ, nn.YOLO11 không load được model.
+# Cách dùng: chỉ thêm thư mục stubs/ vào sys.path khi "import maix" thật thất bại (xem replay.py).
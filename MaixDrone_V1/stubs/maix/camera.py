@@ -0,0 +1,10 @@
+# stubs/maix/camera.py
+from maix import image
+
+class Camera:
+    """Camera giả: trả về ảnh trống đúng kích thước"""
+    def __init__(self, width=640, height=480, format=image.Format.FMT_RGB888):
+        self.w, self.h, self.format = width, height, format
+
+    def read(self):
+        return image.Image(self.w, self.h, self.format)
@@ -0,0 +1,4 @@
+# stubs/maix/display.py
+class Display:
+    def show(self, img):
+        pass
@@ -0,0 +1,58 @@
+# stubs/maix/image.py
+class Format:
+    FMT_RGB888 = 0
+    FMT_GRAYSCALE = 1
+
+class Color:
+    def __init__(self, r, g, b, a=255):
+        self.r, self.g, self.b, self.a = r, g, b, a
+
+class Jpeg:
+    def __init__(self, data):
+        self.data = data
+
+    def to_bytes(self):
+        return self.data
+
+class Image:
+    """Ảnh giả: có kích thước, không có điểm ảnh. Các hàm vẽ chỉ đếm số lệnh (draw_calls)"""
+    def __init__(self, width, height, format=Format.FMT_RGB888):
+        self._w = width
+        self._h = height
+        self._format = format
+        self.draw_calls = 0
+
+    def width(self): return self._w
+    def height(self): return self._h
+
+    def format(self):
+        return self._format
+
+    def resize(self, w, h):
+        return Image(w, h, self._format)
+
+    def crop(self, x, y, w, h):
+        return Image(w, h, self._format)
+
+    def to_format(self, format):
+        return Image(self._w, self._h, format)
+
+    def to_bytes(self):
+        # Ảnh đen (mọi điểm ảnh = 0)
+        return bytes(self._w * self._h * (1 if self._format == Format.FMT_GRAYSCALE else 3))
+
+    def to_jpeg(self, quality=95):
+        # JPEG rỗng hợp lệ về độ dài (SOI + EOI), kích thước gần đúng theo số điểm ảnh và quality
+        return Jpeg(b"\xff\xd8" + bytes(self._w * self._h * max(1, quality) // 4000) + b"\xff\xd9")
+
+    def draw_string(self, x, y, text, color=None, scale=1.0, *args, **kwargs): self.draw_calls += 1
+    def draw_rect(self, x, y, w, h, color=None, thickness=1, *args, **kwargs): self.draw_calls += 1
+    def draw_line(self, x1, y1, x2, y2, color=None, thickness=1, *args, **kwargs): self.draw_calls += 1
+    def draw_circle(self, x, y, r, color=None, thickness=1, *args, **kwargs): self.draw_calls += 1
+    def draw_image(self, x, y, img, *args, **kwargs): self.draw_calls += 1
+
+def set_default_font(name):
+    pass
+
+def load_font(name, path, size=16):
+    pass
@@ -0,0 +1,8 @@
+# stubs/maix/nn.py
+class YOLO11:
+    """Không có NPU trên PC -> load thất bại (AIEngine.load() trả về False)"""
+    def __init__(self, model, dual_buff=True):
+        raise RuntimeError("maix stub: không có NPU, dùng replay.py với file ghi phiên")
+
+class YOLOv8(YOLO11):
+    pass
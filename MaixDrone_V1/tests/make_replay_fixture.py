@@ -0,0 +1,74 @@
+# tests/make_replay_fixture.py
+# Sinh lại dữ liệu cho tests/test_replay.py (chỉ chạy khi CỐ Ý đổi hành vi Tracker/Cử chỉ/Cảnh báo):
+#   python tests/make_replay_fixture.py           # Ghi lại golden từ file ghi có sẵn
+#   python tests/make_replay_fixture.py --record  # Sinh lại cả file ghi (luồng Pose giả lập, seed cố định)
+# Xem lại thay đổi của golden (git diff) trước khi commit.
+import argparse
+import json
+import os
+import sys
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TESTS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+try:
+    import maix # noqa: F401
+except ImportError:
+    sys.path.insert(0, os.path.join(ROOT, "stubs")) # PC: module maix giả
+
+import numpy as np
+from replay import Replay
+from synthetic import SyntheticScene
+from source.ai import PoseBatch, LetterboxTransform
+from source.recording import DetectionRecorder, read_records
+
+FIXTURE = os.path.join(TESTS, "fixtures", "replay_session.mdr")
+GOLDEN = os.path.join(TESTS, "fixtures", "replay_session.jsonl")
+
+FRAMES = 120
+FPS = 30.0
+STATIC = range(80, 95) # Motion Gate giữ kết quả cũ
+
+def record(path):
+    """Luồng giả lập 3 người: chủ yếu frame có AI, xen frame Tracker dự đoán và 1 đoạn cảnh đứng yên"""
+    if os.path.exists(path): os.remove(path) # DetectionRecorder ghi nối đuôi
+    scene = SyntheticScene(people=3, motion=3.0, occlusion=0.05, noise=1.5, seed=7)
+    transform = LetterboxTransform(640, 480, 320, 320)
+    recorder = DetectionRecorder(path)
+    for i in range(FRAMES):
+        t = 1000.0 + i / FPS
+        boxes, scores, kpts = scene.step()
+        if i in STATIC:
+            recorder.record_predict(t, i, static=True)
+        elif i % 3 == 2:
+            recorder.record_predict(t, i)
+        else:
+            batch = PoseBatch(boxes, scores, kpts, np.ones(len(boxes), dtype=bool))
+            recorder.record(t, i, batch, transform)
+    recorder.close()
+
+def replay_lines(path):
+    """Kết quả từng frame (JSON, cùng định dạng replay.py --out)"""
+    replay = Replay()
+    lines = []
+    for kind, t, frame_id, data in read_records(path):
+        res = replay.step(kind, t, frame_id, data)
+        if res is not None:
+            lines.append(json.dumps(res, separators=(',', ':')))
+    return lines, replay.events
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh lại file ghi + golden cho test replay")
+    parser.add_argument("--record", action="store_true", help="Sinh lại cả file ghi .mdr")
+    args = parser.parse_args()
+
+    if args.record or not os.path.exists(FIXTURE):
+        record(FIXTURE)
+    lines, events = replay_lines(FIXTURE)
+    with open(GOLDEN, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"💾 {len(lines)} frame, {len(events)} lần đổi cảnh báo -> {os.path.relpath(GOLDEN, ROOT)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+# tests/test_replay.py
+# Kiểm tra hồi quy: chạy lại file ghi mẫu qua Tracker -> Bộ lọc -> Cử chỉ -> Cảnh báo và so với golden.
+#   python -m pytest tests
+# Khi CỐ Ý đổi hành vi: python tests/make_replay_fixture.py rồi xem lại git diff của golden.
+import json
+import os
+import sys
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS)
+
+from make_replay_fixture import FIXTURE, GOLDEN, replay_lines # noqa: E402 (thêm stubs vào sys.path)
+
+def test_replay_matches_golden():
+    lines, _ = replay_lines(FIXTURE)
+    with open(GOLDEN) as f:
+        golden = f.read().splitlines()
+    assert len(lines) == len(golden)
+    for actual, expected in zip(lines, golden):
+        # So từng frame để báo đúng frame đầu tiên bị lệch
+        assert json.loads(actual) == json.loads(expected), f"frame {json.loads(expected)['frame']}"
+
+def test_replay_is_deterministic():
+    first, events = replay_lines(FIXTURE)
+    second, _ = replay_lines(FIXTURE)
+    assert first == second
+    assert events, "file ghi mẫu phải có cảnh báo để kiểm tra đường Cử chỉ -> Cảnh báo"
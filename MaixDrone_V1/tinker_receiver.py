@@ -32,12 +32,14 @@ def main():
                     # In ngay lập tức mọi thứ nhận được ra màn hình
                     
                     # [NEW] Xử lý yêu cầu đồng bộ thời gian từ MaixCam
+                    # (MaixCam gửi không chặn -> SYNC_REQ có thể dính liền với tin nhắn đầu tiên)
                     msg_raw = data.decode('utf-8').strip()
-                    if msg_raw == "SYNC_REQ":
+                    if msg_raw.startswith("SYNC_REQ"):
                         now_ts = datetime.datetime.now().timestamp()
                         conn.sendall(f"SYNC_TIME:{now_ts}".encode('utf-8'))
                         print(f"Đã gửi thời gian đồng bộ cho MaixCam: {now_ts}")
-                        continue
+                        data = data[len(b"SYNC_REQ"):]
+                        if not data.strip(): continue
 
                     # [UPDATE] Thêm thời gian nhận thực tế tại TinkerBoard
                     recv_time = datetime.datetime.now().strftime("%H:%M:%S.%f")[:-3]